@@ -0,0 +1,269 @@
+# arquivos_remotos.py
+#
+# Registro dos arquivos enviados à File API do Gemini, por hash do conteúdo.
+#
+# Reextrair o mesmo scan com outro prompt/modelo, ou repetir depois de um erro
+# de cota, reaproveita o arquivo remoto ainda válido em vez de subir os mesmos
+# bytes de novo (o upload é boa parte da latência do OCR de scans grandes).
+#
+# - O registro fica no cache compartilhado: um worker reaproveita o upload de outro.
+# - Os arquivos expiram no Gemini (~48 h); o registro guarda a expiração e só
+#   devolve handles com folga suficiente para a chamada.
+# - As leituras/gravações no cache compartilhado dos caminhos assíncronos rodam
+#   no executor "interativo" (executores.py), fora do event loop.
+# - Uma tarefa em segundo plano reconfirma os handles em uso, reenvia os que
+#   estão perto de expirar (quando este worker ainda tem os bytes) e apaga do
+#   Gemini os que ninguém usa há algum tempo.
+
+import asyncio
+import hashlib
+import io
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from google import genai
+from google.genai import types
+from pydantic import BaseModel
+
+from cache import obter_cache
+from executores import executar_em, executar_na_vaga_ou_em
+
+FOLGA_EXPIRACAO = 2 * 3600        # handle com menos que isso de vida não é reaproveitado
+JANELA_RENOVACAO = 6 * 3600       # arquivos em uso são reenviados nesta janela antes de expirar
+TEMPO_OCIOSO = 3600               # sem uso por esse tempo, o arquivo remoto é apagado
+VALIDADE_PADRAO = 47 * 3600       # quando a API não informa expiration_time
+INTERVALO_MANUTENCAO = 300
+MAX_BYTES_RENOVACAO = 64 * 1024 * 1024  # bytes guardados por worker para reenviar arquivos em uso
+
+
+class ArquivoRemoto(BaseModel):
+    hash: str
+    name: str
+    uri: str
+    mime_type: str
+    display_name: Optional[str] = None
+    expira_em: float
+    ultimo_uso: float
+
+    def handle(self) -> types.File:
+        return types.File(name=self.name, uri=self.uri, mime_type=self.mime_type, display_name=self.display_name)
+
+
+class MetricasArquivos:
+    def __init__(self):
+        self.reaproveitados = 0
+        self.enviados = 0
+        self.renovados = 0
+        self.removidos = 0
+        self.invalidados = 0
+        self.bytes_poupados = 0
+
+    def snapshot(self) -> dict:
+        consultas = self.reaproveitados + self.enviados
+        return {
+            "reaproveitados": self.reaproveitados,
+            "enviados": self.enviados,
+            "taxa_reaproveitamento": round(self.reaproveitados / consultas, 4) if consultas else None,
+            "bytes_poupados": self.bytes_poupados,
+            "renovados": self.renovados,
+            "removidos": self.removidos,
+            "invalidados": self.invalidados,
+        }
+
+
+def hash_conteudo(dados: bytes, mime_type: str) -> str:
+    return hashlib.sha256(mime_type.encode("utf-8") + b"\0" + dados).hexdigest()
+
+
+def _expiracao(arquivo: types.File) -> float:
+    expira = arquivo.expiration_time
+    if isinstance(expira, datetime):
+        return expira.timestamp()
+    return time.time() + VALIDADE_PADRAO
+
+
+class RegistroArquivos:
+    def __init__(self):
+        self.metricas = MetricasArquivos()
+        # Hashes que este processo enviou: é sobre eles que a manutenção age
+        self._locais: Dict[str, float] = {}
+        # Bytes dos uploads mais recentes (LRU limitada), para a renovação
+        self._conteudos: "OrderedDict[str, Tuple[bytes, str, str]]" = OrderedDict()
+        self._bytes_guardados = 0
+
+    # ---------- registro ----------
+
+    def _chave(self, hash_: str) -> str:
+        return f"arquivo_gemini:{hash_}"
+
+    def _ler(self, hash_: str) -> Optional[ArquivoRemoto]:
+        dados = obter_cache().get_json(self._chave(hash_))
+        return ArquivoRemoto.model_validate(dados) if dados else None
+
+    def _gravar(self, registro: ArquivoRemoto):
+        ttl = max(1.0, registro.expira_em - time.time())
+        obter_cache().set_json(self._chave(registro.hash), registro.model_dump(), ttl=ttl)
+
+    def _registrar_envio(self, hash_: str, arquivo: types.File) -> ArquivoRemoto:
+        registro = ArquivoRemoto(
+            hash=hash_,
+            name=arquivo.name,
+            uri=arquivo.uri,
+            mime_type=arquivo.mime_type,
+            display_name=arquivo.display_name,
+            expira_em=_expiracao(arquivo),
+            ultimo_uso=time.time(),
+        )
+        self._gravar(registro)
+        self._locais[hash_] = registro.expira_em
+        return registro
+
+    def _guardar_conteudo(self, hash_: str, dados: bytes, mime_type: str, display_name: str):
+        if len(dados) > MAX_BYTES_RENOVACAO or hash_ in self._conteudos:
+            return
+        self._conteudos[hash_] = (dados, mime_type, display_name)
+        self._bytes_guardados += len(dados)
+        while self._bytes_guardados > MAX_BYTES_RENOVACAO:
+            _, (antigo, _, _) = self._conteudos.popitem(last=False)
+            self._bytes_guardados -= len(antigo)
+
+    def _descartar_conteudo(self, hash_: str):
+        if item := self._conteudos.pop(hash_, None):
+            self._bytes_guardados -= len(item[0])
+
+    def consultar(self, hash_: str, tamanho: int = 0) -> Optional[types.File]:
+        """Handle ainda válido para este conteúdo, ou None."""
+        registro = self._ler(hash_)
+        if registro is None or registro.expira_em - time.time() < FOLGA_EXPIRACAO:
+            return None
+        registro.ultimo_uso = time.time()
+        self._gravar(registro)
+        self.metricas.reaproveitados += 1
+        self.metricas.bytes_poupados += tamanho
+        print(f"♻️ [ARQUIVOS] Reaproveitando {registro.name} (expira em {(registro.expira_em - time.time()) / 3600:.1f} h)")
+        return registro.handle()
+
+    def invalidar(self, hash_: str):
+        """O Gemini não reconhece mais o arquivo (apagado/expirado antes do previsto)."""
+        obter_cache().delete(self._chave(hash_))
+        self._locais.pop(hash_, None)
+        self._descartar_conteudo(hash_)
+        self.metricas.invalidados += 1
+
+    # ---------- obter ou enviar ----------
+
+    async def obter_async(self, client, dados: bytes, mime_type: str, display_name: str, config: Optional[dict] = None):
+        """Retorna (handle, hash); só faz upload se não houver um handle reaproveitável."""
+        hash_ = hash_conteudo(dados, mime_type)
+        handle = await executar_na_vaga_ou_em("interativo", self.consultar, hash_, len(dados))
+        if handle is not None:
+            return handle, hash_
+        arquivo = await client.aio.files.upload(
+            file=io.BytesIO(dados),
+            config={**(config or {}), "display_name": display_name, "mime_type": mime_type},
+        )
+        self.metricas.enviados += 1
+        self._guardar_conteudo(hash_, dados, mime_type, display_name)
+        registro = await executar_na_vaga_ou_em("interativo", self._registrar_envio, hash_, arquivo)
+        return registro.handle(), hash_
+
+    # ---------- manutenção ----------
+
+    async def _remover(self, client, nome: str):
+        try:
+            await client.aio.files.delete(name=nome)
+            self.metricas.removidos += 1
+            print(f"🧹 [ARQUIVOS] {nome} removido do Gemini")
+        except Exception as e:
+            print(f"⚠️ [ARQUIVOS] Falha ao remover {nome}: {e}")
+
+    async def _renovar(self, client, registro: ArquivoRemoto):
+        """
+        A File API não estende a validade de um arquivo. Com os bytes ainda em
+        memória, o arquivo é reenviado e o handle trocado (o antigo é apagado);
+        sem eles, só reconfirmamos que o handle existe até ele expirar.
+        """
+        conteudo = self._conteudos.get(registro.hash)
+        if conteudo is not None:
+            dados, mime_type, display_name = conteudo
+            arquivo = await client.aio.files.upload(
+                file=io.BytesIO(dados), config={"display_name": display_name, "mime_type": mime_type}
+            )
+            novo = await executar_em("interativo", self._registrar_envio, registro.hash, arquivo)
+            novo.ultimo_uso = registro.ultimo_uso
+            await executar_em("interativo", self._gravar, novo)
+            self.metricas.renovados += 1
+            await self._remover(client, registro.name)
+            return
+        try:
+            arquivo = await client.aio.files.get(name=registro.name)
+        except Exception as e:
+            if not arquivo_ausente(e):
+                raise
+            await executar_em("interativo", self.invalidar, registro.hash)
+            return
+        if arquivo.state == types.FileState.FAILED:
+            await executar_em("interativo", self.invalidar, registro.hash)
+            return
+        registro.expira_em = _expiracao(arquivo)
+        await executar_em("interativo", self._gravar, registro)
+
+    async def manter(self, client):
+        """Uma passada: confirma os handles em uso e apaga os ociosos."""
+        agora = time.time()
+        for hash_ in list(self._locais):
+            # A falha de um handle (upload recusado, cache fora do ar) não interrompe os demais
+            try:
+                await self._manter_um(client, hash_, agora)
+            except Exception as e:
+                print(f"⚠️ [ARQUIVOS] Falha na manutenção de {hash_[:12]}: {e}")
+
+    async def _manter_um(self, client, hash_: str, agora: float):
+        registro = await executar_em("interativo", self._ler, hash_)
+        if registro is None:
+            # Expirou no cache junto com o arquivo remoto
+            self._locais.pop(hash_, None)
+            return
+        if agora - registro.ultimo_uso > TEMPO_OCIOSO:
+            await executar_em("interativo", obter_cache().delete, self._chave(hash_))
+            self._locais.pop(hash_, None)
+            self._descartar_conteudo(hash_)
+            await self._remover(client, registro.name)
+        elif registro.expira_em - agora < JANELA_RENOVACAO:
+            await self._renovar(client, registro)
+
+    async def manutencao_periodica(self):
+        api_key = os.getenv("AI_API_KEY")
+        if not api_key:
+            return
+        client = genai.Client(api_key=api_key)
+        while True:
+            await asyncio.sleep(INTERVALO_MANUTENCAO)
+            try:
+                await self.manter(client)
+            except Exception as e:
+                print(f"⚠️ [ARQUIVOS] Falha na manutenção: {e}")
+
+    def snapshot(self) -> dict:
+        return {**self.metricas.snapshot(), "arquivos_deste_worker": len(self._locais)}
+
+
+def arquivo_ausente(erro: Exception) -> bool:
+    """
+    Erro do Gemini ao usar um file_uri que não existe mais: 404, ou o 403 que a
+    File API devolve para arquivos apagados/de outro projeto. Cota (429), chave
+    inválida e erros de servidor não contam: reenviar não resolveria.
+    """
+    codigo = getattr(erro, "code", None) or getattr(erro, "status_code", None)
+    if codigo == 404:
+        return True
+    if codigo == 403:
+        mensagem = (getattr(erro, "message", None) or str(erro)).lower()
+        return "file" in mensagem and "api key" not in mensagem
+    return False
+
+
+registro_arquivos = RegistroArquivos()
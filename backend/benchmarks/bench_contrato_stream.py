@@ -0,0 +1,96 @@
+"""
+Benchmark de memória da geração de contratos sob concorrência:
+resposta em bytes (BytesIO + getvalue + Response) x iterar_docx em streaming.
+
+Não chama o Gemini: o corpo do contrato é sintético e montado sobre o template real.
+
+Uso (a partir de backend/):
+    python benchmarks/bench_contrato_stream.py [--concorrencia 8] [--clausulas 3000]
+
+O tracemalloc mede só alocações Python (buffers e cópias dos bytes); a árvore
+lxml do documento é igual nos dois modos e fica de fora.
+"""
+
+import argparse
+import io
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+warnings.filterwarnings("ignore", category=FutureWarning)
+
+from gerar_contrato import TEMPLATES_DIR, TEMPLATE_MAP, iterar_docx, montar_documento_final  # noqa: E402
+
+
+def corpo_sintetico(n_clausulas: int) -> str:
+    linhas = []
+    for i in range(n_clausulas):
+        linhas.append(f"CLÁUSULA {i} – DAS CONDIÇÕES")
+        linhas.append(f"{i + 1}ª parcela")
+        linhas.append(f"Valor: R$ 1.850,00 - Data do Pagamento: 10/{(i % 12) + 1:02d}/{2025 + i // 12}")
+        linhas.append("Forma de pagamento: TED/PIX - Banco Itau - Agência 4459 - Conta Corrente 84234-2")
+        linhas.append("")
+    return "\n".join(linhas)
+
+
+def consumir_bytes(modelo, atraso: float):
+    buf = io.BytesIO()
+    modelo.save(buf)
+    dados = buf.getvalue()
+    # Response(content=...) guarda mais uma referência/cópia até o envio terminar
+    enviado = 0
+    for i in range(0, len(dados), 64 * 1024):
+        enviado += len(dados[i:i + 64 * 1024])
+        time.sleep(atraso)
+    return enviado
+
+
+def consumir_stream(modelo, atraso: float):
+    enviado = 0
+    for bloco in iterar_docx(modelo):
+        enviado += len(bloco)
+        time.sleep(atraso)
+    return enviado
+
+
+def rodar(modo, template_path, corpo, concorrencia: int, atraso: float):
+    modelos = [montar_documento_final(template_path, corpo, "JOÃO DA SILVA\nCPF 000.000.000-00") for _ in range(concorrencia)]
+    consumidor = consumir_bytes if modo == "bytes" else consumir_stream
+
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=consumidor, args=(m, atraso)) for m in modelos]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    duracao = time.perf_counter() - t0
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return duracao, pico
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concorrencia", type=int, default=8)
+    parser.add_argument("--clausulas", type=int, default=3000)
+    parser.add_argument("--atraso", type=float, default=0.005, help="pausa por bloco enviado (cliente lento)")
+    args = parser.parse_args()
+
+    template_path = TEMPLATES_DIR / TEMPLATE_MAP["compra-venda"]
+    corpo = corpo_sintetico(args.clausulas)
+
+    for modo in ("bytes", "stream"):
+        duracao, pico = rodar(modo, template_path, corpo, args.concorrencia, args.atraso)
+        print(
+            f"⏱️ {modo:<6} concorrência={args.concorrencia} tempo={duracao:6.2f}s "
+            f"pico={pico / 1024 / 1024:7.2f} MB ({pico / args.concorrencia / 1024:8.0f} KB por geração)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Tamanho do draft no prompt e na API com o cronograma parcela a parcela x em
+séries (cronograma.py), para financiamentos de prazos diferentes.
+
+Não chama o Gemini: os tokens são a estimativa de prompts.estimar_tokens.
+
+Uso (a partir de backend/):
+    python benchmarks/bench_cronograma.py [--meses 360]
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cronograma import _somar_meses, compactar_payload, expandir_payload, json_compacto  # noqa: E402
+from prompts import estimar_tokens  # noqa: E402
+
+
+def draft_financiamento(meses: int) -> dict:
+    """Entrada + parcelas mensais (com reajuste a cada 10 anos) + chaves anuais."""
+    total = meses + 1 + meses // 12
+    parcelas = [{"tipo": "Entrada", "indice": f"1/{total}", "vencimento": "15/01/2025", "valor": 80000.0, "status": "Pago"}]
+    inicio = date(2025, 1, 31)
+    for i in range(meses):
+        parcelas.append({
+            "tipo": "Mensal",
+            "indice": f"{len(parcelas) + 1}/{total}",
+            "vencimento": _somar_meses(inicio, i).strftime("%d/%m/%Y"),
+            "valor": 2150.0 + 150.0 * (i // 120),
+            "status": None,
+        })
+    for i in range(meses // 12):
+        parcelas.append({
+            "tipo": "Anual",
+            "indice": f"{len(parcelas) + 1}/{total}",
+            "vencimento": _somar_meses(date(2025, 12, 20), 12 * i).strftime("%d/%m/%Y"),
+            "valor": 12000.0,
+            "status": None,
+        })
+    return {
+        "partes": [{"nome": "MARIA DA SILVA", "cpf": "000.000.000-00", "papel": "Comprador"}],
+        "imovel": {"endereco_completo": "Rua Exemplo, 100 - Goiânia/GO"},
+        "cronograma_financeiro": parcelas,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--meses", type=int, nargs="+", default=[60, 120, 360])
+    args = parser.parse_args()
+
+    for meses in args.meses:
+        draft = draft_financiamento(meses)
+        assert expandir_payload(compactar_payload(draft)) == draft, "expansão não reproduz o cronograma"
+
+        api_lista = json.dumps(draft, ensure_ascii=False)
+        api_series = json.dumps(compactar_payload(draft), ensure_ascii=False)
+        # Antes: json.dumps com indent no prompt; agora: json_compacto
+        prompt_lista = json.dumps(draft, ensure_ascii=False, indent=2)
+        prompt_series = json_compacto(draft)
+        print(
+            f"📦 {meses:>3} meses ({len(draft['cronograma_financeiro'])} parcelas, "
+            f"{len(compactar_payload(draft)['cronograma_compacto'])} séries): "
+            f"API {len(api_lista):>7} -> {len(api_series):>5} bytes ({len(api_lista) / len(api_series):4.1f}x)  "
+            f"prompt ~{estimar_tokens(prompt_lista):>6} -> ~{estimar_tokens(prompt_series):>4} tokens "
+            f"({estimar_tokens(prompt_lista) / estimar_tokens(prompt_series):4.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Latência das chamadas interativas (chat/detect-edit) durante uma rajada de OCR:
+executor padrão compartilhado (asyncio.to_thread) x executores por classe.
+
+Não chama o Gemini: o OCR e as chamadas interativas são simulados com sleeps
+bloqueantes (o que ocupa uma thread, como a chamada síncrona ao SDK).
+
+Uso (a partir de backend/):
+    python benchmarks/bench_executores.py [--ocr 60] [--interativas 40]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from errors import ServiceOverloadedError  # noqa: E402
+from executores import executar_em, metricas_executores  # noqa: E402
+from roteador import percentil  # noqa: E402
+
+
+def ocr_falso(duracao: float):
+    time.sleep(duracao)
+
+
+def interativa_falsa(duracao: float):
+    time.sleep(duracao)
+
+
+async def rodar(modo: str, n_ocr: int, n_interativas: int, dur_ocr: float, dur_interativa: float):
+    latencias, recusadas = [], 0
+
+    async def ocr():
+        nonlocal recusadas
+        try:
+            if modo == "compartilhado":
+                await asyncio.to_thread(ocr_falso, dur_ocr)
+            else:
+                await executar_em("ocr", ocr_falso, dur_ocr)
+        except ServiceOverloadedError:
+            recusadas += 1
+
+    async def interativa(atraso: float):
+        await asyncio.sleep(atraso)
+        t0 = time.perf_counter()
+        if modo == "compartilhado":
+            await asyncio.to_thread(interativa_falsa, dur_interativa)
+        else:
+            await executar_em("interativo", interativa_falsa, dur_interativa)
+        latencias.append(time.perf_counter() - t0)
+
+    # A rajada de OCR chega primeiro; as interativas vão chegando durante ela
+    await asyncio.gather(
+        *(ocr() for _ in range(n_ocr)),
+        *(interativa(0.01 + i * dur_ocr / n_interativas) for i in range(n_interativas)),
+    )
+    return latencias, recusadas
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ocr", type=int, default=60)
+    parser.add_argument("--interativas", type=int, default=40)
+    parser.add_argument("--dur-ocr", type=float, default=1.0)
+    parser.add_argument("--dur-interativa", type=float, default=0.05)
+    args = parser.parse_args()
+
+    for modo in ("compartilhado", "por-classe"):
+        loop = asyncio.new_event_loop()
+        # Executor padrão do asyncio: min(32, cpus + 4) threads
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) + 4)))
+        latencias, recusadas = loop.run_until_complete(
+            rodar(modo, args.ocr, args.interativas, args.dur_ocr, args.dur_interativa)
+        )
+        loop.close()
+        print(
+            f"⏱️ {modo:<13} interativas p50={percentil(latencias, 50) * 1000:7.1f} ms "
+            f"p99={percentil(latencias, 99) * 1000:7.1f} ms  OCR recusados (503)={recusadas}"
+        )
+    print(f"   métricas: { {k: v for k, v in metricas_executores().items() if k in ('ocr', 'interativo')} }")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark de latência de cauda com e sem hedge, contra um servidor falso.
+
+Não chama o Gemini: cada "requisição" dorme uma latência sorteada de uma
+distribuição de cauda longa (a maioria rápida, alguns por cento presos por
+vários segundos), como as chamadas curtas de detect-edit/chat observadas.
+As duas rodadas usam a mesma semente, então recebem a mesma sequência de
+latências para a primeira tentativa.
+
+Uso (a partir de backend/):
+    python benchmarks/bench_hedge.py [--chamadas 400] [--concorrencia 16]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import roteador as R  # noqa: E402
+
+
+def latencia_cauda_longa(rng: random.Random, escala: float) -> float:
+    sorteio = rng.random()
+    if sorteio < 0.94:
+        return rng.uniform(0.8, 1.2) * escala
+    if sorteio < 0.98:
+        return rng.uniform(2, 4) * escala
+    return rng.uniform(10, 20) * escala
+
+
+async def rodar(hedge: bool, chamadas: int, concorrencia: int, escala: float, semente: int):
+    rng = random.Random(semente)
+    roteador = R.Roteador()
+    R.SLO_SEGUNDOS["bench"] = 30 * escala
+    requisicoes = 0
+
+    async def servidor_falso(modelo: str):
+        nonlocal requisicoes
+        requisicoes += 1
+        await asyncio.sleep(latencia_cauda_longa(rng, escala))
+        return modelo
+
+    # Aquecimento: o hedge só liga com amostras suficientes para o p90
+    aquecimento = random.Random(semente + 1)
+    for _ in range(R.MIN_AMOSTRAS * 5):
+        roteador.observar("bench", R.MODELO_RAPIDO, latencia_cauda_longa(aquecimento, escala))
+
+    decisao = R.Decisao(endpoint="bench", modelo=R.MODELO_RAPIDO, motivo="benchmark")
+    latencias = []
+    limite = asyncio.Semaphore(concorrencia)
+
+    async def uma():
+        async with limite:
+            t0 = time.perf_counter()
+            await roteador.executar_async(decisao, servidor_falso, hedge=hedge)
+            latencias.append(time.perf_counter() - t0)
+
+    await asyncio.gather(*(uma() for _ in range(chamadas)))
+    return latencias, requisicoes, roteador.metricas_hedge().get("bench", {})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chamadas", type=int, default=400)
+    parser.add_argument("--concorrencia", type=int, default=16)
+    parser.add_argument("--escala", type=float, default=0.02, help="latência típica (s) de uma chamada")
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args()
+
+    for hedge in (False, True):
+        latencias, requisicoes, metricas = asyncio.run(
+            rodar(hedge, args.chamadas, args.concorrencia, args.escala, args.semente)
+        )
+        print(
+            f"⏱️ hedge={'sim' if hedge else 'não':<3} p50={R.percentil(latencias, 50) * 1000:7.1f} ms "
+            f"p90={R.percentil(latencias, 90) * 1000:7.1f} ms p99={R.percentil(latencias, 99) * 1000:7.1f} ms "
+            f"requisições={requisicoes} ({requisicoes / args.chamadas - 1:+.1%})"
+        )
+        if hedge:
+            print(f"   métricas: {metricas}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark do ler_docx: leitor em streaming x implementação anterior (python-docx).
+
+Uso (a partir de backend/):
+    python benchmarks/bench_ler_docx.py [--parcelas 3000] [--paragrafos 2000]
+
+O pico de memória vem do tracemalloc, que não enxerga as alocações internas do
+lxml usadas pelo python-docx; o número dele é, portanto, um limite inferior.
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+import tracemalloc
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docx import Document  # noqa: E402
+from ocr import ler_docx  # noqa: E402
+
+
+def ler_docx_python_docx(file_obj):
+    # Implementação anterior, mantida aqui apenas para comparação
+    doc = Document(file_obj)
+    texto = []
+    for para in doc.paragraphs:
+        if para.text.strip(): texto.append(para.text)
+    for table in doc.tables:
+        for row in table.rows:
+            linha = " | ".join(cell.text.strip() for cell in row.cells if cell.text.strip())
+            if linha: texto.append(f"[Tabela]: {linha}")
+    return "\n".join(texto)
+
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="word/document.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+    '</Relationships>'
+)
+
+
+def _celula(texto: str, props: str = "") -> str:
+    return f"<w:tc><w:tcPr>{props}</w:tcPr><w:p><w:r><w:t>{texto}</w:t></w:r></w:p></w:tc>"
+
+
+def gerar_docx_sintetico(n_paragrafos: int, n_parcelas: int) -> bytes:
+    # Monta o XML direto: o python-docx é lento demais para gerar tabelas grandes
+    corpo = []
+    for i in range(n_paragrafos):
+        corpo.append(
+            f"<w:p><w:r><w:t>CLÁUSULA {i} – O(s) COMPRADOR(ES) declara(m) estar cientes "
+            "das condições do imóvel.</w:t></w:r></w:p>"
+        )
+        if i == n_paragrafos // 2:
+            linhas = ["<w:tr>" + "".join(_celula(t) for t in ["Tipo", "Parcela", "Vencimento", "Valor", "Status"]) + "</w:tr>"]
+            for j in range(1, n_parcelas + 1):
+                # Mescla vertical na coluna "Tipo" e horizontal em "Valor"+"Status" a cada 12 linhas
+                tipo = _celula("P", '<w:vMerge w:val="restart"/>') if j % 12 == 1 else _celula("", "<w:vMerge/>")
+                valor = (
+                    _celula("1.850,00 (quitada)", '<w:gridSpan w:val="2"/>')
+                    if j % 12 == 0
+                    else _celula("1.850,00") + _celula("Aberto")
+                )
+                linhas.append(
+                    f"<w:tr>{tipo}{_celula(f'{j}/{n_parcelas}')}"
+                    f"{_celula(f'10/{(j % 12) + 1:02d}/{2025 + j // 12}')}{valor}</w:tr>"
+                )
+            corpo.append("<w:tbl>" + "".join(linhas) + "</w:tbl>")
+    documento = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f"<w:body>{''.join(corpo)}</w:body></w:document>"
+    )
+
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as pacote:
+        pacote.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        pacote.writestr("_rels/.rels", _RELS)
+        pacote.writestr("word/document.xml", documento)
+    return buf.getvalue()
+
+
+def medir(funcao, dados: bytes, repeticoes: int):
+    tempos = []
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        funcao(io.BytesIO(dados))
+        tempos.append(time.perf_counter() - t0)
+
+    tracemalloc.start()
+    funcao(io.BytesIO(dados))
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(tempos), pico
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--paragrafos", type=int, default=2000)
+    parser.add_argument("--parcelas", type=int, default=3000)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    args = parser.parse_args()
+
+    dados = gerar_docx_sintetico(args.paragrafos, args.parcelas)
+    print(f"📄 docx sintético: {len(dados) / 1024:.0f} KB, {args.paragrafos} parágrafos, {args.parcelas} linhas de tabela")
+
+    for nome, funcao in [("python-docx", ler_docx_python_docx), ("streaming", ler_docx)]:
+        tempo, pico = medir(funcao, dados, args.repeticoes)
+        print(f"⏱️ {nome:<12} tempo={tempo * 1000:8.1f} ms   pico de memória={pico / 1024 / 1024:7.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Tempo de serialização e bytes na rede das respostas grandes: caminho padrão do
+FastAPI (jsonable_encoder + json.dumps) x serializacao.json_bytes, e o corpo
+sem compressão, com gzip e com br. Também compara o JSON dos prompts com
+indent=2 e o json_compacto.
+
+Cenários: sessão com 20 documentos extraídos (lista de DocumentoUnificado,
+como o /api/ocr devolve) e draft com cronograma de 360 parcelas.
+
+Uso (a partir de backend/):
+    python benchmarks/bench_serializacao.py [--repeticoes 50]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+from cronograma import json_compacto  # noqa: E402
+from schemas import ContractDraft, DocumentoUnificado, Imovel, Parcela, Parte  # noqa: E402
+import serializacao  # noqa: E402
+
+TIPOS = ["RG", "CNH", "Certidão de Casamento", "Comprovante de Endereço", "Matrícula de Imóvel"]
+
+
+def parte(i: int) -> Parte:
+    return Parte(
+        nome=f"MARIA APARECIDA DOS SANTOS {i}",
+        cpf_cnpj=f"{i:03d}.456.789-0{i % 10}",
+        rg=f"{1000000 + i}",
+        papel="Comprador" if i % 2 else "Vendedor",
+        data_nascimento="12/03/1980",
+        filiacao=["JOSÉ DOS SANTOS", "ANA APARECIDA DOS SANTOS"],
+        estado_civil="Casada",
+        profissao="Professora",
+        endereco="Rua das Acácias, 123, Apto 45, Setor Bueno, Goiânia/GO, CEP 74000-000",
+    )
+
+
+def cronograma(meses: int):
+    return [
+        Parcela(tipo="P", indice=f"{i + 1}/{meses}", vencimento=f"10/{i % 12 + 1:02d}/{2025 + i // 12}", valor=2150.0)
+        for i in range(meses)
+    ]
+
+
+def sessao_20_documentos() -> dict:
+    imovel = Imovel(endereco_completo="Rua das Acácias, 123", matricula="45.678", cidade="Goiânia", imobiliaria="Imob X")
+    documentos = {}
+    for i in range(20):
+        documentos[f"doc_{i:02d}.pdf"] = [
+            DocumentoUnificado(
+                tipo_documento="Contrato de Compra e Venda" if i == 0 else TIPOS[i % len(TIPOS)],
+                numero_documento=str(i),
+                partes=[parte(i), parte(i + 1)],
+                imovel=imovel if i % 5 == 4 else None,
+                cronograma_financeiro=cronograma(120) if i == 0 else [],
+                resumo_conteudo="Documento extraído por OCR com os dados pessoais e de endereço das partes. " * 3,
+            )
+        ]
+    return documentos
+
+
+def draft_360() -> dict:
+    return ContractDraft(
+        partes=[parte(i) for i in range(4)],
+        valor_monetario=774000.0,
+        forma_pagamento="Financiamento em 360 parcelas mensais",
+        cronograma_financeiro=cronograma(360),
+    ).model_dump()
+
+
+def medir(func, repeticoes: int) -> float:
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        func()
+    return (time.perf_counter() - inicio) / repeticoes * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeticoes", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"   orjson: {'sim' if serializacao.orjson else 'não'}  brotli: {'sim' if serializacao.brotli else 'não'}")
+    for nome, dados in (("sessão 20 docs", sessao_20_documentos()), ("draft 360 parcelas", draft_360())):
+        def padrao():
+            return json.dumps(jsonable_encoder(dados), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+        def rapido():
+            return serializacao.json_bytes(dados)
+
+        corpo = rapido()
+        gzip = zlib.compress(corpo, serializacao.NIVEL_GZIP, 16 + zlib.MAX_WBITS)
+        rede = f"identity={len(corpo):>7}  gzip={len(gzip):>6}"
+        if serializacao.brotli:
+            rede += f"  br={len(serializacao.brotli.compress(corpo, quality=serializacao.QUALIDADE_BROTLI)):>6}"
+        print(
+            f"📦 {nome:<19} encode padrão={medir(padrao, args.repeticoes):6.2f} ms  "
+            f"json_bytes={medir(rapido, args.repeticoes):6.2f} ms  bytes: {rede}"
+        )
+        prompt_antes = json.dumps(jsonable_encoder(dados), ensure_ascii=False, indent=2)
+        print(f"   prompt: indent=2 {len(prompt_antes):>7} chars -> json_compacto {len(json_compacto(dados)):>6} chars")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,547 @@
+# cache.py
+#
+# Cache/armazenamento compartilhado do backend. Tudo que guardamos entre
+# requisições (resultados de OCR, drafts consolidados, contratos gerados,
+# contextos de prompt) passa por aqui, para que com vários workers do uvicorn
+# o estado não fique preso a um processo.
+#
+# Backends (CACHE_BACKEND no .env):
+#   memory  -> LRU no próprio processo (padrão; bom para um worker só)
+#   sqlite  -> arquivo SQLite em modo WAL, compartilhado entre workers do mesmo host
+#   redis   -> servidor de rede que fale o protocolo do Redis (CACHE_URL=redis://host:porta/db)
+
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+
+from serializacao import json_bytes, ler_json, para_json
+
+
+# =========================
+# MÉTRICAS
+# =========================
+
+class MetricasCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.escritas = 0
+        self.erros = 0
+        self.conflitos = 0
+        self._latencias = {op: [0, 0.0, 0.0] for op in ("get", "set", "delete", "trocar_se", "incrementar")}
+
+    def registrar(self, operacao: str, duracao: float, hit: Optional[bool] = None):
+        with self._lock:
+            contagem = self._latencias[operacao]
+            contagem[0] += 1
+            contagem[1] += duracao
+            contagem[2] = max(contagem[2], duracao)
+            if hit is True:
+                self.hits += 1
+            elif hit is False:
+                self.misses += 1
+            if operacao in ("set", "trocar_se", "incrementar"):
+                self.escritas += 1
+
+    def registrar_erro(self):
+        with self._lock:
+            self.erros += 1
+
+    def registrar_conflito(self):
+        with self._lock:
+            self.conflitos += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            consultas = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / consultas, 4) if consultas else None,
+                "escritas": self.escritas,
+                "erros": self.erros,
+                "conflitos": self.conflitos,
+                "latencia_ms": {
+                    op: {
+                        "chamadas": n,
+                        "media": round(total / n * 1000, 3) if n else None,
+                        "max": round(maximo * 1000, 3),
+                    }
+                    for op, (n, total, maximo) in self._latencias.items()
+                },
+            }
+
+
+# =========================
+# INTERFACE
+# =========================
+
+class CacheBackend(ABC):
+    """
+    Armazena bytes por chave, com TTL opcional (segundos). Os métodos públicos
+    medem latência e hit rate; falhas do backend viram miss (o cache nunca
+    derruba a requisição).
+    """
+
+    nome = "abstrato"
+
+    def __init__(self):
+        self.metricas = MetricasCache()
+
+    @abstractmethod
+    def _get(self, chave: str) -> Optional[bytes]: ...
+
+    @abstractmethod
+    def _set(self, chave: str, valor: bytes, ttl: Optional[float]) -> None: ...
+
+    @abstractmethod
+    def _delete(self, chave: str) -> None: ...
+
+    @abstractmethod
+    def _trocar_se(self, chave: str, esperado: Optional[bytes], valor: bytes, ttl: Optional[float]) -> bool: ...
+
+    @abstractmethod
+    def _incrementar(self, chave: str, incrementos: Dict[str, float], ttl: Optional[float]) -> None: ...
+
+    @abstractmethod
+    def _ler_contadores(self, chave: str) -> Dict[str, float]: ...
+
+    def get(self, chave: str) -> Optional[bytes]:
+        inicio = time.perf_counter()
+        try:
+            valor = self._get(chave)
+        except Exception as e:
+            print(f"⚠️ [CACHE:{self.nome}] Falha no get de {chave}: {e}")
+            self.metricas.registrar_erro()
+            valor = None
+        self.metricas.registrar("get", time.perf_counter() - inicio, hit=valor is not None)
+        return valor
+
+    def set(self, chave: str, valor: bytes, ttl: Optional[float] = None) -> None:
+        inicio = time.perf_counter()
+        try:
+            self._set(chave, valor, ttl)
+        except Exception as e:
+            print(f"⚠️ [CACHE:{self.nome}] Falha no set de {chave}: {e}")
+            self.metricas.registrar_erro()
+        self.metricas.registrar("set", time.perf_counter() - inicio)
+
+    def delete(self, chave: str) -> None:
+        inicio = time.perf_counter()
+        try:
+            self._delete(chave)
+        except Exception as e:
+            print(f"⚠️ [CACHE:{self.nome}] Falha no delete de {chave}: {e}")
+            self.metricas.registrar_erro()
+        self.metricas.registrar("delete", time.perf_counter() - inicio)
+
+    def trocar_se(self, chave: str, esperado: Optional[bytes], valor: bytes, ttl: Optional[float] = None) -> bool:
+        """
+        Compare-and-set atômico entre workers: grava `valor` só se o conteúdo
+        atual for exatamente `esperado` (None = chave ausente ou expirada).
+        Aqui a falha do backend sobe: uma escrita condicional não pode virar
+        nem sucesso nem conflito fingidos.
+        """
+        inicio = time.perf_counter()
+        try:
+            trocou = self._trocar_se(chave, esperado, valor, ttl)
+        except Exception as e:
+            print(f"⚠️ [CACHE:{self.nome}] Falha no trocar_se de {chave}: {e}")
+            self.metricas.registrar_erro()
+            raise
+        if not trocou:
+            self.metricas.registrar_conflito()
+        self.metricas.registrar("trocar_se", time.perf_counter() - inicio)
+        return trocou
+
+    def incrementar(self, chave: str, incrementos: Dict[str, float], ttl: Optional[float] = None) -> None:
+        """
+        Soma atômica (entre workers) em contadores numéricos da chave, por campo.
+        O TTL vale para a chave inteira e é renovado a cada soma. Contadores
+        ficam num espaço próprio: leia com ler_contadores, não com get.
+        """
+        inicio = time.perf_counter()
+        try:
+            self._incrementar(chave, incrementos, ttl)
+        except Exception as e:
+            print(f"⚠️ [CACHE:{self.nome}] Falha no incrementar de {chave}: {e}")
+            self.metricas.registrar_erro()
+        self.metricas.registrar("incrementar", time.perf_counter() - inicio)
+
+    def ler_contadores(self, chave: str) -> Dict[str, float]:
+        inicio = time.perf_counter()
+        try:
+            contadores = self._ler_contadores(chave)
+        except Exception as e:
+            print(f"⚠️ [CACHE:{self.nome}] Falha ao ler contadores de {chave}: {e}")
+            self.metricas.registrar_erro()
+            contadores = {}
+        self.metricas.registrar("get", time.perf_counter() - inicio, hit=bool(contadores))
+        return {campo: int(valor) if float(valor).is_integer() else float(valor) for campo, valor in contadores.items()}
+
+    # Atalhos para valores JSON (dicts, listas, modelos pydantic já convertidos)
+    def get_json(self, chave: str) -> Any:
+        dados = self.get(chave)
+        return ler_json(dados) if dados is not None else None
+
+    def set_json(self, chave: str, valor: Any, ttl: Optional[float] = None) -> None:
+        self.set(chave, json_bytes(valor), ttl)
+
+
+def hash_json(dados) -> str:
+    """Hash estável de qualquer estrutura JSON (ordem de chaves não importa)."""
+    canonico = json.dumps(dados, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=para_json)
+    return hashlib.sha256(canonico.encode("utf-8")).hexdigest()
+
+
+# =========================
+# BACKENDS
+# =========================
+
+class MemoriaLRU(CacheBackend):
+    """LRU em memória, por processo. Limita por número de itens e por bytes."""
+
+    nome = "memory"
+
+    def __init__(self, max_itens: int = 2048, max_bytes: int = 256 * 1024 * 1024):
+        super().__init__()
+        self.max_itens = max_itens
+        self.max_bytes = max_bytes
+        self._itens: "OrderedDict[str, tuple[bytes, Optional[float]]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _get(self, chave):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            valor, expira = item
+            if expira is not None and expira < time.time():
+                self._remover(chave)
+                return None
+            self._itens.move_to_end(chave)
+            return valor
+
+    def _set(self, chave, valor, ttl):
+        with self._lock:
+            self._gravar(chave, valor, ttl)
+
+    def _delete(self, chave):
+        with self._lock:
+            if chave in self._itens:
+                self._remover(chave)
+
+    def _trocar_se(self, chave, esperado, valor, ttl):
+        with self._lock:
+            item = self._itens.get(chave)
+            atual = item[0] if item and (item[1] is None or item[1] >= time.time()) else None
+            if atual != esperado:
+                return False
+            self._gravar(chave, valor, ttl)
+            return True
+
+    def _incrementar(self, chave, incrementos, ttl):
+        with self._lock:
+            item = self._itens.get(chave)
+            vivo = item and (item[1] is None or item[1] >= time.time())
+            contadores = ler_json(item[0]) if vivo else {}
+            for campo, valor in incrementos.items():
+                contadores[campo] = contadores.get(campo, 0) + valor
+            self._gravar(chave, json_bytes(contadores), ttl)
+
+    def _ler_contadores(self, chave):
+        valor = self._get(chave)
+        return ler_json(valor) if valor is not None else {}
+
+    def _gravar(self, chave, valor, ttl):
+        if chave in self._itens:
+            self._remover(chave)
+        self._itens[chave] = (valor, time.time() + ttl if ttl else None)
+        self._bytes += len(valor)
+        while self._itens and (len(self._itens) > self.max_itens or self._bytes > self.max_bytes):
+            self._remover(next(iter(self._itens)))
+
+    def _remover(self, chave):
+        valor, _ = self._itens.pop(chave)
+        self._bytes -= len(valor)
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Arquivo SQLite em WAL: leitores não bloqueiam o escritor, e todos os workers
+    do mesmo host enxergam as mesmas chaves. Uma conexão por thread.
+    """
+
+    nome = "sqlite"
+
+    def __init__(self, caminho: str, max_itens: int = 20000):
+        super().__init__()
+        self.caminho = caminho
+        self.max_itens = max_itens
+        self._local = threading.local()
+        self._escritas = 0
+        with self._conexao() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " chave TEXT PRIMARY KEY, valor BLOB NOT NULL, expira REAL, acesso REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_acesso ON cache(acesso)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS contadores ("
+                " chave TEXT NOT NULL, campo TEXT NOT NULL, valor REAL NOT NULL, expira REAL,"
+                " PRIMARY KEY (chave, campo))"
+            )
+
+    def _conexao(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.caminho, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _get(self, chave):
+        conn = self._conexao()
+        linha = conn.execute("SELECT valor, expira FROM cache WHERE chave = ?", (chave,)).fetchone()
+        if linha is None:
+            return None
+        valor, expira = linha
+        agora = time.time()
+        if expira is not None and expira < agora:
+            conn.execute("DELETE FROM cache WHERE chave = ?", (chave,))
+            return None
+        conn.execute("UPDATE cache SET acesso = ? WHERE chave = ?", (agora, chave))
+        return bytes(valor)
+
+    def _set(self, chave, valor, ttl):
+        conn = self._conexao()
+        agora = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (chave, valor, expira, acesso) VALUES (?, ?, ?, ?)",
+            (chave, sqlite3.Binary(valor), agora + ttl if ttl else None, agora),
+        )
+        self._escritas += 1
+        if self._escritas % 100 == 0:
+            self._limpar(conn, agora)
+
+    def _delete(self, chave):
+        self._conexao().execute("DELETE FROM cache WHERE chave = ?", (chave,))
+
+    def _trocar_se(self, chave, esperado, valor, ttl):
+        # Um comando só (autocommit): a comparação e a escrita são atômicas entre processos
+        conn = self._conexao()
+        agora = time.time()
+        expira = agora + ttl if ttl else None
+        if esperado is None:
+            cursor = conn.execute(
+                "INSERT INTO cache (chave, valor, expira, acesso) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(chave) DO UPDATE SET valor = excluded.valor, expira = excluded.expira, acesso = excluded.acesso"
+                " WHERE cache.expira IS NOT NULL AND cache.expira < ?",
+                (chave, sqlite3.Binary(valor), expira, agora, agora),
+            )
+        else:
+            cursor = conn.execute(
+                "UPDATE cache SET valor = ?, expira = ?, acesso = ?"
+                " WHERE chave = ? AND valor = ? AND (expira IS NULL OR expira >= ?)",
+                (sqlite3.Binary(valor), expira, agora, chave, sqlite3.Binary(esperado), agora),
+            )
+        return cursor.rowcount == 1
+
+    def _incrementar(self, chave, incrementos, ttl):
+        # UPDATE valor = valor + ? numa transação: somas concorrentes de outros processos não se perdem
+        conn = self._conexao()
+        agora = time.time()
+        expira = agora + ttl if ttl else None
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM contadores WHERE chave = ? AND expira IS NOT NULL AND expira < ?", (chave, agora))
+            conn.executemany(
+                "INSERT INTO contadores (chave, campo, valor, expira) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(chave, campo) DO UPDATE SET valor = valor + excluded.valor",
+                [(chave, campo, valor, expira) for campo, valor in incrementos.items()],
+            )
+            conn.execute("UPDATE contadores SET expira = ? WHERE chave = ?", (expira, chave))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _ler_contadores(self, chave):
+        linhas = self._conexao().execute(
+            "SELECT campo, valor FROM contadores WHERE chave = ? AND (expira IS NULL OR expira >= ?)",
+            (chave, time.time()),
+        ).fetchall()
+        return dict(linhas)
+
+    def _limpar(self, conn, agora):
+        conn.execute("DELETE FROM cache WHERE expira IS NOT NULL AND expira < ?", (agora,))
+        conn.execute("DELETE FROM contadores WHERE expira IS NOT NULL AND expira < ?", (agora,))
+        conn.execute(
+            "DELETE FROM cache WHERE chave IN ("
+            " SELECT chave FROM cache ORDER BY acesso DESC LIMIT -1 OFFSET ?)",
+            (self.max_itens,),
+        )
+
+
+class RedisCache(CacheBackend):
+    """
+    Cliente mínimo do protocolo do Redis (RESP) só com GET/SET/DEL, HGETALL e
+    EVAL (para as operações atômicas), para não adicionar dependência. Qualquer servidor
+    compatível serve (Redis, Valkey, KeyDB ou um stand-in local).
+    """
+
+    nome = "redis"
+
+    # KEYS[1]; ARGV: existe ("1"/"0"), esperado, novo valor, ttl em ms ("0" = sem TTL)
+    SCRIPT_TROCAR_SE = (
+        "local atual = redis.call('GET', KEYS[1]) "
+        "if ARGV[1] == '1' then if atual ~= ARGV[2] then return 0 end "
+        "elseif atual then return 0 end "
+        "if ARGV[4] ~= '0' then redis.call('SET', KEYS[1], ARGV[3], 'PX', ARGV[4]) "
+        "else redis.call('SET', KEYS[1], ARGV[3]) end "
+        "return 1"
+    )
+
+    # KEYS[1]; ARGV: ttl em ms ("0" = sem TTL), depois pares campo, incremento
+    SCRIPT_INCREMENTAR = (
+        "for i = 2, #ARGV, 2 do redis.call('HINCRBYFLOAT', KEYS[1], ARGV[i], ARGV[i + 1]) end "
+        "if ARGV[1] ~= '0' then redis.call('PEXPIRE', KEYS[1], ARGV[1]) end "
+        "return 1"
+    )
+
+    def __init__(self, url: str, timeout: float = 1.0):
+        super().__init__()
+        partes = urlparse(url)
+        self.host = partes.hostname or "localhost"
+        self.porta = partes.port or 6379
+        self.db = int((partes.path or "/0").lstrip("/") or 0)
+        self.senha = partes.password
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sock: Optional[socket.socket] = None
+        self._leitor = None
+
+    def _conectar(self):
+        sock = socket.create_connection((self.host, self.porta), timeout=self.timeout)
+        self._sock, self._leitor = sock, sock.makefile("rb")
+        if self.senha:
+            self._executar_bruto("AUTH", self.senha)
+        if self.db:
+            self._executar_bruto("SELECT", str(self.db))
+
+    def _executar(self, *args):
+        with self._lock:
+            try:
+                if self._sock is None:
+                    self._conectar()
+                return self._executar_bruto(*args)
+            except (OSError, ConnectionError):
+                # Conexão caiu: descarta e deixa a próxima chamada reconectar
+                self._fechar()
+                raise
+
+    def _executar_bruto(self, *args):
+        comando = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            dados = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            comando.append(b"$%d\r\n%s\r\n" % (len(dados), dados))
+        self._sock.sendall(b"".join(comando))
+        return self._ler_resposta()
+
+    def _ler_resposta(self):
+        linha = self._leitor.readline()
+        if not linha:
+            raise ConnectionError("conexão encerrada pelo servidor")
+        tipo, conteudo = linha[:1], linha[1:-2]
+        if tipo == b"+":
+            return conteudo
+        if tipo == b"-":
+            raise RuntimeError(conteudo.decode("utf-8", "replace"))
+        if tipo == b":":
+            return int(conteudo)
+        if tipo == b"$":
+            tamanho = int(conteudo)
+            if tamanho < 0:
+                return None
+            dados = self._leitor.read(tamanho + 2)
+            return dados[:-2]
+        if tipo == b"*":
+            return [self._ler_resposta() for _ in range(int(conteudo))]
+        raise RuntimeError(f"resposta RESP inválida: {linha!r}")
+
+    def _fechar(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock, self._leitor = None, None
+
+    def _get(self, chave):
+        return self._executar("GET", chave)
+
+    def _set(self, chave, valor, ttl):
+        if ttl:
+            self._executar("SET", chave, valor, "PX", str(int(ttl * 1000)))
+        else:
+            self._executar("SET", chave, valor)
+
+    def _delete(self, chave):
+        self._executar("DEL", chave)
+
+    def _trocar_se(self, chave, esperado, valor, ttl):
+        existe = "0" if esperado is None else "1"
+        resposta = self._executar(
+            "EVAL", self.SCRIPT_TROCAR_SE, "1", chave, existe, esperado or b"", valor, str(int(ttl * 1000) if ttl else 0)
+        )
+        return resposta == 1
+
+    def _incrementar(self, chave, incrementos, ttl):
+        pares = [str(arg) for campo, valor in incrementos.items() for arg in (campo, valor)]
+        self._executar("EVAL", self.SCRIPT_INCREMENTAR, "1", chave, str(int(ttl * 1000) if ttl else 0), *pares)
+
+    def _ler_contadores(self, chave):
+        itens = self._executar("HGETALL", chave) or []
+        return {itens[i].decode("utf-8"): float(itens[i + 1]) for i in range(0, len(itens), 2)}
+
+
+# =========================
+# INSTÂNCIA GLOBAL
+# =========================
+
+def criar_backend_cache(tipo: Optional[str] = None) -> CacheBackend:
+    tipo = (tipo or os.getenv("CACHE_BACKEND", "memory")).lower()
+    if tipo == "sqlite":
+        caminho = os.getenv("CACHE_SQLITE_PATH", os.path.join(tempfile.gettempdir(), "clarion-cache.sqlite3"))
+        return SQLiteCache(caminho)
+    if tipo == "redis":
+        return RedisCache(os.getenv("CACHE_URL", "redis://localhost:6379/0"))
+    if tipo != "memory":
+        print(f"⚠️ [CACHE] CACHE_BACKEND desconhecido ({tipo}), usando memory")
+    return MemoriaLRU(max_itens=int(os.getenv("CACHE_MAX_ITENS", "2048")))
+
+
+_cache: Optional[CacheBackend] = None
+_cache_lock = threading.Lock()
+
+
+def obter_cache() -> CacheBackend:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = criar_backend_cache()
+                print(f"🗄️ [CACHE] Backend: {_cache.nome}")
+    return _cache
@@ -0,0 +1,80 @@
+# cancelamento.py
+#
+# Cancelamento com escopo de requisição: se o cliente fecha a aba ou refaz a
+# pergunta, a chamada ao modelo (e o upload do arquivo) é cancelada em vez de
+# seguir até o fim ocupando cota e threads para uma resposta que ninguém lê.
+
+import asyncio
+import threading
+from collections import defaultdict
+from typing import Awaitable, Dict, TypeVar
+
+from fastapi import Request
+
+from errors import ClientDisconnectedError
+
+INTERVALO_VERIFICACAO = 0.25
+
+T = TypeVar("T")
+
+
+class MetricasCancelamento:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.em_andamento: Dict[str, int] = defaultdict(int)
+        self.iniciadas: Dict[str, int] = defaultdict(int)
+        self.concluidas: Dict[str, int] = defaultdict(int)
+        self.canceladas: Dict[str, int] = defaultdict(int)
+
+    def registrar(self, campo: str, operacao: str, delta: int = 1) -> None:
+        with self._lock:
+            getattr(self, campo)[operacao] += delta
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "em_andamento": dict(self.em_andamento),
+                "iniciadas": dict(self.iniciadas),
+                "concluidas": dict(self.concluidas),
+                "canceladas": dict(self.canceladas),
+            }
+
+
+metricas_cancelamento = MetricasCancelamento()
+
+
+async def executar_cancelavel(request: Request, trabalho: Awaitable[T], operacao: str) -> T:
+    """
+    Executa `trabalho` (uma corrotina com as chamadas assíncronas ao modelo)
+    enquanto verifica se o cliente continua conectado. Se desconectar, a tarefa
+    é cancelada — o que aborta a requisição HTTP ao Gemini — e levanta
+    ClientDisconnectedError. Arquivos já enviados ficam no registro de
+    arquivos_remotos para a próxima tentativa.
+    """
+    tarefa = asyncio.ensure_future(trabalho)
+    metricas_cancelamento.registrar("iniciadas", operacao)
+    metricas_cancelamento.registrar("em_andamento", operacao)
+    try:
+        while True:
+            concluidas, _ = await asyncio.wait({tarefa}, timeout=INTERVALO_VERIFICACAO)
+            if concluidas:
+                metricas_cancelamento.registrar("concluidas", operacao)
+                return tarefa.result()
+            if await request.is_disconnected():
+                print(f"🛑 [{operacao.upper()}] Cliente desconectou; cancelando chamada ao modelo")
+                await _cancelar(tarefa)
+                metricas_cancelamento.registrar("canceladas", operacao)
+                raise ClientDisconnectedError(operacao)
+    except asyncio.CancelledError:
+        # O próprio servidor cancelou a requisição (shutdown, timeout do worker)
+        await _cancelar(tarefa)
+        metricas_cancelamento.registrar("canceladas", operacao)
+        raise
+    finally:
+        metricas_cancelamento.registrar("em_andamento", operacao, -1)
+
+
+async def _cancelar(tarefa: asyncio.Future) -> None:
+    tarefa.cancel()
+    # Espera a limpeza (finally/except CancelledError da tarefa) terminar
+    await asyncio.gather(tarefa, return_exceptions=True)
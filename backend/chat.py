@@ -1,26 +1,75 @@
 from google import genai
 from dotenv import load_dotenv
-import json
-import re
+import os
+from typing import Literal, Optional
+from pydantic import BaseModel, ValidationError
+from cache import obter_cache, hash_json
+from cronograma import EXPLICACAO_CRONOGRAMA, json_compacto
+from prompts import estimar_tokens
+from executores import executar_em
+from roteador import Decisao, MODELO_FORTE, roteador
+from singleflight import chave_chamada, singleflight
+from reparo_json import extrair_json, metricas_parse
+from consumo import contabilidade, enxugar_documentos
 
 load_dotenv()
 
+CONTEXTO_TTL = 6 * 3600
+# Perguntas extras ao modelo quando nem o reparo local recupera o JSON
+MAX_REPERGUNTAS = int(os.getenv("CHAT_MAX_REPERGUNTAS", "1"))
 
-def chat_with_context(
-    api_key: str,
-    model_name: str,
-    chat_history: list,
-    extracted_documents: dict,
-    user_message: str,
-):
-    client = genai.Client(api_key=api_key)
 
-    contexto_docs = ""
-    if extracted_documents:
-        contexto_docs += "<documentos>\n"
-        for nome, dados in extracted_documents.items():
-            contexto_docs += f"<doc nome='{nome}'>\n{dados}\n</doc>\n"
-        contexto_docs += "</documentos>"
+class InstrucaoChat(BaseModel):
+    action: Literal["rename_party", "update_imovel", "update_valor", "none"]
+    target: Optional[str] = None
+    field: Optional[str] = None
+    value: Optional[str] = None
+
+
+class RespostaChat(BaseModel):
+    response: str = ""
+    instruction: Optional[InstrucaoChat] = None
+
+
+CONFIG_CHAT = {
+    "response_mime_type": "application/json",
+    "response_schema": RespostaChat,
+}
+
+AVISO_REPERGUNTA = (
+    "Sua resposta anterior veio incompleta ou não era um JSON válido. "
+    "Responda de novo, de forma mais curta, apenas com o JSON no formato obrigatório."
+)
+
+
+def montar_contexto_documentos(extracted_documents: dict) -> str:
+    """Bloco <documentos> do prompt, compartilhado entre workers via cache."""
+    if not extracted_documents:
+        return ""
+
+    # Sessão perto do orçamento de tokens: documentos sem resumos nem campos vazios
+    enxuto = contabilidade.degradado("contexto_enxuto", "contexto_enxuto")
+    if enxuto:
+        extracted_documents = enxugar_documentos(extracted_documents)
+
+    cache = obter_cache()
+    chave = f"contexto:{'enxuto:' if enxuto else ''}{hash_json(extracted_documents)}"
+    em_cache = cache.get(chave)
+    if em_cache is not None:
+        return em_cache.decode("utf-8")
+
+    # Cronogramas longos vão em séries (ver cronograma.py)
+    contexto_docs = f"<documentos>\n<!-- {EXPLICACAO_CRONOGRAMA} -->\n"
+    for nome, dados in extracted_documents.items():
+        contexto_docs += f"<doc nome='{nome}'>\n{json_compacto(dados)}\n</doc>\n"
+    contexto_docs += "</documentos>"
+
+    cache.set(chave, contexto_docs.encode("utf-8"), ttl=CONTEXTO_TTL)
+    return contexto_docs
+
+
+def _montar_historico(extracted_documents: dict, user_message: str) -> list:
+    contexto_docs = montar_contexto_documentos(extracted_documents)
 
     system_prompt = f"""
 Você é um assistente jurídico sênior altamente preciso e amigável.
@@ -60,33 +109,92 @@ Contexto dos documentos:
         }
     ]
 
-    response = client.models.generate_content(
-        model=model_name,
-        contents=history,
-    )
+    return history
+
+
+async def chat_with_context_async(
+    api_key: str,
+    model_name: Optional[str],
+    chat_history: list,
+    extracted_documents: dict,
+    user_message: str,
+):
+    """
+    Turno de chat cancelável (client.aio). Sem model_name, o roteador escolhe o
+    modelo pelo tamanho do contexto.
+    """
+    client = genai.Client(api_key=api_key)
+    # Modo da sessão (orçamento) lido fora do event loop antes do roteador consultar
+    await contabilidade.carregar_async()
+
+    contents = await executar_em("interativo", _montar_historico, extracted_documents, user_message)
+    if model_name:
+        decisao = Decisao(endpoint="chat", modelo=model_name, motivo="modelo fixado pelo chamador")
+    else:
+        decisao = roteador.escolher("chat", padrao=MODELO_FORTE, tokens=estimar_tokens(contents[0]["parts"][0]["text"]))
+
+    for tentativa in range(MAX_REPERGUNTAS + 1):
+        if tentativa:
+            metricas_parse.registrar("chat", "repergunta")
+            contents = _com_aviso_repergunta(contents)
+        response = await singleflight.executar_async(
+            chave_chamada("chat", decisao.modelo, contents, config=RespostaChat),
+            lambda: roteador.executar_async(
+                decisao,
+                lambda modelo: contabilidade.medir_async(
+                    "chat", modelo,
+                    lambda: client.aio.models.generate_content(model=modelo, contents=contents, config=CONFIG_CHAT),
+                ),
+                # Reparável localmente conta como válido: não vale escalar de modelo por isso
+                validar=lambda r: r.parsed is not None or extrair_json(r.text)[0] is not None,
+                hedge=True,
+            ),
+        )
+        resultado = _interpretar_resposta(response, ultima=tentativa == MAX_REPERGUNTAS)
+        if resultado is not None:
+            return resultado
 
-    raw_text = response.text.strip()
 
-    # =========================
-    # LIMPEZA DE MARKDOWN
-    # =========================
-    raw_text = re.sub(r"^```json", "", raw_text)
-    raw_text = re.sub(r"```$", "", raw_text)
-    raw_text = raw_text.strip()
+def _com_aviso_repergunta(contents: list) -> list:
+    return contents + [{"role": "user", "parts": [{"text": AVISO_REPERGUNTA}]}]
 
-    # =========================
-    # PARSE JSON
-    # =========================
+
+def _como_envelope(dados: dict) -> Optional[dict]:
     try:
-        parsed = json.loads(raw_text)
-    except json.JSONDecodeError:
-        parsed = {
-            "response": raw_text,
-            "updates": []
-        }
+        return RespostaChat.model_validate(dados).model_dump()
+    except ValidationError:
+        # Instrução fora do schema: fica só o texto da resposta
+        if isinstance(dados.get("response"), str):
+            return {"response": dados["response"], "instruction": None}
+        return None
 
-    return {
-    "response": parsed.get("response", ""),
-    "instruction": parsed.get("instruction"),
-}
+
+def _interpretar_resposta(response, ultima: bool = True) -> Optional[dict]:
+    """
+    Envelope {response, instruction}: o parsed do schema, senão o JSON do texto
+    (reparado localmente se preciso). None pede uma nova pergunta ao modelo;
+    na última tentativa o texto bruto vira a resposta, sem instrução.
+    """
+    if isinstance(response.parsed, RespostaChat):
+        metricas_parse.registrar("chat", "schema")
+        return response.parsed.model_dump()
+
+    texto = (response.text or "").strip()
+    dados, reparo = extrair_json(texto)
+    envelope = _como_envelope(dados) if dados is not None else None
+    if envelope is None:
+        metricas_parse.registrar("chat", "falha")
+        if not ultima:
+            print("🩹 [CHAT] JSON irrecuperável, perguntando de novo ao modelo")
+            return None
+        return {"response": texto, "instruction": None}
+
+    metricas_parse.registrar("chat", reparo or "direto")
+    if reparo == "truncado":
+        # Resposta cortada: a instrução pode ter vindo pela metade (ou nem ter chegado)
+        if not ultima:
+            print("🩹 [CHAT] Resposta truncada, perguntando de novo ao modelo")
+            return None
+        envelope["instruction"] = None
+    return envelope
 
@@ -0,0 +1,316 @@
+# consumo.py
+#
+# Contabilidade de tokens e latência das chamadas ao modelo, por sessão e por
+# endpoint, com orçamento de tokens por sessão.
+#
+# - Toda resposta do Gemini passa por registrar(): o usage_metadata é somado
+#   na sessão da requisição (ContextVar, como o prazo) e no prompt que a gerou.
+# - A sessão fica no cache compartilhado, em contadores com soma atômica
+#   (cache.incrementar): todos os workers somam no mesmo registro sem perder
+#   parcelas. Nos caminhos assíncronos a soma roda no executor "interativo".
+# - O consumo da sessão é lido do cache uma vez por requisição; as chamadas
+#   seguintes da mesma requisição somam localmente o que registraram.
+# - Conforme a sessão consome o orçamento, entra em modos degradados antes do
+#   bloqueio: modelo rápido em todas as rotas, depois contexto enxuto nos
+#   prompts de documentos, e por fim recusa (429).
+#   O cronograma já vai compacto em todos os prompts (cronograma.py).
+# - O relatório por prompt ordena por tokens por chamada: é ali que vale otimizar.
+
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+from cache import obter_cache
+from errors import SessionBudgetExceededError
+from executores import executar_na_vaga_ou_em
+from prazos import endpoint_atual
+
+T = TypeVar("T")
+
+ORCAMENTO_SESSAO = int(os.getenv("ORCAMENTO_SESSAO_TOKENS", "3000000"))
+# Fração do orçamento a partir da qual cada modo degradado entra
+LIMIAR_MODELO_RAPIDO = float(os.getenv("ORCAMENTO_LIMIAR_RAPIDO", "0.6"))
+LIMIAR_CONTEXTO_ENXUTO = float(os.getenv("ORCAMENTO_LIMIAR_ENXUTO", "0.8"))
+CONSUMO_TTL = 24 * 3600
+JANELA_LATENCIAS = 500
+
+MODOS = ("normal", "modelo_rapido", "contexto_enxuto", "bloqueado")
+
+# Campos somados por chamada; o máximo de latência fica só nas métricas do processo
+CAMPOS_SESSAO = (
+    "chamadas", "tokens_entrada", "tokens_saida", "tokens_raciocinio", "tokens_cache", "tokens_total", "latencia_total_s",
+)
+
+
+class ConsumoDaRequisicao:
+    """
+    Sessão da requisição e os tokens dela, lidos do cache na primeira consulta.
+    O mesmo objeto é visto pelas threads dos executores (cópia do contexto).
+    """
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.tokens: Optional[int] = None
+
+
+_sessao: ContextVar[Optional[ConsumoDaRequisicao]] = ContextVar("sessao_consumo", default=None)
+
+
+@contextmanager
+def sessao_da_requisicao(session_id: Optional[str]):
+    """Atribui à sessão as chamadas ao modelo feitas dentro do bloco."""
+    token = _sessao.set(ConsumoDaRequisicao(session_id) if session_id else None)
+    try:
+        yield
+    finally:
+        _sessao.reset(token)
+
+
+def sessao_atual() -> Optional[str]:
+    requisicao = _sessao.get()
+    return requisicao.session_id if requisicao else None
+
+
+# Texto livre que só ajuda a conversa; no modo contexto_enxuto sai dos prompts
+CAMPOS_DISPENSAVEIS = {"resumo_conteudo"}
+
+
+def enxugar_documentos(obj):
+    """Documentos para prompt sem campos dispensáveis nem valores vazios."""
+    if isinstance(obj, dict):
+        enxuto = {}
+        for chave, valor in obj.items():
+            if chave in CAMPOS_DISPENSAVEIS:
+                continue
+            valor = enxugar_documentos(valor)
+            if valor not in (None, "", [], {}):
+                enxuto[chave] = valor
+        return enxuto
+    if isinstance(obj, list):
+        return [enxugar_documentos(item) for item in obj]
+    return obj
+
+
+def _uso(resposta) -> Dict[str, int]:
+    uso = getattr(resposta, "usage_metadata", None)
+    entrada = (getattr(uso, "prompt_token_count", 0) or 0) if uso else 0
+    saida = (getattr(uso, "candidates_token_count", 0) or 0) if uso else 0
+    raciocinio = (getattr(uso, "thoughts_token_count", 0) or 0) if uso else 0
+    total = (getattr(uso, "total_token_count", 0) or 0) if uso else 0
+    return {
+        "tokens_entrada": entrada,
+        "tokens_saida": saida,
+        "tokens_raciocinio": raciocinio,
+        "tokens_cache": (getattr(uso, "cached_content_token_count", 0) or 0) if uso else 0,
+        "tokens_total": total or entrada + saida + raciocinio,
+    }
+
+
+def _incrementos_sessao(endpoint: str, uso: Dict[str, int], duracao: float) -> Dict[str, float]:
+    valores = {**uso, "chamadas": 1, "latencia_total_s": round(duracao, 3)}
+    incrementos = {}
+    for campo in CAMPOS_SESSAO:
+        incrementos[f"total.{campo}"] = valores[campo]
+        incrementos[f"endpoints.{endpoint}.{campo}"] = valores[campo]
+    return incrementos
+
+
+def _aninhar(contadores: Dict[str, float]) -> dict:
+    """{"total.tokens_total": 10, "endpoints.chat.chamadas": 1} -> {"total": {...}, "endpoints": {"chat": {...}}}"""
+    registro = {"total": {}, "endpoints": {}}
+    for chave, valor in contadores.items():
+        grupo, _, resto = chave.partition(".")
+        if grupo == "total":
+            registro["total"][resto] = valor
+        elif grupo == "endpoints":
+            endpoint, _, campo = resto.rpartition(".")
+            registro["endpoints"].setdefault(endpoint, {})[campo] = valor
+    return registro
+
+
+def _somar(destino: dict, uso: Dict[str, int], duracao: float) -> None:
+    destino["chamadas"] = destino.get("chamadas", 0) + 1
+    for campo, valor in uso.items():
+        destino[campo] = destino.get(campo, 0) + valor
+    destino["latencia_total_s"] = round(destino.get("latencia_total_s", 0.0) + duracao, 3)
+    destino["latencia_max_s"] = round(max(destino.get("latencia_max_s", 0.0), duracao), 3)
+
+
+class EstatisticasPrompt:
+    def __init__(self):
+        self.totais: dict = {}
+        self.modelos: Dict[str, int] = defaultdict(int)
+        self.latencias: Deque[float] = deque(maxlen=JANELA_LATENCIAS)
+
+    def snapshot(self, nome: str) -> dict:
+        chamadas = self.totais.get("chamadas", 0)
+        latencias = sorted(self.latencias)
+        return {
+            "prompt": nome,
+            **self.totais,
+            "tokens_por_chamada": round(self.totais.get("tokens_total", 0) / chamadas, 1) if chamadas else None,
+            "entrada_por_chamada": round(self.totais.get("tokens_entrada", 0) / chamadas, 1) if chamadas else None,
+            "saida_por_chamada": round(self.totais.get("tokens_saida", 0) / chamadas, 1) if chamadas else None,
+            "latencia_p50_s": round(latencias[len(latencias) // 2], 3) if latencias else None,
+            "latencia_p90_s": round(latencias[min(len(latencias) - 1, int(0.9 * len(latencias)))], 3) if latencias else None,
+            "modelos": dict(self.modelos),
+        }
+
+
+class ContabilidadeConsumo:
+    def __init__(self, orcamento: int = ORCAMENTO_SESSAO):
+        self.orcamento = orcamento
+        self._lock = threading.Lock()
+        self._prompts: Dict[str, EstatisticasPrompt] = defaultdict(EstatisticasPrompt)
+        self._endpoints: Dict[str, dict] = defaultdict(dict)
+        self.degradadas: Dict[str, int] = defaultdict(int)
+        self.recusadas = 0
+
+    # ---------- registro ----------
+
+    def _chave(self, session_id: str) -> str:
+        return f"consumo_sessao:{session_id}"
+
+    def _registrar_local(self, nome_prompt: str, modelo: str, uso: Dict[str, int], duracao: float, endpoint: str) -> None:
+        with self._lock:
+            estatisticas = self._prompts[nome_prompt]
+            _somar(estatisticas.totais, uso, duracao)
+            estatisticas.modelos[modelo] += 1
+            estatisticas.latencias.append(duracao)
+            _somar(self._endpoints[endpoint], uso, duracao)
+            requisicao = _sessao.get()
+            if requisicao is not None and requisicao.tokens is not None:
+                requisicao.tokens += uso["tokens_total"]
+
+    def _somar_na_sessao(self, session_id: str, endpoint: str, uso: Dict[str, int], duracao: float) -> None:
+        obter_cache().incrementar(self._chave(session_id), _incrementos_sessao(endpoint, uso, duracao), ttl=CONSUMO_TTL)
+
+    def registrar(self, nome_prompt: str, modelo: str, resposta, duracao: float) -> None:
+        uso = _uso(resposta)
+        endpoint = endpoint_atual() or "sem_endpoint"
+        self._registrar_local(nome_prompt, modelo, uso, duracao, endpoint)
+        session_id = sessao_atual()
+        if session_id:
+            self._somar_na_sessao(session_id, endpoint, uso, duracao)
+
+    async def registrar_async(self, nome_prompt: str, modelo: str, resposta, duracao: float) -> None:
+        """registrar() para o event loop: a soma no cache compartilhado roda no executor."""
+        uso = _uso(resposta)
+        endpoint = endpoint_atual() or "sem_endpoint"
+        self._registrar_local(nome_prompt, modelo, uso, duracao, endpoint)
+        session_id = sessao_atual()
+        if session_id:
+            await executar_na_vaga_ou_em("interativo", self._somar_na_sessao, session_id, endpoint, uso, duracao)
+
+    def medir(self, nome_prompt: str, modelo: str, chamada: Callable[[], T]) -> T:
+        """Para chamadas diretas ao client (fora do registro_prompts)."""
+        self.verificar()
+        inicio = time.monotonic()
+        resposta = chamada()
+        self.registrar(nome_prompt, modelo, resposta, time.monotonic() - inicio)
+        return resposta
+
+    async def medir_async(self, nome_prompt: str, modelo: str, chamada: Callable[[], Awaitable[T]]) -> T:
+        await self.verificar_async()
+        inicio = time.monotonic()
+        resposta = await chamada()
+        await self.registrar_async(nome_prompt, modelo, resposta, time.monotonic() - inicio)
+        return resposta
+
+    # ---------- orçamento ----------
+
+    def tokens_da_sessao(self, session_id: Optional[str]) -> int:
+        if not session_id:
+            return 0
+        return obter_cache().ler_contadores(self._chave(session_id)).get("total.tokens_total", 0)
+
+    def _tokens_da_requisicao(self, requisicao: ConsumoDaRequisicao) -> int:
+        if requisicao.tokens is None:
+            tokens = self.tokens_da_sessao(requisicao.session_id)
+            with self._lock:
+                if requisicao.tokens is None:
+                    requisicao.tokens = tokens
+        return requisicao.tokens
+
+    async def carregar_async(self) -> None:
+        """Lê o consumo da sessão da requisição fora do event loop (só na primeira vez)."""
+        requisicao = _sessao.get()
+        if requisicao is not None and requisicao.tokens is None and self.orcamento > 0:
+            await executar_na_vaga_ou_em("interativo", self._tokens_da_requisicao, requisicao)
+
+    def modo(self, session_id: Optional[str] = None) -> str:
+        """
+        Modo da sessão pelo consumo do orçamento. Sem session_id (ou com o da
+        requisição), usa o consumo lido uma vez por requisição.
+        """
+        if self.orcamento <= 0:
+            return "normal"
+        requisicao = _sessao.get()
+        if session_id is None or (requisicao is not None and session_id == requisicao.session_id):
+            if requisicao is None:
+                return "normal"
+            tokens = self._tokens_da_requisicao(requisicao)
+        else:
+            tokens = self.tokens_da_sessao(session_id)
+        fracao = tokens / self.orcamento
+        if fracao >= 1:
+            return "bloqueado"
+        if fracao >= LIMIAR_CONTEXTO_ENXUTO:
+            return "contexto_enxuto"
+        if fracao >= LIMIAR_MODELO_RAPIDO:
+            return "modelo_rapido"
+        return "normal"
+
+    def degradado(self, modo_minimo: str, motivo: str) -> bool:
+        """True se a sessão atual está no modo pedido (ou pior); conta a degradação aplicada."""
+        if MODOS.index(self.modo()) < MODOS.index(modo_minimo):
+            return False
+        with self._lock:
+            self.degradadas[motivo] += 1
+        return True
+
+    def verificar(self) -> None:
+        """Parada final: a sessão estourou o orçamento, nenhuma chamada nova ao modelo."""
+        session_id = sessao_atual()
+        if self.modo(session_id) == "bloqueado":
+            with self._lock:
+                self.recusadas += 1
+            print(f"🛑 [CONSUMO] Sessão {session_id} estourou o orçamento de {self.orcamento} tokens")
+            raise SessionBudgetExceededError()
+
+    async def verificar_async(self) -> None:
+        await self.carregar_async()
+        self.verificar()
+
+    # ---------- relatórios ----------
+
+    def sessao(self, session_id: str) -> dict:
+        registro = _aninhar(obter_cache().ler_contadores(self._chave(session_id)))
+        usados = registro["total"].get("tokens_total", 0)
+        return {
+            "session_id": session_id,
+            "modo": self.modo(session_id),
+            "orcamento_tokens": self.orcamento,
+            "tokens_usados": usados,
+            "tokens_restantes": max(0, self.orcamento - usados),
+            **registro,
+        }
+
+    def relatorio(self) -> dict:
+        with self._lock:
+            prompts = [estatisticas.snapshot(nome) for nome, estatisticas in self._prompts.items()]
+            return {
+                "prompts_por_tokens_por_chamada": sorted(prompts, key=lambda p: p["tokens_por_chamada"] or 0, reverse=True),
+                "endpoints": {nome: dict(totais) for nome, totais in self._endpoints.items()},
+                "orcamento_sessao_tokens": self.orcamento,
+                "limiares": {"modelo_rapido": LIMIAR_MODELO_RAPIDO, "contexto_enxuto": LIMIAR_CONTEXTO_ENXUTO},
+                "degradacoes_aplicadas": dict(self.degradadas),
+                "chamadas_recusadas": self.recusadas,
+            }
+
+
+contabilidade = ContabilidadeConsumo()
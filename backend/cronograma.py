@@ -0,0 +1,226 @@
+# cronograma.py
+#
+# Representação compacta do cronograma_financeiro.
+#
+# Um financiamento de 360 meses repete o mesmo tipo, valor e cadência mensal
+# centenas de vezes. Aqui o cronograma vira uma lista de séries (parcela
+# inicial, quantidade, valor, primeiro vencimento, período em meses), e a
+# expansão devolve exatamente as mesmas Parcelas — uma série só é estendida
+# se a próxima parcela for idêntica à prevista pela série.
+
+import calendar
+import re
+from datetime import date
+from typing import Any, Callable, List, Optional, Tuple
+
+from pydantic import BaseModel, ValidationError
+
+from schemas import Parcela
+from serializacao import json_texto
+
+CHAVE_LISTA = "cronograma_financeiro"
+CHAVE_COMPACTA = "cronograma_compacto"
+
+EXPLICACAO_CRONOGRAMA = (
+    f'"{CHAVE_COMPACTA}" é o {CHAVE_LISTA} em séries: cada série '
+    "{tipo, inicio, quantidade, valor, primeiro_vencimento, periodo_meses, status} representa "
+    '"quantidade" parcelas consecutivas de mesmo tipo, valor e status, começando pela parcela "inicio" '
+    '(ex.: "1/360") e vencendo a cada "periodo_meses" meses a partir de "primeiro_vencimento".'
+)
+
+# Como o modelo deve endereçar parcelas numa instrução de edição; caminhos em
+# "cronograma_compacto" também são aceitos (ver aplicar_no_compacto)
+REGRA_EDICAO_CRONOGRAMA = (
+    f'- Parcelas: para alterar UMA parcela use o path "{CHAVE_LISTA}[i]" ou "{CHAVE_LISTA}[i].campo", com i = posição '
+    f'da parcela na lista completa (a partir de 0, somando as "quantidade" das séries anteriores de "{CHAVE_COMPACTA}"); '
+    f'para alterar uma série inteira use "{CHAVE_COMPACTA}[k].campo" (ex.: "{CHAVE_COMPACTA}[1].valor").'
+)
+
+
+class SerieParcelas(BaseModel):
+    tipo: str
+    inicio: str
+    quantidade: int = 1
+    valor: float
+    primeiro_vencimento: str
+    periodo_meses: int = 0
+    status: Optional[str] = None
+
+
+# =========================
+# ÍNDICE E DATAS
+# =========================
+
+_INDICE = re.compile(r"^\s*(\d+)\s*(/\s*\d+)?\s*$")
+_DATA_BR = re.compile(r"^(\d{2})/(\d{2})/(\d{4})$")
+_DATA_ISO = re.compile(r"^(\d{4})-(\d{2})-(\d{2})$")
+
+
+def _proximo_indice(indice: str, passos: int) -> Optional[str]:
+    m = _INDICE.match(indice or "")
+    if not m:
+        return None
+    return f"{int(m.group(1)) + passos}{m.group(2) or ''}"
+
+
+def _ler_data(texto: str) -> Optional[Tuple[date, Callable[[date], str]]]:
+    if m := _DATA_BR.match(texto or ""):
+        dia, mes, ano = map(int, m.groups())
+        formatar = lambda d: d.strftime("%d/%m/%Y")  # noqa: E731
+    elif m := _DATA_ISO.match(texto or ""):
+        ano, mes, dia = map(int, m.groups())
+        formatar = lambda d: d.isoformat()  # noqa: E731
+    else:
+        return None
+    try:
+        return date(ano, mes, dia), formatar
+    except ValueError:
+        return None
+
+
+def _somar_meses(inicio: date, meses: int) -> date:
+    # Dia 31 vira o último dia dos meses mais curtos, como nos boletos
+    total = inicio.month - 1 + meses
+    ano, mes = inicio.year + total // 12, total % 12 + 1
+    return date(ano, mes, min(inicio.day, calendar.monthrange(ano, mes)[1]))
+
+
+def _vencimento(primeiro: str, periodo_meses: int, passos: int) -> Optional[str]:
+    if passos == 0:
+        return primeiro
+    lido = _ler_data(primeiro)
+    if lido is None or periodo_meses <= 0:
+        return None
+    data, formatar = lido
+    return formatar(_somar_meses(data, periodo_meses * passos))
+
+
+def _meses_entre(a: str, b: str) -> Optional[int]:
+    da, db = _ler_data(a), _ler_data(b)
+    if da is None or db is None:
+        return None
+    meses = (db[0].year - da[0].year) * 12 + db[0].month - da[0].month
+    return meses if meses > 0 else None
+
+
+# =========================
+# COMPACTAR / EXPANDIR
+# =========================
+
+def _como_dict(parcela) -> dict:
+    return parcela.model_dump() if hasattr(parcela, "model_dump") else dict(parcela)
+
+
+def _normalizar(parcela) -> dict:
+    # Mesmos campos/tipos de Parcela, para a comparação com a parcela prevista ser exata
+    return Parcela.model_validate(_como_dict(parcela)).model_dump()
+
+
+def _prevista(serie: SerieParcelas, passos: int) -> Optional[dict]:
+    indice = _proximo_indice(serie.inicio, passos) if passos else serie.inicio
+    vencimento = _vencimento(serie.primeiro_vencimento, serie.periodo_meses, passos)
+    if indice is None or vencimento is None:
+        return None
+    return {"tipo": serie.tipo, "indice": indice, "vencimento": vencimento, "valor": serie.valor, "status": serie.status}
+
+
+def compactar_cronograma(parcelas: List[Any]) -> List[dict]:
+    """Lista de Parcela (ou dicts) -> lista de séries (dicts, sem campos padrão)."""
+    series: List[SerieParcelas] = []
+    for parcela in map(_normalizar, parcelas):
+        atual = series[-1] if series else None
+        if atual is not None:
+            if atual.quantidade == 1 and atual.periodo_meses == 0:
+                # Segunda parcela da série define o período
+                periodo = _meses_entre(atual.primeiro_vencimento, parcela.get("vencimento"))
+                candidata = atual.model_copy(update={"periodo_meses": periodo or 0})
+            else:
+                candidata = atual
+            if _prevista(candidata, candidata.quantidade) == parcela:
+                candidata.quantidade += 1
+                series[-1] = candidata
+                continue
+        series.append(
+            SerieParcelas(
+                tipo=parcela["tipo"],
+                inicio=parcela["indice"],
+                valor=parcela["valor"],
+                primeiro_vencimento=parcela["vencimento"],
+                status=parcela.get("status"),
+            )
+        )
+    return [s.model_dump(exclude_defaults=True, exclude={"periodo_meses"} if s.quantidade == 1 else None) for s in series]
+
+
+def expandir_cronograma(series: List[Any]) -> List[Parcela]:
+    parcelas = []
+    for bruto in series:
+        serie = SerieParcelas.model_validate(_como_dict(bruto))
+        for passo in range(serie.quantidade):
+            prevista = _prevista(serie, passo)
+            if prevista is None:
+                raise ValueError(f"Série de parcelas inválida: {bruto}")
+            parcelas.append(Parcela.model_validate(prevista))
+    return parcelas
+
+
+# =========================
+# PAYLOADS
+# =========================
+
+def compactar_payload(obj: Any) -> Any:
+    """
+    Troca todo "cronograma_financeiro": [...] por "cronograma_compacto": [séries]
+    (em qualquer profundidade). Usado nos prompts e nas respostas pedidas com
+    X-Cronograma: compacto.
+    """
+    if hasattr(obj, "model_dump"):
+        obj = obj.model_dump()
+    if isinstance(obj, dict):
+        saida = {}
+        for chave, valor in obj.items():
+            if chave == CHAVE_LISTA and isinstance(valor, list) and valor:
+                try:
+                    saida[CHAVE_COMPACTA] = compactar_cronograma(valor)
+                except (ValidationError, TypeError):
+                    # Fora do formato de Parcela: vai como veio
+                    saida[chave] = valor
+            else:
+                saida[chave] = compactar_payload(valor)
+        return saida
+    if isinstance(obj, list):
+        return [compactar_payload(item) for item in obj]
+    return obj
+
+
+def expandir_payload(obj: Any) -> Any:
+    """Inverso de compactar_payload: aceita payloads do cliente em qualquer das duas formas."""
+    if isinstance(obj, dict):
+        saida = {}
+        for chave, valor in obj.items():
+            if chave == CHAVE_COMPACTA and isinstance(valor, list):
+                saida[CHAVE_LISTA] = [p.model_dump() for p in expandir_cronograma(valor)]
+            else:
+                saida[chave] = expandir_payload(valor)
+        return saida
+    if isinstance(obj, list):
+        return [expandir_payload(item) for item in obj]
+    return obj
+
+
+def aplicar_no_compacto(obj: dict, aplicar: Callable[[dict], dict]) -> dict:
+    """
+    Aplica uma edição feita sobre a forma compacta (path em "cronograma_compacto")
+    e devolve o draft com o cronograma expandido de novo. Se as séries editadas
+    não expandirem (campo inválido, série vazia), o draft fica como estava.
+    """
+    try:
+        return expandir_payload(aplicar(compactar_payload(obj)))
+    except (ValidationError, TypeError, ValueError) as e:
+        print(f"⚠️ [CRONOGRAMA] Edição nas séries não pôde ser expandida: {e}")
+        return obj
+
+
+def json_compacto(obj: Any) -> str:
+    """JSON enxuto para prompts: cronograma em séries e sem espaços."""
+    return json_texto(compactar_payload(obj), tolerante=True)
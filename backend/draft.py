@@ -4,19 +4,53 @@ from google import genai
 import os
 from dotenv import load_dotenv
 from schemas import ContractDraft
+from entidades import compactar_para_consolidacao
+from cache import hash_json, obter_cache
+from cronograma import CHAVE_COMPACTA, EXPLICACAO_CRONOGRAMA, aplicar_no_compacto, json_compacto
+from prompts import estimar_tokens
+from prazos import config_com_prazo
+from roteador import MODELO_RAPIDO, roteador
+from singleflight import chave_chamada, singleflight
+from consumo import contabilidade, enxugar_documentos
+from pydantic import BaseModel, Field
 import copy
 import re
-from typing import List
+from typing import Dict, List, Optional
 
 load_dotenv()
 
-def prepare_contract_draft(documentos: dict):
+
+class FonteCampo(BaseModel):
+    path: str = Field(..., description="Campo (ex: partes[0].cpf) ou bloco inteiro (ex: imovel, cronograma_financeiro)")
+    documentos: List[str] = Field(..., description="Nomes dos documentos de onde o valor saiu")
+
+
+class DraftComFontes(BaseModel):
+    """Resposta da consolidação: o draft e, junto, de onde veio cada dado."""
+    draft: ContractDraft
+    fontes: List[FonteCampo] = Field(default_factory=list)
+
+
+EXPLICACAO_FONTES = (
+    'Em "fontes", registre de qual(is) documento(s) saiu cada dado do draft, usando o nome do '
+    'documento como aparece em "documentos": um item por campo (ex: "partes[0].cpf") ou por '
+    'bloco inteiro quando todo ele vier dos mesmos documentos (ex: "imovel", "cronograma_financeiro")'
+)
+
+
+def prepare_contract_draft(documentos: dict) -> Optional[DraftComFontes]:
     api_key = os.getenv("AI_API_KEY")
     if not api_key:
         raise RuntimeError("AI_API_KEY não encontrada")
 
     client = genai.Client(api_key=api_key) 
 
+    # Pré-passo local: partes deduplicadas entre RG, CNH, certidões, etc.
+    compactos = compactar_para_consolidacao(documentos)
+    documentos_prompt = compactos
+    if contabilidade.degradado("contexto_enxuto", "contexto_enxuto"):
+        documentos_prompt = enxugar_documentos(compactos)
+
     prompt = f"""
     A partir dos DOCUMENTOS abaixo (já extraídos),
     consolide os dados necessários para um CONTRATO DE COMPRA E VENDA.
@@ -24,24 +58,213 @@ def prepare_contract_draft(documentos: dict):
     Regras obrigatórias:
     - Use SOMENTE os dados fornecidos
     - NÃO invente informações
+    - As pessoas já foram identificadas e deduplicadas em "partes_consolidadas"; use essa lista como base das partes
     - Se houver conflito entre documentos, liste em "pendencias"
     - Se faltar dado essencial, liste em "pendencias"
-    - Retorne JSON conforme o schema ContractDraft
+    - Retorne JSON com o draft conforme o schema ContractDraft, com o cronograma_financeiro parcela a parcela
+    - {EXPLICACAO_CRONOGRAMA}
+    - {EXPLICACAO_FONTES}
 
     Documentos:
-    {documentos}
+    {json_compacto(documentos_prompt)}
     """
 
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt,
-        config={
-            "response_mime_type": "application/json",
-            "response_schema": ContractDraft,
-        },
+    response = _gerar_draft(client, prompt)
+
+    return _com_pendencias(response.parsed, compactos["pendencias_identificacao"])
+
+
+def _gerar_draft(client, prompt: str):
+    """
+    Chamada roteada: flash por padrão, pro para prompts grandes ou se o draft não validar.
+    Pedidos idênticos simultâneos (duplo clique, várias abas) compartilham a mesma chamada.
+    """
+    decisao = roteador.escolher("draft", padrao=MODELO_RAPIDO, tokens=estimar_tokens(prompt))
+    return singleflight.executar(
+        chave_chamada("draft", decisao.modelo, prompt, config=DraftComFontes),
+        lambda: roteador.executar(
+            decisao,
+            lambda modelo, prazo: contabilidade.medir(
+                "draft", modelo,
+                lambda: client.models.generate_content(
+                    model=modelo,
+                    contents=prompt,
+                    config=config_com_prazo({
+                        "response_mime_type": "application/json",
+                        "response_schema": DraftComFontes,
+                    }, prazo),
+                ),
+            ),
+            validar=lambda r: r.parsed is not None,
+        ),
     )
 
-    return response.parsed
+
+def _com_pendencias(resultado: Optional[DraftComFontes], pendencias: List[str]) -> Optional[DraftComFontes]:
+    """Garante que os conflitos achados no pré-passo local cheguem ao draft."""
+    if resultado is None:
+        return None
+    for pendencia in pendencias:
+        if pendencia not in resultado.draft.pendencias:
+            resultado.draft.pendencias.append(pendencia)
+    return resultado
+
+
+# =========================
+# CONSOLIDAÇÃO INCREMENTAL
+# =========================
+
+class EstadoConsolidacao(BaseModel):
+    """Draft base (sem instruções pendentes) + o que já foi consolidado nele."""
+    draft: ContractDraft
+    documentos: Dict[str, str] = Field(default_factory=dict, description="nome do documento -> hash do conteúdo")
+    fontes: Dict[str, List[str]] = Field(default_factory=dict, description="path do campo -> documentos de origem")
+
+
+CONSOLIDACAO_TTL = 24 * 3600
+
+
+def hash_documento(dados) -> str:
+    return hash_json(dados)
+
+
+def hash_conjunto(documentos: dict) -> str:
+    """Hash do conjunto de documentos (nome + conteúdo), sem depender da ordem."""
+    return hash_json({nome: hash_documento(dados) for nome, dados in documentos.items()})
+
+
+def carregar_consolidacao(session_id: str) -> Optional[EstadoConsolidacao]:
+    # Estado da consolidação por sessão (draft base + hashes dos documentos já incorporados)
+    dados = obter_cache().get_json(f"consolidacao:{session_id}")
+    return EstadoConsolidacao.model_validate(dados) if dados else None
+
+
+def salvar_consolidacao(session_id: str, estado: EstadoConsolidacao) -> None:
+    obter_cache().set_json(f"consolidacao:{session_id}", estado, ttl=CONSOLIDACAO_TTL)
+
+
+def merge_documents_into_draft(draft: ContractDraft, novos_documentos: dict) -> Optional[DraftComFontes]:
+    """
+    Incorpora apenas os documentos novos/alterados a um draft já consolidado.
+    O prompt cresce com o delta, não com o total de documentos da sessão.
+    """
+    api_key = os.getenv("AI_API_KEY")
+    if not api_key:
+        raise RuntimeError("AI_API_KEY não encontrada")
+
+    client = genai.Client(api_key=api_key)
+
+    compactos = compactar_para_consolidacao(novos_documentos)
+    documentos_prompt = compactos
+    if contabilidade.degradado("contexto_enxuto", "contexto_enxuto"):
+        documentos_prompt = enxugar_documentos(compactos)
+    draft_json = json_compacto(draft)
+    novos_json = json_compacto(documentos_prompt)
+
+    prompt = f"""
+    Você está ATUALIZANDO um rascunho de CONTRATO DE COMPRA E VENDA já consolidado.
+
+    Regras obrigatórias:
+    - Mantenha todos os dados do draft atual, a menos que um documento novo os complete ou corrija
+    - Acrescente partes, imóvel, valores e parcelas que só aparecem nos documentos novos
+    - Um documento com o mesmo nome de um já usado é uma versão atualizada dele
+    - NÃO invente informações
+    - Se um documento novo conflitar com o draft atual, mantenha o valor atual e liste o conflito em "pendencias"
+    - Remova de "pendencias" o que os documentos novos resolverem
+    - Retorne o draft COMPLETO em JSON conforme o schema ContractDraft, com o cronograma_financeiro parcela a parcela
+    - {EXPLICACAO_CRONOGRAMA}
+    - {EXPLICACAO_FONTES}; liste só o que os documentos novos acrescentaram ou alteraram
+
+    Draft atual:
+    {draft_json}
+
+    Documentos novos ou alterados:
+    {novos_json}
+    """
+
+    response = _gerar_draft(client, prompt)
+
+    return _com_pendencias(response.parsed, compactos["pendencias_identificacao"])
+
+
+def _achatar(obj, prefixo: str = "") -> Dict[str, object]:
+    """{"partes": [{"nome": "X"}]} -> {"partes[0].nome": "X"} (só folhas)."""
+    folhas = {}
+    if isinstance(obj, dict):
+        for chave, valor in obj.items():
+            folhas.update(_achatar(valor, f"{prefixo}.{chave}" if prefixo else chave))
+    elif isinstance(obj, list):
+        for i, valor in enumerate(obj):
+            folhas.update(_achatar(valor, f"{prefixo}[{i}]"))
+    elif obj not in (None, ""):
+        folhas[prefixo] = obj
+    return folhas
+
+
+def _cobre(declarado: str, path: str) -> bool:
+    return path == declarado or path.startswith(declarado + ".") or path.startswith(declarado + "[")
+
+
+def _atribuir_fontes(
+    paths: Dict[str, object], declaradas: List[FonteCampo], documentos: List[str], candidatos: List[str]
+) -> Dict[str, List[str]]:
+    """
+    Origem de cada campo pelo que o modelo registrou na consolidação (o item
+    mais específico que cobre o path). Nomes fora de `documentos` são
+    descartados; campo sem origem declarada fica com todos os candidatos.
+    """
+    validos = set(documentos)
+    fontes = {}
+    for path in paths:
+        cobrem = [f for f in declaradas if _cobre(f.path.strip(), path)]
+        declarada = max(cobrem, key=lambda f: len(f.path.strip()), default=None)
+        nomes = [nome for nome in declarada.documentos if nome in validos] if declarada else []
+        fontes[path] = list(dict.fromkeys(nomes)) or list(candidatos)
+    return fontes
+
+
+def consolidar_documentos(documentos: dict, estado: Optional[EstadoConsolidacao] = None) -> EstadoConsolidacao:
+    """
+    Consolida os documentos reaproveitando o estado anterior quando possível:
+    - sem estado ou com documento removido: consolidação completa;
+    - só documentos novos/alterados: merge incremental apenas do delta;
+    - nada mudou: devolve o estado como está.
+    """
+    hashes = {nome: hash_documento(dados) for nome, dados in documentos.items()}
+
+    removidos = set(estado.documentos) - set(hashes) if estado else set()
+    if estado is None or removidos:
+        if removidos:
+            print(f"♻️ Documentos removidos ({', '.join(sorted(removidos))}), reconsolidando tudo...")
+        resultado = prepare_contract_draft(documentos)
+        if resultado is None:
+            raise RuntimeError("O modelo não retornou um draft válido")
+        return EstadoConsolidacao(
+            draft=resultado.draft,
+            documentos=hashes,
+            fontes=_atribuir_fontes(_achatar(resultado.draft.model_dump()), resultado.fontes, list(documentos), list(documentos)),
+        )
+
+    delta = {nome: documentos[nome] for nome, h in hashes.items() if estado.documentos.get(nome) != h}
+    if not delta:
+        print("✅ Nenhum documento novo, draft consolidado reaproveitado")
+        return estado
+
+    print(f"➕ Consolidando incrementalmente {len(delta)} de {len(documentos)} documento(s)...")
+    antes = _achatar(estado.draft.model_dump())
+    resultado = merge_documents_into_draft(estado.draft, delta)
+    if resultado is None:
+        print("⚠️ Merge incremental sem resposta válida, reconsolidando tudo...")
+        return consolidar_documentos(documentos)
+    depois = _achatar(resultado.draft.model_dump())
+
+    # Campos inalterados mantêm a origem; novos/alterados, a que o merge registrou
+    # (sem registro: os documentos do delta)
+    fontes = {path: estado.fontes[path] for path in depois if path in estado.fontes and antes.get(path) == depois[path]}
+    alterados = {path: valor for path, valor in depois.items() if path not in fontes}
+    fontes.update(_atribuir_fontes(alterados, resultado.fontes, list(documentos), list(delta)))
+
+    return EstadoConsolidacao(draft=resultado.draft, documentos=hashes, fontes=fontes)
 
 
 def apply_instructions_to_draft(draft: dict, instructions: List[dict]) -> dict:
@@ -81,7 +304,15 @@ def set_by_path_python(obj: dict, path: str, value: any) -> dict:
     - "partes[0].nome"
     - "partes.vendedores[0].cpf"
     - "imovel.endereco.logradouro"
+    - "cronograma_compacto[1].valor" (série inteira, como o modelo vê nos prompts)
     """
+    if CHAVE_COMPACTA in path:
+        # O modelo editou a forma compacta: aplica nas séries e expande de volta
+        return aplicar_no_compacto(obj, lambda compacto: _set_by_path(compacto, path, value))
+    return _set_by_path(obj, path, value)
+
+
+def _set_by_path(obj: dict, path: str, value: any) -> dict:
     print(f"      🔍 Aplicando path: {path}")
     
     # Parse do path
@@ -3,9 +3,16 @@
 from google import genai
 from dotenv import load_dotenv
 import os
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 from typing import Optional, Any
 import json
+from prompts import registro_prompts, estimar_tokens
+from cronograma import EXPLICACAO_CRONOGRAMA, REGRA_EDICAO_CRONOGRAMA, json_compacto
+from indice_partes import ROTULOS, indice_do_draft, interpretar_pedido, metricas_resolucao
+from prazos import config_com_prazo
+from roteador import MODELO_FORTE, MODELO_RAPIDO, roteador
+from singleflight import chave_chamada, singleflight
+from consumo import contabilidade
 
 load_dotenv()
 
@@ -24,53 +31,37 @@ class UniversalInstruction(BaseModel):
 # DETECTAR INSTRUÇÃO DE EDIÇÃO (UNIVERSAL)
 # =========================
 
-def detect_edit_instruction(user_message: str, documents: dict) -> dict:
-    """
-    Detecta se a mensagem é uma instrução de edição para QUALQUER campo do contrato.
-    Funciona ANTES do draft ser criado.
-    """
-    print(f"\n🔍 Detectando instrução de edição...")
-    print(f"   Mensagem: {user_message}")
-    
-    api_key = os.getenv("AI_API_KEY")
-    if not api_key:
-        raise RuntimeError("AI_API_KEY não encontrada")
-
-    client = genai.Client(api_key=api_key)
-
-    prompt = f"""
+PROMPT_DETECCAO_EDICAO = """
 Você é um assistente que detecta se o usuário está pedindo para EDITAR informações de um contrato.
 
-Mensagem do usuário: "{user_message}"
-
-Documentos disponíveis (resumo):
-{json.dumps(documents, indent=2, ensure_ascii=False)[:1000]}...
-
 ESTRUTURA DO CONTRATO:
-{{
+{
   "partes": [
-    {{
+    {
       "nome": "string",
       "cpf_cnpj": "string",
       "rg": "string",
       "papel": "Vendedor/Comprador/etc",
       "data_nascimento": "string",
       "filiacao": ["pai", "mãe"]
-    }}
+    }
   ],
-  "imovel": {{
+  "imovel": {
     "endereco_completo": "string",
     "matricula": "string",
     "cidade": "string",
     "area_total": "string",
     "inscricao_municipal": "string"
-  }},
+  },
   "valor_monetario": 123.45,
   "forma_pagamento": "string",
+  "cronograma_financeiro": [
+    {"tipo": "string", "indice": "1/360", "valor": 123.45, "vencimento": "dd/mm/aaaa", "status": "string"}
+  ],
   "documentos_utilizados": ["doc1.pdf"],
   "pendencias": ["string"],
   "observacoes": "string"
-}}
+}
 
 EXEMPLOS DE INSTRUÇÕES DE EDIÇÃO:
 
@@ -114,6 +105,11 @@ EXEMPLOS DE INSTRUÇÕES DE EDIÇÃO:
    → new_value: "Vendedor"
    → description: "Alterar papel da primeira parte para Vendedor"
 
+9. "A terceira parcela vence dia 10/05/2025"
+   → path: "cronograma_financeiro[2].vencimento"
+   → new_value: "10/05/2025"
+   → description: "Alterar vencimento da terceira parcela para 10/05/2025"
+
 EXEMPLOS DE MENSAGENS QUE NÃO SÃO INSTRUÇÕES DE EDIÇÃO:
 - "Quais são os dados do vendedor?"
 - "Me explica o contrato"
@@ -127,57 +123,159 @@ REGRAS:
 - Use índices [0], [1], etc para acessar itens de arrays
 - new_value deve ter o tipo correto (string, número, etc)
 - description deve ser uma frase clara do que será alterado
+""" + REGRA_EDICAO_CRONOGRAMA + """
 
 Se for uma instrução de edição, retorne:
-{{
+{
   "is_edit_instruction": true,
-  "instruction": {{
+  "instruction": {
     "path": "campo.aninhado[indice].subcampo",
     "new_value": "valor ou número",
     "description": "Descrição clara da alteração"
-  }}
-}}
+  }
+}
 
 Se NÃO for uma instrução de edição, retorne:
-{{
+{
   "is_edit_instruction": false
-}}
+}
 """
 
+registro_prompts.registrar("deteccao_edicao", PROMPT_DETECCAO_EDICAO)
+
+
+async def detect_edit_instruction_async(user_message: str, documents: dict) -> dict:
+    """
+    Detecta se a mensagem é uma instrução de edição para QUALQUER campo do contrato.
+    Funciona ANTES do draft ser criado. Cancelável (client.aio).
+    """
+    print(f"\n🔍 Detectando instrução de edição...")
+    print(f"   Mensagem: {user_message}")
+
+    api_key = os.getenv("AI_API_KEY")
+    if not api_key:
+        raise RuntimeError("AI_API_KEY não encontrada")
+
+    client = genai.Client(api_key=api_key)
+    # Modo da sessão (orçamento) lido fora do event loop antes do roteador consultar
+    await contabilidade.carregar_async()
+
+    sufixo = _sufixo_deteccao(user_message, documents)
+    decisao = roteador.escolher(
+        "detect-edit",
+        padrao=MODELO_FORTE,
+        tokens=estimar_tokens(registro_prompts.prefixo("deteccao_edicao") + sufixo),
+    )
+
     try:
-        response = client.models.generate_content(
-            model="gemini-2.5-pro",
-            contents=prompt,
-            config={"response_mime_type": "application/json"},
+        response = await singleflight.executar_async(
+            chave_chamada("detect-edit", decisao.modelo, sufixo),
+            lambda: roteador.executar_async(
+                decisao,
+                lambda modelo: registro_prompts.gerar_async(
+                    client,
+                    modelo=modelo,
+                    nome="deteccao_edicao",
+                    conteudo=sufixo,
+                    config={"response_mime_type": "application/json"},
+                ),
+                validar=lambda r: _deteccao_valida(r.text),
+                hedge=True,
+            ),
         )
+        return _interpretar_deteccao(response.text)
 
-        result = json.loads(response.text)
-        
-        print(f"\n📊 Resultado da detecção:")
-        print(f"   É edição? {result.get('is_edit_instruction')}")
-        if result.get('instruction'):
-            print(f"   Path: {result['instruction'].get('path')}")
-            print(f"   Novo valor: {result['instruction'].get('new_value')}")
-            print(f"   Descrição: {result['instruction'].get('description')}")
-        
-        return result
-        
     except Exception as e:
         print(f"❌ Erro ao detectar instrução: {e}")
-        import traceback
-        traceback.print_exc()
         return {"is_edit_instruction": False, "error": str(e)}
 
 
+def _sufixo_deteccao(user_message: str, documents: dict) -> str:
+    # Só a mensagem e o resumo dos documentos mudam; o resto é o prefixo registrado
+    return f"""
+Mensagem do usuário: "{user_message}"
+
+Documentos disponíveis (resumo):
+{json_compacto(documents)[:1000]}...
+"""
+
+
+def _deteccao_valida(texto: Optional[str]) -> bool:
+    try:
+        result = json.loads(texto or "")
+    except json.JSONDecodeError:
+        return False
+    if not isinstance(result, dict) or "is_edit_instruction" not in result:
+        return False
+    if not result["is_edit_instruction"]:
+        return True
+    try:
+        UniversalInstruction.model_validate(result.get("instruction"))
+    except ValidationError:
+        return False
+    return True
+
+
+def _interpretar_deteccao(texto: str) -> dict:
+    result = json.loads(texto)
+
+    print(f"\n📊 Resultado da detecção:")
+    print(f"   É edição? {result.get('is_edit_instruction')}")
+    if result.get('instruction'):
+        print(f"   Path: {result['instruction'].get('path')}")
+        print(f"   Novo valor: {result['instruction'].get('new_value')}")
+        print(f"   Descrição: {result['instruction'].get('description')}")
+
+    return result
+
+
 # =========================
 # EDITAR DRAFT EXISTENTE (UNIVERSAL)
 # =========================
 
-def edit_contract_draft(draft: dict, user_message: str) -> UniversalInstruction:
+def resolver_edicao_local(draft: dict, user_message: str, chave_indice: Optional[str] = None):
+    """
+    Edição direta de um campo de uma parte, resolvida pelo índice de partes.
+    Retorna (instrução ou None, dica para o prompt quando a referência é ambígua).
+    """
+    pedido = interpretar_pedido(user_message)
+    if pedido is None:
+        return None, ""
+    indice = indice_do_draft(draft, chave_indice)
+    candidatos = indice.resolver(pedido.referencia)
+    if len(candidatos) == 1:
+        i = candidatos[0]
+        nome = (draft["partes"][i] or {}).get("nome") or f"parte {i + 1}"
+        print(f"🗂️ [EDIT] Alvo '{pedido.referencia}' resolvido localmente: partes[{i}]")
+        return UniversalInstruction(
+            path=f"partes[{i}].{pedido.campo}",
+            new_value=pedido.valor,
+            description=f"Alterar {ROTULOS[pedido.campo]} de {nome} para {pedido.valor}",
+        ), ""
+    if len(candidatos) > 1:
+        metricas_resolucao.registrar("ambiguas")
+        return None, f"""
+A referência "{pedido.referencia}" pode ser qualquer uma destas partes: {indice.descrever(candidatos)}.
+Use o restante da instrução e os dados dessas partes (sobrenome, papel, documentos) para decidir qual delas é o alvo.
+"""
+    return None, ""
+
+
+def edit_contract_draft(draft: dict, user_message: str, chave_indice: Optional[str] = None) -> UniversalInstruction:
     """
     Edita um draft JÁ EXISTENTE baseado na mensagem do usuário.
     Funciona para QUALQUER campo do contrato.
+
+    Pedidos diretos sobre uma parte ("muda o CPF da Maria para ...") são
+    resolvidos pelo índice local de partes; só o resto vai ao modelo.
+    chave_indice (id da sessão) mantém o índice entre edições.
     """
+    local, dica = resolver_edicao_local(draft, user_message, chave_indice)
+    if local is not None:
+        metricas_resolucao.registrar("local")
+        return local
+    metricas_resolucao.registrar("modelo")
+
     api_key = os.getenv("AI_API_KEY")
     if not api_key:
         raise RuntimeError("AI_API_KEY não encontrada")
@@ -187,28 +285,41 @@ def edit_contract_draft(draft: dict, user_message: str) -> UniversalInstruction:
     prompt = f"""
 Você está editando um RASCUNHO DE CONTRATO já consolidado.
 
-Draft atual (JSON):
-{json.dumps(draft, indent=2, ensure_ascii=False)}
+Draft atual (JSON; {EXPLICACAO_CRONOGRAMA}):
+{json_compacto(draft)}
 
 Instrução do usuário:
 "{user_message}"
-
+{dica}
 REGRAS:
 - Identifique QUAL campo o usuário quer alterar
 - Monte o path correto (ex: "partes[0].nome", "imovel.endereco_completo")
 - Extraia o novo valor que o usuário quer definir
 - Crie uma descrição clara da alteração
+{REGRA_EDICAO_CRONOGRAMA}
 
 Retorne APENAS o JSON da instrução, sem explicações.
 """
 
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt,
-        config={
-            "response_mime_type": "application/json",
-            "response_schema": UniversalInstruction,
-        },
+    decisao = roteador.escolher("edit", padrao=MODELO_RAPIDO, tokens=estimar_tokens(prompt))
+    response = singleflight.executar(
+        chave_chamada("edit", decisao.modelo, prompt, config=UniversalInstruction),
+        lambda: roteador.executar(
+            decisao,
+            lambda modelo, prazo: contabilidade.medir(
+                "edit", modelo,
+                lambda: client.models.generate_content(
+                    model=modelo,
+                    contents=prompt,
+                    config=config_com_prazo({
+                        "response_mime_type": "application/json",
+                        "response_schema": UniversalInstruction,
+                    }, prazo),
+                ),
+            ),
+            validar=lambda r: r.parsed is not None,
+            hedge=True,
+        ),
     )
 
     return response.parsed
@@ -0,0 +1,326 @@
+# entidades.py
+#
+# Resolução local de entidades (pré-passo da consolidação): a mesma pessoa
+# aparece no RG, CNH, certidões, comprovantes e matrícula com grafias um pouco
+# diferentes. Aqui agrupamos esses registros sem chamar o modelo, para que o
+# prompt de consolidação receba um conjunto já deduplicado.
+
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from schemas import Parte
+
+PARTICULAS = {"de", "da", "do", "das", "dos", "e", "d"}
+SUFIXOS = {"junior", "filho", "filha", "neto", "neta", "sobrinho", "segundo", "terceiro"}
+ABREVIACOES = {
+    "jr": "junior",
+    "jun": "junior",
+    "fo": "filho",
+    "fi": "filho",
+    "nt": "neto",
+}
+PAPEIS_CONTRATUAIS = ("vendedor", "comprador", "promitente", "cedente", "cessionario", "outorgante", "outorgado")
+
+CAMPOS_SIMPLES = ("cpf_cnpj", "rg", "data_nascimento", "estado_civil", "profissao", "endereco")
+
+
+# =========================
+# NORMALIZAÇÃO
+# =========================
+
+def sem_acentos(texto: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(c))
+
+
+def normalizar_cpf_cnpj(valor: Optional[str]) -> Optional[str]:
+    if not valor:
+        return None
+    digitos = re.sub(r"\D", "", str(valor))
+    return digitos or None
+
+
+@lru_cache(maxsize=8192)
+def normalizar_texto(valor: Optional[str]) -> str:
+    if not valor:
+        return ""
+    texto = sem_acentos(str(valor)).lower()
+    texto = re.sub(r"[^\w\s]", " ", texto)
+    return re.sub(r"\s+", " ", texto).strip()
+
+
+def tokens_nome(nome: Optional[str]) -> List[str]:
+    """'MARIA DA S. SOUZA JR.' -> ['maria', 's', 'souza', 'junior']"""
+    # "Mª" precisa ser tratado antes de remover acentos/pontuação
+    texto = (nome or "").replace("Mª", "Maria ").replace("mª", "maria ")
+    tokens = []
+    for token in normalizar_texto(texto).split():
+        token = ABREVIACOES.get(token, token) if len(token) <= 3 else token
+        if token not in PARTICULAS:
+            tokens.append(token)
+    return tokens
+
+
+def normalizar_nome(nome: Optional[str]) -> str:
+    return " ".join(tokens_nome(nome))
+
+
+def _sobrenome_chave(tokens: List[str]) -> Optional[str]:
+    for token in reversed(tokens[1:]):
+        if token not in SUFIXOS and len(token) > 1:
+            return token
+    return None
+
+
+def _sufixos(tokens: List[str]) -> List[str]:
+    return [token for token in tokens[1:] if token in SUFIXOS]
+
+
+def _sem_sufixos(tokens: List[str]) -> List[str]:
+    return tokens[:1] + [token for token in tokens[1:] if token not in SUFIXOS]
+
+
+def nomes_compativeis(a: List[str], b: List[str]) -> bool:
+    """
+    Todos os tokens do nome mais curto precisam aparecer, na mesma ordem, no
+    mais longo; iniciais ('s') casam com qualquer token que comece pela letra.
+    Sufixos geracionais diferentes ("João Silva" x "João Silva Filho") são
+    pessoas diferentes: pai e filho costumam aparecer nos mesmos documentos.
+    """
+    if not a or not b:
+        return False
+    if _sufixos(a) != _sufixos(b):
+        return False
+    curto, longo = (a, b) if len(a) <= len(b) else (b, a)
+    if curto[0] != longo[0]:
+        return False
+    j = 0
+    for token in curto:
+        while j < len(longo):
+            candidato = longo[j]
+            j += 1
+            if token == candidato or (len(token) == 1 and candidato.startswith(token)) or (
+                len(candidato) == 1 and token.startswith(candidato)
+            ):
+                break
+        else:
+            return False
+    return True
+
+
+# =========================
+# AGRUPAMENTO
+# =========================
+
+class _UniaoBusca:
+    def __init__(self, n: int):
+        self.pai = list(range(n))
+
+    def achar(self, i: int) -> int:
+        while self.pai[i] != i:
+            self.pai[i] = self.pai[self.pai[i]]
+            i = self.pai[i]
+        return i
+
+    def unir(self, a: int, b: int):
+        ra, rb = self.achar(a), self.achar(b)
+        if ra != rb:
+            self.pai[max(ra, rb)] = min(ra, rb)
+
+
+def _iterar_documentos(dados) -> Iterable[dict]:
+    """Cada arquivo do front traz uma lista de DocumentoUnificado (ou um só)."""
+    if isinstance(dados, list):
+        for item in dados:
+            yield from _iterar_documentos(item)
+    elif isinstance(dados, dict):
+        if "tipo_documento" in dados or "partes" in dados:
+            yield dados
+        elif "data" in dados:
+            yield from _iterar_documentos(dados["data"])
+    elif hasattr(dados, "model_dump"):
+        yield dados.model_dump()
+
+
+def _registros(documentos: dict) -> List[Tuple[str, dict]]:
+    registros = []
+    for nome_arquivo, dados in documentos.items():
+        for doc in _iterar_documentos(dados):
+            for parte in doc.get("partes") or []:
+                if hasattr(parte, "model_dump"):
+                    parte = parte.model_dump()
+                if parte.get("nome"):
+                    registros.append((nome_arquivo, parte))
+    return registros
+
+
+def _perfil(parte: dict, tokens: List[str]) -> dict:
+    return {
+        "cpf": normalizar_cpf_cnpj(parte.get("cpf_cnpj")),
+        "nascimento": normalizar_texto(parte.get("data_nascimento")),
+        "tokens": tokens,
+    }
+
+
+def _perfis_compativeis(a: dict, b: dict) -> bool:
+    if a["cpf"] and b["cpf"]:
+        return a["cpf"] == b["cpf"]
+    if a["nascimento"] and b["nascimento"] and a["nascimento"] != b["nascimento"]:
+        return False
+    return nomes_compativeis(a["tokens"], b["tokens"])
+
+
+def _juntar_perfis(a: dict, b: dict) -> dict:
+    return {
+        "cpf": a["cpf"] or b["cpf"],
+        "nascimento": a["nascimento"] or b["nascimento"],
+        "tokens": a["tokens"] if len(a["tokens"]) >= len(b["tokens"]) else b["tokens"],
+    }
+
+
+def agrupar_registros(registros: List[Tuple[str, dict]]) -> List[List[int]]:
+    """
+    Blocking indexado: só comparamos registros que compartilham CPF/CNPJ ou o par
+    (primeiro nome, último sobrenome). Assim o custo fica ~linear no número de
+    registros, em vez de comparar todos contra todos.
+
+    A comparação é feita contra o perfil acumulado de cada grupo (CPF, nascimento
+    e nome mais completo), para que um nome curto como "Maria Souza" não acabe
+    juntando "Maria Silva Souza" e "Maria Costa Souza" por transitividade.
+    """
+    tokens = [tokens_nome(parte.get("nome")) for _, parte in registros]
+    perfis = {i: _perfil(parte, tokens[i]) for i, (_, parte) in enumerate(registros)}
+    blocos: Dict[str, List[int]] = {}
+    for i, (_, parte) in enumerate(registros):
+        if perfis[i]["cpf"]:
+            blocos.setdefault(f"cpf:{perfis[i]['cpf']}", []).append(i)
+        if tokens[i]:
+            blocos.setdefault(f"nome:{tokens[i][0]}|{_sobrenome_chave(tokens[i])}", []).append(i)
+
+    uniao = _UniaoBusca(len(registros))
+    for membros in blocos.values():
+        for pos, i in enumerate(membros):
+            for j in membros[pos + 1:]:
+                ri, rj = uniao.achar(i), uniao.achar(j)
+                if ri != rj and _perfis_compativeis(perfis[ri], perfis[rj]):
+                    uniao.unir(ri, rj)
+                    perfis[uniao.achar(ri)] = _juntar_perfis(perfis[ri], perfis[rj])
+
+    grupos: Dict[int, List[int]] = {}
+    for i in range(len(registros)):
+        grupos.setdefault(uniao.achar(i), []).append(i)
+    return list(grupos.values())
+
+
+# =========================
+# MESCLAGEM
+# =========================
+
+def _escolher_papel(papeis: List[str]) -> str:
+    for papel in papeis:
+        normalizado = normalizar_texto(papel)
+        if any(p in normalizado for p in PAPEIS_CONTRATUAIS):
+            return papel
+    return papeis[0] if papeis else ""
+
+
+def _mesclar_grupo(registros: List[Tuple[str, dict]], pendencias: List[str]) -> Tuple[Parte, List[str]]:
+    # Nome mais completo (mais tokens; empate: o que tem acentuação)
+    nome = max({parte["nome"] for _, parte in registros}, key=lambda n: (len(tokens_nome(n)), n != sem_acentos(n), n))
+    mesclado = {"nome": nome}
+
+    for campo in CAMPOS_SIMPLES:
+        valores: Dict[str, Tuple[str, List[str]]] = {}
+        for arquivo, parte in registros:
+            valor = parte.get(campo)
+            if not valor:
+                continue
+            chave = normalizar_cpf_cnpj(valor) if campo in ("cpf_cnpj", "rg") else normalizar_texto(valor)
+            if chave not in valores:
+                valores[chave] = (valor, [])
+            valores[chave][1].append(arquivo)
+
+        if not valores:
+            mesclado[campo] = None if campo in ("cpf_cnpj", "rg", "data_nascimento") else ""
+            continue
+        # Em conflito, fica o valor com mais documentos a favor; o resto vira pendência
+        ordenados = sorted(valores.values(), key=lambda v: -len(v[1]))
+        mesclado[campo] = ordenados[0][0]
+        if len(ordenados) > 1:
+            opcoes = " x ".join(f"'{v}' ({', '.join(sorted(set(docs)))})" for v, docs in ordenados)
+            pendencias.append(f"Conflito em {campo} de {nome}: {opcoes}")
+
+    filiacao, vistos = [], set()
+    for _, parte in registros:
+        for pessoa in parte.get("filiacao") or []:
+            chave = normalizar_nome(pessoa)
+            if chave and chave not in vistos:
+                vistos.add(chave)
+                filiacao.append(pessoa)
+    mesclado["filiacao"] = filiacao
+    mesclado["papel"] = _escolher_papel([parte.get("papel") or "" for _, parte in registros if parte.get("papel")])
+
+    origens = sorted({arquivo for arquivo, _ in registros})
+    return Parte.model_validate(mesclado), origens
+
+
+def resolver_partes(documentos: dict) -> dict:
+    """
+    Deduplica as partes de todos os documentos extraídos.
+    Retorna {"partes": [Parte], "origens": [[arquivos]], "pendencias": [str]}.
+    """
+    registros = _registros(documentos)
+    pendencias: List[str] = []
+    partes, origens = [], []
+    for grupo in agrupar_registros(registros):
+        parte, arquivos = _mesclar_grupo([registros[i] for i in grupo], pendencias)
+        partes.append(parte)
+        origens.append(arquivos)
+    pendencias.extend(_pendencias_sufixo(partes))
+    return {"partes": partes, "origens": origens, "pendencias": pendencias}
+
+
+def _pendencias_sufixo(partes: List[Parte]) -> List[str]:
+    """
+    Partes mantidas separadas só pelo sufixo (sem CPF que as distinga) podem
+    ser a mesma pessoa com o "Filho" omitido em um documento: quem decide é o usuário.
+    """
+    blocos: Dict[str, List[Tuple[Parte, List[str]]]] = {}
+    for parte in partes:
+        tokens = tokens_nome(parte.nome)
+        if tokens:
+            blocos.setdefault(f"{tokens[0]}|{_sobrenome_chave(tokens)}", []).append((parte, tokens))
+
+    pendencias = []
+    for membros in blocos.values():
+        for pos, (a, tokens_a) in enumerate(membros):
+            for b, tokens_b in membros[pos + 1:]:
+                cpf_a, cpf_b = normalizar_cpf_cnpj(a.cpf_cnpj), normalizar_cpf_cnpj(b.cpf_cnpj)
+                if cpf_a and cpf_b and cpf_a != cpf_b:
+                    continue
+                if _sufixos(tokens_a) != _sufixos(tokens_b) and nomes_compativeis(_sem_sufixos(tokens_a), _sem_sufixos(tokens_b)):
+                    pendencias.append(f"Confirmar se '{a.nome}' e '{b.nome}' são pessoas diferentes (sufixo no nome diverge)")
+    return pendencias
+
+
+def compactar_para_consolidacao(documentos: dict) -> dict:
+    """
+    Payload enviado ao modelo: partes já deduplicadas uma única vez e os
+    documentos sem as listas de partes repetidas.
+    """
+    resolucao = resolver_partes(documentos)
+    compactos = {}
+    for nome_arquivo, dados in documentos.items():
+        compactos[nome_arquivo] = [
+            {chave: valor for chave, valor in doc.items() if chave != "partes"}
+            for doc in _iterar_documentos(dados)
+        ]
+    return {
+        "partes_consolidadas": [
+            {**parte.model_dump(exclude_none=True), "documentos": arquivos}
+            for parte, arquivos in zip(resolucao["partes"], resolucao["origens"])
+        ],
+        "pendencias_identificacao": resolucao["pendencias"],
+        "documentos": compactos,
+    }
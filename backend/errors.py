@@ -7,8 +7,9 @@ class AppError(HTTPException):
         error_code: str,
         user_message: str,
         message: str | None = None,
+        headers: dict | None = None,
     ):
-        super().__init__(status_code=status_code, detail=message)
+        super().__init__(status_code=status_code, detail=message, headers=headers)
         self.error_code = error_code
         self.user_message = user_message
 
@@ -46,3 +47,44 @@ class InvalidUserInputError(AppError):
             error_code="INVALID_INPUT",
             user_message=user_message,
         )
+
+
+class ClientDisconnectedError(AppError):
+    def __init__(self, operation: str):
+        super().__init__(
+            status_code=499,
+            error_code="CLIENT_DISCONNECTED",
+            user_message="A requisição foi cancelada.",
+            message=f"Cliente desconectou durante {operation}",
+        )
+
+
+class DeadlineExceededError(AppError):
+    def __init__(self, operation: str):
+        super().__init__(
+            status_code=504,
+            error_code="DEADLINE_EXCEEDED",
+            user_message="A IA demorou mais do que o esperado para responder. Tente novamente.",
+            message=f"Prazo esgotado em {operation}",
+        )
+
+
+class ServiceOverloadedError(AppError):
+    def __init__(self, retry_after: int):
+        super().__init__(
+            status_code=503,
+            error_code="SERVICE_OVERLOADED",
+            user_message="Estamos com muitas solicitações no momento. Tente novamente em instantes.",
+            message="Fila de processamento cheia",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class SessionBudgetExceededError(AppError):
+    def __init__(self):
+        super().__init__(
+            status_code=429,
+            error_code="SESSION_BUDGET_EXCEEDED",
+            user_message="Esta sessão atingiu o limite de uso da IA. Inicie uma nova sessão ou fale com o suporte.",
+            message="Orçamento de tokens da sessão esgotado",
+        )
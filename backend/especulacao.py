@@ -0,0 +1,138 @@
+# especulacao.py
+#
+# Consolidação especulativa do draft: assim que o conjunto de documentos de
+# uma sessão para de mudar (debounce após o último OCR), a consolidação roda
+# em segundo plano e o resultado fica no cache pelo hash do conjunto. Quando o
+# usuário pede o /api/draft, o draft base já está pronto (ou em andamento, e a
+# requisição só espera a mesma execução). As instruções pendentes continuam
+# sendo aplicadas na hora da requisição.
+
+import asyncio
+import os
+import threading
+from typing import Dict, Optional
+
+from cache import obter_cache
+from consumo import sessao_da_requisicao
+from draft import (
+    CONSOLIDACAO_TTL,
+    EstadoConsolidacao,
+    carregar_consolidacao,
+    consolidar_documentos,
+    hash_conjunto,
+    salvar_consolidacao,
+)
+from executores import executar_em
+from prazos import prazo_da_requisicao
+
+DEBOUNCE_SEGUNDOS = float(os.getenv("CONSOLIDACAO_DEBOUNCE", "4"))
+
+
+def carregar_por_conjunto(hash_: str) -> Optional[EstadoConsolidacao]:
+    dados = obter_cache().get_json(f"consolidacao_conjunto:{hash_}")
+    return EstadoConsolidacao.model_validate(dados) if dados else None
+
+
+def salvar_por_conjunto(hash_: str, estado: EstadoConsolidacao) -> None:
+    obter_cache().set_json(f"consolidacao_conjunto:{hash_}", estado, ttl=CONSOLIDACAO_TTL)
+
+
+class MetricasEspeculacao:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.agendadas = 0
+        self.reagendadas = 0
+        self.executadas = 0
+        self.falhas = 0
+        self.prontas_no_pedido = 0
+        self.em_andamento_no_pedido = 0
+        self.sem_especulacao = 0
+
+    def registrar(self, campo: str) -> None:
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + 1)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            pedidos = self.prontas_no_pedido + self.em_andamento_no_pedido + self.sem_especulacao
+            return {
+                "agendadas": self.agendadas,
+                "reagendadas": self.reagendadas,
+                "executadas": self.executadas,
+                "falhas": self.falhas,
+                "pedidos": {
+                    "draft_pronto": self.prontas_no_pedido,
+                    "aguardou_execucao_em_andamento": self.em_andamento_no_pedido,
+                    "consolidou_na_hora": self.sem_especulacao,
+                },
+                "taxa_acerto": round((self.prontas_no_pedido + self.em_andamento_no_pedido) / pedidos, 4) if pedidos else None,
+            }
+
+
+class ConsolidacaoEspeculativa:
+    def __init__(self, debounce: float = DEBOUNCE_SEGUNDOS):
+        self.debounce = debounce
+        self.metricas = MetricasEspeculacao()
+        self._agendadas: Dict[str, asyncio.Task] = {}   # por sessão, ainda no debounce
+        self._em_curso: Dict[str, asyncio.Task] = {}    # por hash do conjunto
+
+    def agendar(self, session_id: str, documentos: dict) -> None:
+        """Reinicia o debounce da sessão com o conjunto de documentos atual."""
+        anterior = self._agendadas.pop(session_id, None)
+        if anterior is not None and not anterior.done():
+            anterior.cancel()
+            self.metricas.registrar("reagendadas")
+        else:
+            self.metricas.registrar("agendadas")
+        self._agendadas[session_id] = asyncio.create_task(self._apos_debounce(session_id, dict(documentos)))
+
+    async def _apos_debounce(self, session_id: str, documentos: dict) -> None:
+        await asyncio.sleep(self.debounce)
+        # A partir daqui um novo upload não cancela mais esta execução
+        if self._agendadas.get(session_id) is asyncio.current_task():
+            del self._agendadas[session_id]
+        print(f"🔮 [ESPECULAÇÃO] Consolidando {len(documentos)} documento(s) da sessão {session_id} em segundo plano")
+        try:
+            await self.consolidar(session_id, documentos)
+        except Exception as e:
+            # Fila cheia, cota, prazo... o /api/draft consolida na hora
+            self.metricas.registrar("falhas")
+            print(f"⚠️ [ESPECULAÇÃO] Consolidação da sessão {session_id} falhou: {e}")
+
+    def consolidar(self, session_id: Optional[str], documentos: dict) -> "asyncio.Future[EstadoConsolidacao]":
+        """Uma única execução por conjunto de documentos, compartilhada por quem pedir."""
+        hash_ = hash_conjunto(documentos)
+        tarefa = self._em_curso.get(hash_)
+        if tarefa is None:
+            tarefa = asyncio.create_task(self._executar(hash_, session_id, documentos))
+            self._em_curso[hash_] = tarefa
+            tarefa.add_done_callback(lambda _: self._em_curso.pop(hash_, None))
+        return tarefa
+
+    async def _executar(self, hash_: str, session_id: Optional[str], documentos: dict) -> EstadoConsolidacao:
+        estado = await executar_em("interativo", carregar_por_conjunto, hash_)
+        if estado is None:
+            # Tokens da consolidação em segundo plano contam para a sessão que a disparou
+            with sessao_da_requisicao(session_id), prazo_da_requisicao("draft"):
+                anterior = await executar_em("interativo", carregar_consolidacao, session_id) if session_id else None
+                estado = await executar_em("consolidacao", consolidar_documentos, documentos, anterior)
+            await executar_em("interativo", salvar_por_conjunto, hash_, estado)
+            self.metricas.registrar("executadas")
+        if session_id:
+            await executar_em("interativo", salvar_consolidacao, session_id, estado)
+        return estado
+
+    async def obter(self, session_id: Optional[str], documentos: dict) -> EstadoConsolidacao:
+        """Draft base para o /api/draft: pronto no cache, em andamento, ou consolidado agora."""
+        hash_ = hash_conjunto(documentos)
+        if hash_ in self._em_curso:
+            self.metricas.registrar("em_andamento_no_pedido")
+        elif await executar_em("interativo", carregar_por_conjunto, hash_) is not None:
+            self.metricas.registrar("prontas_no_pedido")
+        else:
+            self.metricas.registrar("sem_especulacao")
+        # shield: se o pedido for cancelado, a execução compartilhada continua
+        return await asyncio.shield(self.consolidar(session_id, documentos))
+
+
+consolidacao_especulativa = ConsolidacaoEspeculativa()
@@ -0,0 +1,218 @@
+# executores.py
+#
+# Executores dedicados por classe de carga, em vez do executor padrão do
+# asyncio compartilhado por tudo (asyncio.to_thread). Uma rajada de OCR não
+# pode ocupar as threads que o chat e o detect-edit precisam.
+#
+# Cada classe tem um número fixo de workers e uma fila limitada. Com a fila
+# cheia, a requisição é recusada na hora com 503 + Retry-After, em vez de
+# esperar indefinidamente.
+
+import asyncio
+import contextlib
+import contextvars
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, Callable, Deque, Dict, Optional, TypeVar
+
+from errors import ServiceOverloadedError
+
+T = TypeVar("T")
+
+JANELA_ESPERAS = 500
+
+
+def _env_int(nome: str, padrao: int) -> int:
+    try:
+        return int(os.getenv(nome, padrao))
+    except ValueError:
+        return padrao
+
+
+class ClasseDeCarga:
+    """
+    Pool (threads ou processos) + fila limitada. A fila fica do lado do event
+    loop (semáforo), então o tempo de espera é medido igual para os dois tipos
+    de pool e nada fica esquecido dentro da fila interna do executor.
+    """
+
+    def __init__(self, nome: str, workers: int, max_fila: int, processos: bool = False):
+        self.nome = nome
+        self.workers = workers
+        self.max_fila = max_fila
+        self.processos = processos
+        self._pool: Optional[Executor] = None
+        self._pool_lock = threading.Lock()
+        self._semaforo: Optional[asyncio.Semaphore] = None
+
+        self.na_fila = 0
+        self.ativos = 0
+        self.concluidas = 0
+        self.rejeitadas = 0
+        self._esperas: Deque[float] = deque(maxlen=JANELA_ESPERAS)
+        self._duracoes: Deque[float] = deque(maxlen=JANELA_ESPERAS)
+
+    def _obter_pool(self) -> Executor:
+        # Criado só no primeiro uso: importar main.py não sobe processos
+        with self._pool_lock:
+            if self._pool is None:
+                if self.processos:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                else:
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.nome)
+            return self._pool
+
+    def _retry_after(self) -> int:
+        duracao_media = sum(self._duracoes) / len(self._duracoes) if self._duracoes else 1.0
+        return max(1, math.ceil(duracao_media * (self.na_fila + self.ativos) / self.workers))
+
+    async def _admitir(self) -> None:
+        """Entra na fila (ou recusa com 503 se ela estiver cheia) e espera um slot."""
+        if self._semaforo is None:
+            self._semaforo = asyncio.Semaphore(self.workers)
+        if self.na_fila >= self.max_fila:
+            self.rejeitadas += 1
+            print(f"🚦 [EXECUTOR] {self.nome}: fila cheia ({self.na_fila}), recusando")
+            raise ServiceOverloadedError(self._retry_after())
+
+        self.na_fila += 1
+        entrada = time.monotonic()
+        try:
+            await self._semaforo.acquire()
+        finally:
+            self.na_fila -= 1
+        self._esperas.append(time.monotonic() - entrada)
+        self.ativos += 1
+
+    def _liberar(self, inicio: float) -> None:
+        self.ativos -= 1
+        self.concluidas += 1
+        self._duracoes.append(time.monotonic() - inicio)
+        self._semaforo.release()
+
+    def _submeter(self, func: Callable[..., T], *args, **kwargs):
+        chamada = partial(func, *args, **kwargs)
+        if not self.processos:
+            # Threads herdam o contexto (prazo da requisição etc.), como no to_thread
+            chamada = partial(contextvars.copy_context().run, chamada)
+        return self._obter_pool().submit(chamada)
+
+    async def executar(self, func: Callable[..., T], *args, **kwargs) -> T:
+        await self._admitir()
+        loop = asyncio.get_running_loop()
+        inicio = time.monotonic()
+        try:
+            futuro = self._submeter(func, *args, **kwargs)
+        except Exception:
+            self._liberar(inicio)
+            raise
+
+        # O slot só volta quando o trabalho termina de fato no pool, mesmo que
+        # quem esperava tenha sido cancelado (uma thread não é interrompível)
+        futuro.add_done_callback(lambda _: loop.call_soon_threadsafe(self._liberar, inicio))
+        return await asyncio.wrap_future(futuro)
+
+    @contextlib.asynccontextmanager
+    async def vaga(self) -> AsyncIterator["Vaga"]:
+        """
+        Ocupa um slot da classe durante um trabalho assíncrono inteiro (upload +
+        chamada ao modelo, por exemplo), com a mesma fila e o mesmo 503 de
+        executar(). O trabalho bloqueante feito dentro da vaga usa Vaga.executar
+        (ou executar_na_vaga_ou_em, nos módulos que não recebem a vaga), que não
+        disputa um segundo slot: com todos ocupados, isso travaria.
+        """
+        await self._admitir()
+        inicio = time.monotonic()
+        vaga = Vaga(self)
+        token = _vaga_atual.set(vaga)
+        try:
+            yield vaga
+        finally:
+            _vaga_atual.reset(token)
+            self._liberar(inicio)
+
+    def snapshot(self) -> dict:
+        esperas = sorted(self._esperas)
+
+        def pct(p):
+            return round(esperas[min(len(esperas) - 1, int(p / 100 * len(esperas)))], 4) if esperas else None
+
+        return {
+            "tipo": "processos" if self.processos else "threads",
+            "workers": self.workers,
+            "max_fila": self.max_fila,
+            "ativos": self.ativos,
+            "na_fila": self.na_fila,
+            "concluidas": self.concluidas,
+            "rejeitadas": self.rejeitadas,
+            "espera_p50_s": pct(50),
+            "espera_p99_s": pct(99),
+        }
+
+
+class Vaga:
+    def __init__(self, classe: ClasseDeCarga):
+        self._classe = classe
+
+    async def executar(self, func: Callable[..., T], *args, **kwargs) -> T:
+        # O pool tem um worker por slot, e a vaga já é um deles
+        return await asyncio.wrap_future(self._classe._submeter(func, *args, **kwargs))
+
+
+# Vaga ocupada pela tarefa atual (e pelas que ela cria), para o I/O auxiliar
+_vaga_atual: contextvars.ContextVar[Optional[Vaga]] = contextvars.ContextVar("vaga_atual", default=None)
+
+
+_CPUS = os.cpu_count() or 2
+
+executores: Dict[str, ClasseDeCarga] = {
+    # Chamadas ao modelo do chat, detect-edit, edit e canal WebSocket
+    "interativo": ClasseDeCarga(
+        "interativo", _env_int("EXECUTOR_INTERATIVO_WORKERS", 16), _env_int("EXECUTOR_INTERATIVO_FILA", 64)
+    ),
+    # Extração de OCR inteira (leitura, upload e chamada ao modelo) e hash dos uploads
+    "ocr": ClasseDeCarga("ocr", _env_int("EXECUTOR_OCR_WORKERS", 8), _env_int("EXECUTOR_OCR_FILA", 32)),
+    # Consolidação do draft (chamadas longas ao modelo)
+    "consolidacao": ClasseDeCarga(
+        "consolidacao", _env_int("EXECUTOR_CONSOLIDACAO_WORKERS", 4), _env_int("EXECUTOR_CONSOLIDACAO_FILA", 16)
+    ),
+    # Geração do contrato: chamada ao modelo + montagem do .docx
+    "contrato": ClasseDeCarga(
+        "contrato", _env_int("EXECUTOR_CONTRATO_WORKERS", 4), _env_int("EXECUTOR_CONTRATO_FILA", 8)
+    ),
+    # CPU pura (parse de .docx), em processos para não disputar o GIL com o event loop
+    "cpu": ClasseDeCarga(
+        "cpu", _env_int("EXECUTOR_CPU_WORKERS", _CPUS), _env_int("EXECUTOR_CPU_FILA", 4 * _CPUS), processos=True
+    ),
+}
+
+
+async def executar_em(classe: str, func: Callable[..., T], *args, **kwargs) -> T:
+    """Substituto de asyncio.to_thread que respeita a classe de carga."""
+    return await executores[classe].executar(func, *args, **kwargs)
+
+
+async def executar_na_vaga_ou_em(classe: str, func: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Para I/O curto no meio de outro trabalho (cache de handles, contadores de
+    consumo): dentro de uma vaga (ex.: extração de OCR), roda nela mesma em vez
+    de disputar a fila de outra classe; fora dela, é o executar_em(classe).
+    """
+    vaga = _vaga_atual.get()
+    if vaga is not None:
+        return await vaga.executar(func, *args, **kwargs)
+    return await executar_em(classe, func, *args, **kwargs)
+
+
+def vaga_em(classe: str):
+    """async with vaga_em("ocr") as vaga: ... — slot da classe para um trabalho assíncrono inteiro."""
+    return executores[classe].vaga()
+
+
+def metricas_executores() -> dict:
+    return {nome: classe.snapshot() for nome, classe in executores.items()}
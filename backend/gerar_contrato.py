@@ -1,15 +1,26 @@
-import os
+import io
 import re
-import json
+import queue
+import threading
+import zipfile
+from functools import lru_cache
 from pathlib import Path
-from typing import Literal, Optional
+from typing import Dict, Iterator, Literal, Optional
 
 from docx import Document
+from docx.opc.packuri import CONTENT_TYPES_URI, PACKAGE_URI
+from docx.opc.part import XmlPart
+from docx.opc.pkgwriter import _ContentTypesItem
 from docx.shared import Pt
 from docx.enum.text import WD_ALIGN_PARAGRAPH
+from lxml import etree
 
-import google.generativeai as genai
+from google import genai
 from dotenv import load_dotenv
+from cronograma import EXPLICACAO_CRONOGRAMA, json_compacto
+from prazos import config_com_prazo, prazo_restante
+from prompts import registro_prompts
+from singleflight import chave_chamada, singleflight
 load_dotenv()
 
 
@@ -25,95 +36,7 @@ TEMPLATE_MAP: dict[str, str] = {
 }
 
 
-def limpa_marcacoes(texto: str) -> str:
-    return texto.replace("**", "").replace("--", "—")
-
-
-def separar_assinaturas(texto: str):
-    padrao = re.compile(
-        r'<<<ASSINATURAS_INICIO>>>(.*?)<<<ASSINATURAS_FIM>>>',
-        flags=re.DOTALL | re.IGNORECASE
-    )
-    m = padrao.search(texto)
-
-    if not m:
-        return texto.strip(), ""
-
-    assinaturas = m.group(1).strip()
-    corpo = (texto[:m.start()] + texto[m.end():]).strip()
-    return corpo, assinaturas
-
-
-def add_paragrafos(doc: Document, texto: str):
-    padrao_clausula = re.compile(r'^CLÁUSULA\s+[A-ZÀ-Ú]+\s*[–—-]\s*.+', re.IGNORECASE)
-    padrao_paragrafo = re.compile(r'^PARÁGRAFO\s+[A-ZÀ-Ú]+[:.]?', re.IGNORECASE)
-
-    for line in texto.split("\n"):
-        line = line.rstrip()
-
-        if not line:
-            doc.add_paragraph("")
-            continue
-
-        p = doc.add_paragraph("")
-
-        if padrao_clausula.match(line):
-            run = p.add_run(line)
-            run.bold = True
-            run.font.size = Pt(12)
-
-        elif padrao_paragrafo.match(line):
-            match = padrao_paragrafo.match(line)
-            titulo = match.group(0)
-            resto = line[len(titulo):].strip()
-
-            rt = p.add_run(titulo + " ")
-            rt.bold = True
-            rt.font.size = Pt(12)
-
-            if resto:
-                rr = p.add_run(resto)
-                rr.font.size = Pt(12)
-
-        else:
-            run = p.add_run(line)
-            run.font.size = Pt(12)
-
-        p.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
-
-
-def gerar_contrato_docx_bytes(
-    *,
-    draft: dict,
-    template_key: TemplateKey,
-    api_key: str,
-    model_name: str = "gemini-2.5-pro",
-    extra_text: str = "",
-) -> bytes:
-    if template_key not in TEMPLATE_MAP:
-        raise ValueError(f"Template inválido: {template_key}")
-
-    template_path = TEMPLATES_DIR / TEMPLATE_MAP[template_key]
-    if not template_path.exists():
-        raise FileNotFoundError(f"Template não encontrado: {template_path}")
-
-    # Lê o layout do template para o Gemini preservar títulos/estrutura
-    layout_text = "\n".join([p.text for p in Document(template_path).paragraphs])
-
-    draft_json = json.dumps(draft, ensure_ascii=False)
-
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel(
-        model_name=model_name,
-        generation_config={
-            "temperature": 0,
-            "top_p": 0.95,
-            "top_k": 40,
-            "max_output_tokens": 18000,
-        },
-    )
-
-    prompt = f"""
+REGRAS_CONTRATO = """
 Você é um assistente jurídico especializado em contratos imobiliários.
 
 Tarefa:
@@ -250,16 +173,9 @@ ATENÇÃO:
 NUNCA escreva títulos antes do Quadro Resumo.
 A única fonte válida de títulos é o layout fornecido.
 Se o pré-contrato contiver qualquer título, ignore.
+"""
 
-DADOS ESTRUTURADOS (DRAFT) — USE COMO FONTE DA VERDADE:
-{draft_json}
-
-TEXTO ADICIONAL DO USUÁRIO (opcional):
-{extra_text}
-
-LAYOUT DE REFERÊNCIA (Títulos/estrutura):
-{layout_text}
-
+REGRAS_FINAIS_CONTRATO = """
 IMPORTANTE:
 - Se faltar algo, mantenha a seção no contrato e sinalize como "[PENDENTE: ...]" no corpo da cláusula correspondente.
 - NÃO invente dados.
@@ -268,7 +184,148 @@ IMPORTANTE:
 - Use <<<ASSINATURAS_INICIO>>> e <<<ASSINATURAS_FIM>>> envolvendo o bloco de assinaturas.
 """
 
-    resposta = model.generate_content(prompt)
+
+GENERATION_CONFIG = {
+    "temperature": 0,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 18000,
+}
+
+
+@lru_cache(maxsize=16)
+def _layout_template(template_path: Path, mtime: float) -> str:
+    # Lê o layout do template para o Gemini preservar títulos/estrutura
+    return "\n".join([p.text for p in Document(template_path).paragraphs])
+
+
+def registrar_prompt_contrato(template_key: str, template_path: Path) -> str:
+    """Registra (ou reaproveita) o prefixo fixo do template e devolve o nome no registro."""
+    layout_text = _layout_template(template_path, template_path.stat().st_mtime)
+    nome = f"contrato:{template_key}"
+    registro_prompts.registrar(
+        nome,
+        f"{REGRAS_CONTRATO}\nLAYOUT DE REFERÊNCIA (Títulos/estrutura):\n{layout_text}\n{REGRAS_FINAIS_CONTRATO}",
+    )
+    return nome
+
+
+def limpa_marcacoes(texto: str) -> str:
+    return texto.replace("**", "").replace("--", "—")
+
+
+def separar_assinaturas(texto: str):
+    padrao = re.compile(
+        r'<<<ASSINATURAS_INICIO>>>(.*?)<<<ASSINATURAS_FIM>>>',
+        flags=re.DOTALL | re.IGNORECASE
+    )
+    m = padrao.search(texto)
+
+    if not m:
+        return texto.strip(), ""
+
+    assinaturas = m.group(1).strip()
+    corpo = (texto[:m.start()] + texto[m.end():]).strip()
+    return corpo, assinaturas
+
+
+def add_paragrafos(doc: Document, texto: str):
+    padrao_clausula = re.compile(r'^CLÁUSULA\s+[A-ZÀ-Ú]+\s*[–—-]\s*.+', re.IGNORECASE)
+    padrao_paragrafo = re.compile(r'^PARÁGRAFO\s+[A-ZÀ-Ú]+[:.]?', re.IGNORECASE)
+
+    for line in texto.split("\n"):
+        line = line.rstrip()
+
+        if not line:
+            doc.add_paragraph("")
+            continue
+
+        p = doc.add_paragraph("")
+
+        if padrao_clausula.match(line):
+            run = p.add_run(line)
+            run.bold = True
+            run.font.size = Pt(12)
+
+        elif padrao_paragrafo.match(line):
+            match = padrao_paragrafo.match(line)
+            titulo = match.group(0)
+            resto = line[len(titulo):].strip()
+
+            rt = p.add_run(titulo + " ")
+            rt.bold = True
+            rt.font.size = Pt(12)
+
+            if resto:
+                rr = p.add_run(resto)
+                rr.font.size = Pt(12)
+
+        else:
+            run = p.add_run(line)
+            run.font.size = Pt(12)
+
+        p.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
+
+
+def montar_sufixo_contrato(draft: dict, extra_text: str = "") -> str:
+    """
+    Parte variável do prompt: o draft (partes, cronograma compacto, dados para
+    as assinaturas) e o texto extra. Não depende do template, então a geração
+    de vários templates do mesmo negócio serializa o draft uma vez só.
+    """
+    return f"""
+DADOS ESTRUTURADOS (DRAFT) — USE COMO FONTE DA VERDADE:
+{json_compacto(draft)}
+
+{EXPLICACAO_CRONOGRAMA} No contrato, escreva cada parcela de cada série individualmente, no formato das regras de parcelas.
+
+TEXTO ADICIONAL DO USUÁRIO (opcional):
+{extra_text}
+"""
+
+
+def montar_contrato_docx(
+    *,
+    draft: dict,
+    template_key: TemplateKey,
+    api_key: str,
+    model_name: str = "gemini-2.5-pro",
+    extra_text: str = "",
+    sufixo: Optional[str] = None,
+    client: Optional[genai.Client] = None,
+) -> Document:
+    """
+    Gera o texto do contrato com o Gemini e monta o Document final sobre o template.
+    A serialização fica a cargo de quem chama (iterar_docx ou gerar_contrato_docx_bytes).
+    sufixo/client permitem reaproveitar o draft serializado e o client entre templates.
+    """
+    if template_key not in TEMPLATE_MAP:
+        raise ValueError(f"Template inválido: {template_key}")
+
+    template_path = TEMPLATES_DIR / TEMPLATE_MAP[template_key]
+    if not template_path.exists():
+        raise FileNotFoundError(f"Template não encontrado: {template_path}")
+
+    if sufixo is None:
+        sufixo = montar_sufixo_contrato(draft, extra_text)
+
+    client = client or genai.Client(api_key=api_key)
+
+    # Regras + layout do template formam o prefixo fixo (registrado no context
+    # caching por template); só o draft e o texto extra variam por chamada
+    nome_prompt = registrar_prompt_contrato(template_key, template_path)
+
+    # Só o texto gerado é compartilhado entre pedidos idênticos; cada um monta o próprio .docx
+    resposta = singleflight.executar(
+        chave_chamada("contrato", model_name, nome_prompt, sufixo, config=GENERATION_CONFIG),
+        lambda: registro_prompts.gerar(
+            client,
+            modelo=model_name,
+            nome=nome_prompt,
+            conteudo=sufixo,
+            config=config_com_prazo(GENERATION_CONFIG, prazo_restante()),
+        ),
+    )
     conteudo = limpa_marcacoes((resposta.text or "").strip())
 
     corpo, assinaturas = separar_assinaturas(conteudo)
@@ -286,7 +343,10 @@ IMPORTANTE:
 
     corpo = re.sub(r"\n{3,}", "\n\n", corpo).strip()
 
-    # Monta doc final
+    return montar_documento_final(template_path, corpo, assinaturas)
+
+
+def montar_documento_final(template_path: Path, corpo: str, assinaturas: str) -> Document:
     modelo = Document(template_path)
 
     insert_index = None
@@ -307,8 +367,152 @@ IMPORTANTE:
         modelo.add_paragraph("")
         add_paragrafos(modelo, assinaturas)
 
-    # salva em memória (bytes)
-    import io
+    return modelo
+
+
+# =========================
+# SERIALIZAÇÃO EM STREAMING
+# =========================
+
+class _EscritaCancelada(Exception):
+    pass
+
+
+class _SaidaEmBlocos:
+    """
+    Arquivo somente-escrita e não pesquisável: o zipfile passa a gravar cada part
+    com data descriptor, sem voltar no arquivo. Os bytes são agrupados em blocos
+    e entregues por uma fila limitada, o que segura o produtor quando o cliente
+    consome devagar.
+    """
+
+    def __init__(self, tamanho_bloco: int, max_blocos: int):
+        self.tamanho_bloco = tamanho_bloco
+        self.fila: queue.Queue = queue.Queue(maxsize=max_blocos)
+        self.cancelado = threading.Event()
+        self._buffer = bytearray()
+        self._abortado = False
+
+    def write(self, dados) -> int:
+        if self._abortado:
+            # O zipfile ainda tenta fechar o arquivo ao ser coletado; descarta em silêncio
+            return len(dados)
+        self._buffer += dados
+        if len(self._buffer) >= self.tamanho_bloco:
+            self._entregar(bytes(self._buffer))
+            self._buffer.clear()
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def fechar(self):
+        if self._buffer:
+            self._entregar(bytes(self._buffer))
+            self._buffer.clear()
+
+    def _entregar(self, item):
+        while True:
+            if self.cancelado.is_set():
+                self._abortado = True
+                raise _EscritaCancelada()
+            try:
+                self.fila.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+
+_FIM = object()
+
+
+def _salvar_pacote_em_streaming(modelo: Document, saida) -> None:
+    """
+    Equivalente ao Document.save, mas cada XmlPart é serializada direto no zip
+    (via lxml), sem montar o blob inteiro do document.xml em memória antes.
+    Segue a mesma ordem do PackageWriter do python-docx.
+    """
+    pacote = modelo.part.package
+    partes = list(pacote.iter_parts())
+    for parte in partes:
+        parte.before_marshal()
+
+    with zipfile.ZipFile(saida, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(CONTENT_TYPES_URI.membername, _ContentTypesItem.from_parts(partes).blob)
+        zf.writestr(PACKAGE_URI.rels_uri.membername, pacote.rels.xml)
+        for parte in partes:
+            if isinstance(parte, XmlPart):
+                with zf.open(parte.partname.membername, "w") as destino:
+                    etree.ElementTree(parte.element).write(
+                        destino, encoding="UTF-8", xml_declaration=True, standalone=True
+                    )
+            else:
+                zf.writestr(parte.partname.membername, parte.blob)
+            if len(parte.rels):
+                zf.writestr(parte.partname.rels_uri.membername, parte.rels.xml)
+
+
+def iterar_docx(modelo: Document, tamanho_bloco: int = 64 * 1024, max_blocos: int = 4) -> Iterator[bytes]:
+    """
+    Serializa o documento como um gerador de blocos do pacote zip, à medida que
+    as parts vão sendo comprimidas. A memória por contrato fica limitada a
+    ~tamanho_bloco * max_blocos, em vez de várias cópias do .docx inteiro.
+    """
+    saida = _SaidaEmBlocos(tamanho_bloco, max_blocos)
+    erro: list[BaseException] = []
+
+    def produzir():
+        try:
+            _salvar_pacote_em_streaming(modelo, saida)
+            saida.fechar()
+        except _EscritaCancelada:
+            return
+        except BaseException as e:  # repassado ao consumidor
+            erro.append(e)
+        try:
+            saida._entregar(_FIM)
+        except _EscritaCancelada:
+            pass
+
+    produtor = threading.Thread(target=produzir, name="docx-stream", daemon=True)
+    produtor.start()
+    try:
+        while True:
+            bloco = saida.fila.get()
+            if bloco is _FIM:
+                break
+            yield bloco
+        if erro:
+            raise erro[0]
+    finally:
+        # Cliente desconectou (ou terminamos): libera o produtor se ele estiver bloqueado
+        saida.cancelado.set()
+        produtor.join(timeout=5)
+
+
+def gerar_contrato_docx_bytes(**kwargs) -> bytes:
+    """Versão em memória, mantida para quem precisa do .docx inteiro (ex: anexos e lotes)."""
+    modelo = montar_contrato_docx(**kwargs)
     buf = io.BytesIO()
     modelo.save(buf)
     return buf.getvalue()
+
+
+# =========================
+# VÁRIOS TEMPLATES
+# =========================
+
+def nome_arquivo_contrato(template_key: str) -> str:
+    return f"contrato_{template_key}.docx"
+
+
+def empacotar_contratos(contratos: Dict[str, bytes]) -> bytes:
+    """
+    Zip com um .docx por template. Sem recompressão (o .docx já é um zip) e com
+    data fixa nas entradas, para o mesmo conteúdo gerar os mesmos bytes (ETag).
+    """
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_STORED) as zf:
+        for template_key, docx_bytes in contratos.items():
+            zf.writestr(zipfile.ZipInfo(nome_arquivo_contrato(template_key), date_time=(1980, 1, 1, 0, 0, 0)), docx_bytes)
+    return buf.getvalue()
@@ -0,0 +1,296 @@
+# indice_partes.py
+#
+# Índice local das partes de um draft, para resolver o alvo de uma edição
+# ("muda o CPF da Maria para ...") sem mandar o draft inteiro ao modelo só
+# para descobrir que "a Maria" é partes[2].
+#
+# Chaves: nome completo normalizado, tokens do nome, CPF/CNPJ, RG e papel
+# (vendedor/comprador/...). Tokens aceitam iniciais e pequenos erros de
+# digitação. O índice é atualizado por posição: só as partes cuja impressão
+# digital mudou são reindexadas. Referências que casam com mais de uma parte
+# (ou com nenhuma) continuam indo para o modelo.
+
+import difflib
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set
+
+from pydantic import BaseModel
+
+from cache import hash_json
+from entidades import (
+    PAPEIS_CONTRATUAIS,
+    normalizar_cpf_cnpj,
+    normalizar_nome,
+    normalizar_texto,
+    sem_acentos,
+    tokens_nome,
+)
+
+SIMILARIDADE_MINIMA = 0.85
+MAX_INDICES_EM_MEMORIA = 256
+
+ORDINAIS = {
+    "primeiro": 0, "primeira": 0, "1o": 0, "1a": 0,
+    "segundo": 1, "segunda": 1, "2o": 1, "2a": 1,
+    "terceiro": 2, "terceira": 2, "3o": 2, "3a": 2,
+    "quarto": 3, "quarta": 3, "4o": 3, "4a": 3,
+    "quinto": 4, "quinta": 4, "5o": 4, "5a": 4,
+    "ultimo": -1, "ultima": -1,
+}
+# Palavras da referência que não fazem parte do nome
+IGNORAR = {"o", "a", "os", "as", "sr", "sra", "senhor", "senhora", "dona", "seu", "parte", "pessoa", "cliente"}
+
+CAMPOS_PARTE = {
+    "nome completo": "nome",
+    "nome": "nome",
+    "cpf/cnpj": "cpf_cnpj",
+    "cpf": "cpf_cnpj",
+    "cnpj": "cpf_cnpj",
+    "rg": "rg",
+    "identidade": "rg",
+    "papel": "papel",
+    "estado civil": "estado_civil",
+    "profissao": "profissao",
+    "ocupacao": "profissao",
+    "endereco": "endereco",
+    "data de nascimento": "data_nascimento",
+    "nascimento": "data_nascimento",
+}
+ROTULOS = {
+    "nome": "nome",
+    "cpf_cnpj": "CPF/CNPJ",
+    "rg": "RG",
+    "papel": "papel",
+    "estado_civil": "estado civil",
+    "profissao": "profissão",
+    "endereco": "endereço",
+    "data_nascimento": "data de nascimento",
+}
+
+_VERBOS = r"(?:mud[ae]|alter[ae]|corrij[ae]|corrige|troc[ae]|troque|atualiz[ae]|defin[ae]|coloc[ae]|coloque|ajust[ae])"
+_CAMPOS = "|".join(sorted((re.escape(c) for c in CAMPOS_PARTE), key=len, reverse=True))
+_PEDIDO_CAMPO = re.compile(
+    rf"^\s*(?:por favor,?\s*)?{_VERBOS}\s+(?:o\s+|a\s+)?(?P<campo>{_CAMPOS})\s+(?:d[oa]s?|de)\s+"
+    r"(?P<alvo>.+?)\s+(?:para|pra|como|por)\s+(?P<valor>.+?)\s*[.!]?\s*$",
+    re.IGNORECASE,
+)
+_PEDIDO_RENOMEAR = re.compile(
+    r"^\s*(?:por favor,?\s*)?renome(?:ia|ie|ar)\s+(?P<alvo>.+?)\s+(?:para|pra|como)\s+(?P<valor>.+?)\s*[.!]?\s*$",
+    re.IGNORECASE,
+)
+_DOCUMENTO = re.compile(r"\d[\d.\-/\s]{5,}\d")
+
+
+# =========================
+# PEDIDO DE EDIÇÃO
+# =========================
+
+class PedidoEdicao(BaseModel):
+    """Campo de uma parte + referência à parte + novo valor, lidos da mensagem."""
+    campo: str
+    referencia: str
+    valor: str
+
+
+def interpretar_pedido(mensagem: str) -> Optional[PedidoEdicao]:
+    """
+    Reconhece só as formas diretas ("muda o <campo> do/da <alvo> para <valor>",
+    "renomeia <alvo> para <valor>"). Qualquer outra coisa fica para o modelo.
+    """
+    texto = sem_acentos(mensagem or "")
+    # O valor sai da mensagem original quando a remoção de acentos preserva as posições
+    original = mensagem if len(texto) == len(mensagem or "") else texto
+
+    if m := _PEDIDO_CAMPO.match(texto):
+        campo = CAMPOS_PARTE[m.group("campo").lower()]
+    elif m := _PEDIDO_RENOMEAR.match(texto):
+        campo = "nome"
+    else:
+        return None
+    valor = original[m.start("valor"):m.end("valor")].strip().strip("\"'“”")
+    if not valor:
+        return None
+    return PedidoEdicao(campo=campo, referencia=m.group("alvo"), valor=valor)
+
+
+# =========================
+# ÍNDICE
+# =========================
+
+def _papel_base(papel: str) -> Optional[str]:
+    normalizado = normalizar_texto(papel)
+    for base in PAPEIS_CONTRATUAIS:
+        if base in normalizado:
+            return base
+    return None
+
+
+def _impressao(parte: dict) -> str:
+    return hash_json([parte.get(c) for c in ("nome", "cpf_cnpj", "rg", "papel")])
+
+
+class IndicePartes:
+    def __init__(self, partes: Optional[List[Any]] = None):
+        self.por_nome: Dict[str, Set[int]] = {}
+        self.por_token: Dict[str, Set[int]] = {}
+        self.por_documento: Dict[str, Set[int]] = {}
+        self.por_papel: Dict[str, Set[int]] = {}
+        self._chaves: List[List[tuple]] = []
+        self._impressoes: List[Optional[str]] = []
+        self._nomes: List[str] = []
+        self.reindexadas = 0
+        if partes:
+            self.atualizar(partes)
+
+    def __len__(self) -> int:
+        return len(self._impressoes)
+
+    # ---------- manutenção ----------
+
+    def _mapa(self, tipo: str) -> Dict[str, Set[int]]:
+        return {"nome": self.por_nome, "token": self.por_token, "doc": self.por_documento, "papel": self.por_papel}[tipo]
+
+    def _remover(self, i: int):
+        for tipo, chave in self._chaves[i]:
+            mapa = self._mapa(tipo)
+            mapa[chave].discard(i)
+            if not mapa[chave]:
+                del mapa[chave]
+        self._chaves[i] = []
+
+    def _adicionar(self, i: int, parte: dict):
+        chaves = [("nome", normalizar_nome(parte.get("nome")))]
+        chaves += [("token", t) for t in set(tokens_nome(parte.get("nome")))]
+        chaves += [("doc", d) for d in {normalizar_cpf_cnpj(parte.get("cpf_cnpj")), normalizar_cpf_cnpj(parte.get("rg"))} if d]
+        if papel := _papel_base(parte.get("papel") or ""):
+            chaves.append(("papel", papel))
+        chaves = [(tipo, chave) for tipo, chave in chaves if chave]
+        for tipo, chave in chaves:
+            self._mapa(tipo).setdefault(chave, set()).add(i)
+        self._chaves[i] = chaves
+        self._nomes[i] = parte.get("nome") or ""
+        self.reindexadas += 1
+
+    def atualizar(self, partes: List[Any]) -> "IndicePartes":
+        """Reindexa só as posições cuja parte mudou (ou que surgiram/sumiram)."""
+        partes = [p.model_dump() if hasattr(p, "model_dump") else dict(p or {}) for p in partes or []]
+        for i in range(len(partes), len(self._impressoes)):
+            self._remover(i)
+        del self._impressoes[len(partes):], self._chaves[len(partes):], self._nomes[len(partes):]
+
+        for i, parte in enumerate(partes):
+            impressao = _impressao(parte)
+            if i < len(self._impressoes):
+                if self._impressoes[i] == impressao:
+                    continue
+                self._remover(i)
+            else:
+                self._impressoes.append(None)
+                self._chaves.append([])
+                self._nomes.append("")
+            self._adicionar(i, parte)
+            self._impressoes[i] = impressao
+        return self
+
+    # ---------- consulta ----------
+
+    def _indices_do_token(self, token: str) -> Set[int]:
+        if token in self.por_token:
+            return set(self.por_token[token])
+        encontrados: Set[int] = set()
+        for chave, indices in self.por_token.items():
+            # Inicial ("M.") ou nome abreviado ("Fern" -> "fernanda")
+            if (len(token) == 1 or len(token) >= 3) and chave.startswith(token):
+                encontrados |= indices
+        if not encontrados and len(token) >= 4:
+            for chave in difflib.get_close_matches(token, list(self.por_token), n=3, cutoff=SIMILARIDADE_MINIMA):
+                encontrados |= self.por_token[chave]
+        return encontrados
+
+    def resolver(self, referencia: str) -> List[int]:
+        """
+        Índices de partes compatíveis com a referência ("a Maria", "o segundo
+        comprador", "CPF 123.456.789-00"). Lista vazia: nada casou; mais de um: ambígua.
+        """
+        for trecho in _DOCUMENTO.findall(referencia or ""):
+            if indices := self.por_documento.get(normalizar_cpf_cnpj(trecho)):
+                return sorted(indices)
+
+        nome = normalizar_nome(referencia)
+        if nome in self.por_nome:
+            return sorted(self.por_nome[nome])
+
+        candidatos = set(range(len(self)))
+        ordinal, tokens = None, []
+        for token in normalizar_texto(referencia).split():
+            if token in ORDINAIS:
+                ordinal = ORDINAIS[token]
+            elif papel := next((p for p in PAPEIS_CONTRATUAIS if token.startswith(p[:-1])), None):
+                candidatos &= self.por_papel.get(papel, set())
+            elif token not in IGNORAR:
+                tokens.append(token)
+
+        for token in tokens_nome(" ".join(tokens)):
+            candidatos &= self._indices_do_token(token)
+            if not candidatos:
+                return []
+
+        ordenados = sorted(candidatos)
+        if ordinal is not None:
+            if not -len(ordenados) <= ordinal < len(ordenados):
+                return []
+            return [ordenados[ordinal]]
+        return ordenados
+
+    def descrever(self, indices: List[int]) -> str:
+        return "; ".join(f"partes[{i}] = {self._nomes[i]}" for i in indices)
+
+
+# =========================
+# ÍNDICES POR SESSÃO
+# =========================
+
+_indices: "OrderedDict[str, IndicePartes]" = OrderedDict()
+_indices_lock = threading.Lock()
+
+
+def indice_do_draft(draft: dict, chave: Optional[str] = None) -> IndicePartes:
+    """
+    Com chave (ex.: id da sessão), o índice fica em memória e só as partes
+    alteradas desde a última edição são reindexadas.
+    """
+    partes = (draft or {}).get("partes") or []
+    if chave is None:
+        return IndicePartes(partes)
+    with _indices_lock:
+        indice = _indices.pop(chave, None) or IndicePartes()
+        _indices[chave] = indice
+        while len(_indices) > MAX_INDICES_EM_MEMORIA:
+            _indices.popitem(last=False)
+        return indice.atualizar(partes)
+
+
+class MetricasResolucao:
+    def __init__(self):
+        self.local = 0
+        self.ambiguas = 0
+        self.modelo = 0
+        self._lock = threading.Lock()
+
+    def registrar(self, campo: str):
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + 1)
+
+    def snapshot(self) -> dict:
+        total = self.local + self.modelo
+        return {
+            "resolvidas_localmente": self.local,
+            "enviadas_ao_modelo": self.modelo,
+            "ambiguas": self.ambiguas,
+            "taxa_local": round(self.local / total, 4) if total else None,
+        }
+
+
+metricas_resolucao = MetricasResolucao()
@@ -0,0 +1,218 @@
+# json_patch.py
+#
+# JSON Patch (RFC 6902) e JSON Pointer (RFC 6901), só com a biblioteca padrão.
+# Usado para trafegar edições do draft como deltas em vez do draft inteiro.
+
+import copy
+import re
+from typing import Any, List
+
+
+class PatchInvalido(ValueError):
+    pass
+
+
+# =========================
+# JSON POINTER
+# =========================
+
+def _escapar(token) -> str:
+    return str(token).replace("~", "~0").replace("/", "~1")
+
+
+def _desescapar(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def montar_pointer(partes) -> str:
+    return "".join(f"/{_escapar(p)}" for p in partes)
+
+
+def separar_pointer(pointer: str) -> List[str]:
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise PatchInvalido(f"JSON Pointer inválido: {pointer!r}")
+    return [_desescapar(t) for t in pointer[1:].split("/")]
+
+
+def path_para_pointer(path: str) -> str:
+    """'partes[0].nome' (formato das instruções) -> '/partes/0/nome'."""
+    partes = []
+    for chunk in path.split("."):
+        for nome, indice in re.findall(r"([^\[\]]+)|\[(\d+)\]", chunk):
+            partes.append(nome or indice)
+    return montar_pointer(partes)
+
+
+def _indice(lista: list, token: str, para_inserir: bool = False) -> int:
+    if para_inserir and token == "-":
+        return len(lista)
+    if not token.isdigit() or (len(token) > 1 and token.startswith("0")):
+        raise PatchInvalido(f"Índice de lista inválido: {token!r}")
+    i = int(token)
+    limite = len(lista) if para_inserir else len(lista) - 1
+    if i > limite:
+        raise PatchInvalido(f"Índice fora da lista: {i}")
+    return i
+
+
+def _pai(doc, tokens: List[str]):
+    atual = doc
+    for token in tokens[:-1]:
+        if isinstance(atual, list):
+            atual = atual[_indice(atual, token)]
+        elif isinstance(atual, dict):
+            if token not in atual:
+                raise PatchInvalido(f"Caminho inexistente: {montar_pointer(tokens)}")
+            atual = atual[token]
+        else:
+            raise PatchInvalido(f"Caminho inexistente: {montar_pointer(tokens)}")
+    return atual
+
+
+def resolver(doc, pointer: str):
+    atual = doc
+    for token in separar_pointer(pointer):
+        if isinstance(atual, list):
+            atual = atual[_indice(atual, token)]
+        elif isinstance(atual, dict) and token in atual:
+            atual = atual[token]
+        else:
+            raise PatchInvalido(f"Caminho inexistente: {pointer}")
+    return atual
+
+
+# =========================
+# APLICAÇÃO
+# =========================
+
+def iguais_json(a: Any, b: Any) -> bool:
+    """
+    Igualdade do RFC 6902 (op "test"): números pelo valor (1 == 1.0), mas
+    booleanos e null só iguais a si mesmos; objetos e listas comparados membro a membro.
+    O == do Python aceitaria True == 1 e {"a": 1} == {"a": True}.
+    """
+    if isinstance(a, bool) or isinstance(b, bool) or a is None or b is None:
+        return type(a) is type(b) and a == b
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return a == b
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(iguais_json(a[k], b[k]) for k in a)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(iguais_json(x, y) for x, y in zip(a, b))
+    return type(a) is type(b) and a == b
+
+
+def _adicionar(doc, tokens, valor):
+    if not tokens:
+        return valor
+    pai = _pai(doc, tokens)
+    if isinstance(pai, list):
+        pai.insert(_indice(pai, tokens[-1], para_inserir=True), valor)
+    elif isinstance(pai, dict):
+        pai[tokens[-1]] = valor
+    else:
+        raise PatchInvalido(f"Destino inválido: {montar_pointer(tokens)}")
+    return doc
+
+
+def _remover(doc, tokens):
+    if not tokens:
+        raise PatchInvalido("Não é possível remover a raiz do documento")
+    pai = _pai(doc, tokens)
+    if isinstance(pai, list):
+        return doc, pai.pop(_indice(pai, tokens[-1]))
+    if isinstance(pai, dict) and tokens[-1] in pai:
+        return doc, pai.pop(tokens[-1])
+    raise PatchInvalido(f"Caminho inexistente: {montar_pointer(tokens)}")
+
+
+def aplicar_patch(doc: Any, operacoes: List[dict]) -> Any:
+    """Aplica o patch numa cópia do documento. Atômico: ou aplica tudo ou levanta PatchInvalido."""
+    resultado = copy.deepcopy(doc)
+    for op in operacoes:
+        try:
+            resultado = _aplicar_operacao(resultado, op)
+        except (KeyError, TypeError, AttributeError) as e:
+            raise PatchInvalido(f"Operação inválida {op}: {e}") from e
+    return resultado
+
+
+def _aplicar_operacao(resultado: Any, op: dict) -> Any:
+    nome = op.get("op")
+    tokens = separar_pointer(op["path"])
+
+    if nome == "add":
+        return _adicionar(resultado, tokens, copy.deepcopy(op["value"]))
+    if nome == "remove":
+        resultado, _ = _remover(resultado, tokens)
+        return resultado
+    if nome == "replace":
+        resolver(resultado, op["path"])
+        if not tokens:
+            return copy.deepcopy(op["value"])
+        pai = _pai(resultado, tokens)
+        chave = _indice(pai, tokens[-1]) if isinstance(pai, list) else tokens[-1]
+        pai[chave] = copy.deepcopy(op["value"])
+        return resultado
+    if nome in ("move", "copy"):
+        origem = op["from"]
+        if nome == "move":
+            if op["path"].startswith(origem + "/"):
+                raise PatchInvalido("Não é possível mover um valor para dentro dele mesmo")
+            resultado, valor = _remover(resultado, separar_pointer(origem))
+        else:
+            valor = copy.deepcopy(resolver(resultado, origem))
+        return _adicionar(resultado, tokens, valor)
+    if nome == "test":
+        if "value" not in op:
+            raise PatchInvalido(f"Operação test sem value: {op}")
+        if not iguais_json(resolver(resultado, op["path"]), op["value"]):
+            raise PatchInvalido(f"Teste falhou em {op['path']}")
+        return resultado
+    raise PatchInvalido(f"Operação desconhecida: {nome!r}")
+
+
+# =========================
+# DIFF
+# =========================
+
+def gerar_patch(antes: Any, depois: Any, prefixo: str = "") -> List[dict]:
+    """
+    Diff estrutural: desce em dicts e listas e só emite operações onde algo
+    mudou. Em listas, compara posição a posição e adiciona/remove no final
+    (remoções de trás para frente, para os índices continuarem válidos).
+    """
+    if type(antes) is type(depois) and iguais_json(antes, depois):
+        return []
+    if type(antes) is not type(depois):
+        return [{"op": "replace", "path": prefixo, "value": copy.deepcopy(depois)}]
+
+    if isinstance(antes, dict):
+        ops = []
+        for chave in antes:
+            caminho = f"{prefixo}/{_escapar(chave)}"
+            if chave not in depois:
+                ops.append({"op": "remove", "path": caminho})
+            else:
+                ops.extend(gerar_patch(antes[chave], depois[chave], caminho))
+        for chave in depois:
+            if chave not in antes:
+                ops.append({"op": "add", "path": f"{prefixo}/{_escapar(chave)}", "value": copy.deepcopy(depois[chave])})
+        return ops
+
+    if isinstance(antes, list):
+        ops = []
+        comum = min(len(antes), len(depois))
+        for i in range(comum):
+            ops.extend(gerar_patch(antes[i], depois[i], f"{prefixo}/{i}"))
+        for i in range(len(antes) - 1, comum - 1, -1):
+            ops.append({"op": "remove", "path": f"{prefixo}/{i}"})
+        for i in range(comum, len(depois)):
+            ops.append({"op": "add", "path": f"{prefixo}/{i}", "value": copy.deepcopy(depois[i])})
+        return ops
+
+    if antes != depois:
+        return [{"op": "replace", "path": prefixo, "value": copy.deepcopy(depois)}]
+    return []
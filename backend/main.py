@@ -1,18 +1,68 @@
-from fastapi import FastAPI, UploadFile, File
-from ocr import analisar_documento
-from chat import chat_with_context
+from fastapi import FastAPI, UploadFile, File, Form
+from ocr import analisar_documento_async
+from chat import chat_with_context_async
 import os
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
-from draft import prepare_contract_draft, apply_instructions_to_draft
+from draft import apply_instructions_to_draft, set_by_path_python, carregar_consolidacao
+from especulacao import consolidacao_especulativa
 from pydantic import BaseModel
-from typing import Literal, Any, Dict, List, Optional
-from gerar_contrato import gerar_contrato_docx_bytes
-from fastapi.responses import Response
+from typing import Any, Dict, List, Optional
+from gerar_contrato import (
+    TemplateKey,
+    empacotar_contratos,
+    gerar_contrato_docx_bytes,
+    iterar_docx,
+    montar_contrato_docx,
+    montar_sufixo_contrato,
+    nome_arquivo_contrato,
+)
+from google import genai
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
 from fastapi import HTTPException
 import time
 import asyncio
-from edit_draft import edit_contract_draft, detect_edit_instruction
+from edit_draft import edit_contract_draft, detect_edit_instruction_async
+from cancelamento import executar_cancelavel, metricas_cancelamento
+from roteador import MODELO_RAPIDO, roteador
+from consumo import contabilidade, sessao_da_requisicao
+from singleflight import singleflight
+from reparo_json import metricas_parse
+from indice_partes import metricas_resolucao
+from errors import AppError, ServiceOverloadedError
+from prazos import prazo_da_requisicao, prazo_restante
+from executores import executar_em, metricas_executores
+from cache import obter_cache, hash_json
+from cronograma import compactar_payload, expandir_payload
+from serializacao import CompressaoMiddleware, RespostaJSON, json_bytes, ler_json
+from arquivos_remotos import registro_arquivos
+from contextlib import asynccontextmanager
+from prompts import registro_prompts
+from json_patch import PatchInvalido, gerar_patch
+from versoes_draft import (
+    VersaoConflitante,
+    aplicar_edicao,
+    carregar_draft,
+    desfazer,
+    salvar_draft,
+    versao_confere,
+)
+from fastapi import Header
+import hashlib
+import tempfile
+import threading
+from fastapi import Request
+from fastapi import WebSocket, WebSocketDisconnect
+from sessao import (
+    adicionar_documento,
+    adicionar_pendente,
+    carregar_documentos,
+    carregar_pendentes,
+    executar_turno,
+    limpar_pendentes,
+    salvar_documentos,
+)
 
 load_dotenv(override=True)
 api_key_check = os.getenv("AI_API_KEY")
@@ -21,7 +71,16 @@ if api_key_check:
 else:
     print("⚠️ [DEBUG] Falha ao carregar AI_API_KEY do .env!")
 
-app = FastAPI()
+# orjson nas respostas (quando instalado) e gzip/br negociado pelo Accept-Encoding
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Renovação/limpeza dos arquivos enviados à File API do Gemini
+    manutencao = asyncio.create_task(registro_arquivos.manutencao_periodica())
+    yield
+    manutencao.cancel()
+
+app = FastAPI(default_response_class=RespostaJSON, lifespan=lifespan)
+app.add_middleware(CompressaoMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -32,19 +91,60 @@ app.add_middleware(
 )
 
 class ContractGeneratePayload(BaseModel):
-    template: Literal["compra-venda", "financiamento-go", "financiamento-ms"]
+    template: TemplateKey
     draft: Dict[str, Any]
     extra_text: str | None = None
+    session_id: Optional[str] = None
+
+class ContractBatchPayload(BaseModel):
+    templates: List[TemplateKey]
+    draft: Dict[str, Any]
+    extra_text: str | None = None
+    session_id: Optional[str] = None
 
 class DraftPayload(BaseModel):
     documents: Dict[str, Any]
     pending_instructions: List[Dict[str, Any]] = []
+    session_id: Optional[str] = None
+
+# TTLs do cache compartilhado (segundos)
+OCR_CACHE_TTL = 7 * 24 * 3600
+CONTRATO_CACHE_TTL = 24 * 3600
+CONTRATO_CACHE_MAX_BYTES = 10 * 1024 * 1024
+# Mesmo teto de memória do iterar_docx (4 blocos de 64 KB); acima disso a cópia vai para disco
+CONTRATO_SPOOL_BYTES = 4 * 64 * 1024
+
+def _hash_upload(file_obj) -> str:
+    sha = hashlib.sha256()
+    for bloco in iter(lambda: file_obj.read(1024 * 1024), b""):
+        sha.update(bloco)
+    file_obj.seek(0)
+    return sha.hexdigest()
+
+# =========================
+# CRONOGRAMA COMPACTO
+# =========================
+# Os clientes podem mandar "cronograma_compacto" (séries) no lugar de
+# "cronograma_financeiro" e pedir respostas assim com X-Cronograma: compacto.
+
+def _expandir_cronogramas(obj):
+    try:
+        return expandir_payload(obj)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=422, detail=f"cronograma_compacto inválido: {e}")
+
+def _quer_cronograma_compacto(request: Request) -> bool:
+    return request.headers.get("x-cronograma", "").lower() == "compacto"
+
+def _formatar_cronograma(request: Request, dados):
+    return compactar_payload(dados) if _quer_cronograma_compacto(request) else dados
+
 
 # ✅ NOVO ENDPOINT: Detecta se mensagem é instrução de edição
 @app.post("/api/detect-edit")
-async def detect_edit_endpoint(payload: dict):
+async def detect_edit_endpoint(payload: dict, request: Request):
     message = payload.get("message")
-    documents = payload.get("documents", {})
+    documents = _expandir_cronogramas(payload.get("documents", {}))
     
     if not message:
         return {"is_edit_instruction": False}
@@ -59,10 +159,13 @@ async def detect_edit_endpoint(payload: dict):
     start_time = time.time()
     try:
         print(f"🔍 [DETECT-EDIT] Iniciando detecção para mensagem: '{message[:50]}...'")
-        result = await asyncio.to_thread(detect_edit_instruction, message, documents)
+        with sessao_da_requisicao(payload.get("session_id")), prazo_da_requisicao("detect-edit"):
+            result = await executar_cancelavel(request, detect_edit_instruction_async(message, documents), "detect-edit")
         duration = time.time() - start_time
         print(f"✅ [DETECT-EDIT] Concluído em {duration:.2f}s")
         return result
+    except AppError:
+        raise
     except Exception as e:
         duration = time.time() - start_time
         print(f"❌ [DETECT-EDIT] Erro após {duration:.2f}s: {e}")
@@ -71,7 +174,7 @@ async def detect_edit_endpoint(payload: dict):
         return {"is_edit_instruction": False, "error": str(e)}
 
 @app.post("/api/ocr")
-async def ocr_endpoint(file: UploadFile = File(...)):
+async def ocr_endpoint(request: Request, file: UploadFile = File(...), session_id: Optional[str] = Form(None)):
     api_key = os.getenv("AI_API_KEY")
     if not api_key:
         raise HTTPException(
@@ -82,19 +185,34 @@ async def ocr_endpoint(file: UploadFile = File(...)):
     start_time = time.time()
     try:
         print(f"📄 [OCR] Recebido arquivo: {file.filename}")
-        result = await asyncio.to_thread(analisar_documento, file)
+        cache = obter_cache()
+        chave = f"ocr:{await executar_em('ocr', _hash_upload, file.file)}"
+        result = await executar_em("interativo", cache.get_json, chave)
+        do_cache = bool(result)
+        if do_cache:
+            print(f"♻️ [OCR] Resultado reaproveitado do cache ({file.filename})")
+        else:
+            with sessao_da_requisicao(session_id), prazo_da_requisicao("ocr"):
+                result = await executar_cancelavel(request, analisar_documento_async(file), "ocr")
         duration = time.time() - start_time
         print(f"✅ [OCR] Processamento concluído em {duration:.2f}s")
         
         if not result or not result.get("data"):
             raise HTTPException(status_code=422, detail="Não consegui extrair dados deste arquivo. Ele parece estar ilegível ou vazio.")
+        if not do_cache:
+            await executar_em("interativo", cache.set_json, chave, result, ttl=OCR_CACHE_TTL)
+        if session_id:
+            await _registrar_documento_da_sessao(session_id, file.filename, result["data"])
         
-        return {
+        # Resposta já serializada aqui: evita o jsonable_encoder sobre a lista de documentos
+        return RespostaJSON({
             "filename": file.filename,
             "text": result["text"],
-            "data": result["data"],
+            "data": _formatar_cronograma(request, result["data"]),
             "processing_time": f"{duration:.2f}s"
-        }
+        })
+    except AppError:
+        raise
     except Exception as e:
         duration = time.time() - start_time
         print(f"❌ [OCR] Erro após {duration:.2f}s: {e}")
@@ -102,8 +220,16 @@ async def ocr_endpoint(file: UploadFile = File(...)):
             raise HTTPException(status_code=429, detail="Nossa cota de uso da IA atingiu o limite momentâneo. Aguarde um minuto e tente de novo.")
         raise HTTPException(status_code=500, detail=f"Erro ao processar documento: {str(e)}")
 
+async def _registrar_documento_da_sessao(session_id: str, nome: str, dados):
+    # Mesmo formato que o front manda de volta no /api/draft ({arquivo: data}),
+    # para o hash do conjunto bater com o da consolidação especulativa
+    documentos = await executar_em(
+        "interativo", adicionar_documento, session_id, nome, ler_json(json_bytes(dados))
+    )
+    consolidacao_especulativa.agendar(session_id, documentos)
+
 @app.post("/api/chat")
-async def chat_endpoint(payload: dict):
+async def chat_endpoint(payload: dict, request: Request):
     api_key = os.getenv("AI_API_KEY")
     if not api_key:
         raise HTTPException(
@@ -114,26 +240,37 @@ async def chat_endpoint(payload: dict):
     start_time = time.time()
     try:
         print(f"💬 [CHAT] Processando mensagem do usuário...")
-        response = await asyncio.to_thread(
-            chat_with_context,
-            api_key=api_key,
-            model_name=payload.get("model", "gemini-2.5-pro"), # Mantendo o nome original se desejar, mas atente à versão
-            chat_history=payload.get("history", []),
-            extracted_documents=payload.get("documents", {}),
-            user_message=payload["message"],
-        )
+        with sessao_da_requisicao(payload.get("session_id")), prazo_da_requisicao("chat"):
+            response = await executar_cancelavel(
+                request,
+                chat_with_context_async(
+                    api_key=api_key,
+                    model_name=payload.get("model"), # Sem "model", o roteador escolhe entre flash e pro
+                    chat_history=payload.get("history", []),
+                    extracted_documents=_expandir_cronogramas(payload.get("documents", {})),
+                    user_message=payload["message"],
+                ),
+                "chat",
+            )
         duration = time.time() - start_time
         print(f"✅ [CHAT] Resposta gerada em {duration:.2f}s")
         return {"response": response}
+    except AppError:
+        raise
     except Exception as e:
         if "quota" in str(e).lower() or "resourceexhausted" in str(e).lower():
             raise HTTPException(status_code=429, detail="Nossa cota de uso da IA atingiu o limite momentâneo. Aguarde um minuto e tente de novo.")
         raise HTTPException(status_code=500, detail="Tive um pequeno tropeço ao processar sua dúvida. Pode tentar perguntar de novo com outras palavras?")
 
 @app.post("/api/draft")
-async def contract_draft_endpoint(payload: dict):
-    documents = payload.get("documents")
+async def contract_draft_endpoint(payload: dict, request: Request):
+    documents = _expandir_cronogramas(payload.get("documents"))
     pending_instructions = payload.get("pending_instructions", [])
+    session_id = payload.get("session_id")
+    # Instruções detectadas pelo canal de sessão (WebSocket) ficam guardadas no servidor
+    usar_pendentes_da_sessao = bool(session_id) and not pending_instructions
+    if usar_pendentes_da_sessao:
+        pending_instructions = carregar_pendentes(session_id)
     
     print(f"\n📥 Recebido em /api/draft:")
     print(f"   - Documentos: {len(documents)} arquivo(s)")
@@ -147,9 +284,13 @@ async def contract_draft_endpoint(payload: dict):
     if not documents:
         return {"error": "Nenhum documento fornecido"}
 
-    # Gera o draft base
+    # Draft base: já consolidado em segundo plano para este conjunto de documentos,
+    # em andamento (espera a mesma execução) ou consolidado agora — incremental
+    # quando a sessão já tem um draft consolidado
     print("\n🔨 Gerando draft base...")
-    draft = prepare_contract_draft(documents)
+    with sessao_da_requisicao(session_id), prazo_da_requisicao("draft"):
+        estado = await consolidacao_especulativa.obter(session_id, documents)
+    draft = estado.draft
     
     # Converte para dict se necessário
     if hasattr(draft, 'model_dump'):
@@ -162,40 +303,491 @@ async def contract_draft_endpoint(payload: dict):
     if pending_instructions:
         print(f"\n🔧 Aplicando {len(pending_instructions)} instruções...")
         draft = apply_instructions_to_draft(draft, pending_instructions)
+
+    headers = {}
+    if session_id:
+        versionado, _ = await executar_em("interativo", salvar_draft, session_id, draft)
+        # Aplicadas agora, pela lista do cliente (que inclui as vindas do canal) ou pela da sessão
+        await executar_em("interativo", limpar_pendentes, session_id)
+        headers = {"ETag": versionado.etag, "X-Draft-Version": str(versionado.versao)}
     
-    return draft
+    return RespostaJSON(_formatar_cronograma(request, draft), headers=headers)
+
+@app.get("/api/draft/{session_id}/fontes")
+async def contract_draft_sources(session_id: str):
+    estado = await executar_em("interativo", carregar_consolidacao, session_id)
+    if not estado:
+        raise HTTPException(status_code=404, detail="Nenhum draft consolidado para esta sessão")
+    return {"documentos": list(estado.documentos), "fontes": estado.fontes}
+
+async def _guardar_ao_final(blocos, chave: str):
+    """
+    Repassa os blocos do stream e, se o .docx couber no limite, guarda no cache ao final.
+    A cópia vai para um arquivo temporário (em memória só até CONTRATO_SPOOL_BYTES),
+    para não desfazer o limite de memória do streaming enquanto o contrato é enviado.
+    A compressão e a cópia rodam em thread; a gravação no cache, no executor "interativo".
+    """
+    completo: List[bytes] = []
+
+    def copiar():
+        copia = tempfile.SpooledTemporaryFile(max_size=CONTRATO_SPOOL_BYTES)
+        try:
+            tamanho = 0
+            for bloco in blocos:
+                if copia is not None:
+                    tamanho += len(bloco)
+                    if tamanho > CONTRATO_CACHE_MAX_BYTES:
+                        copia.close()
+                        copia = None
+                    else:
+                        copia.write(bloco)
+                yield bloco
+            if copia is not None:
+                copia.seek(0)
+                completo.append(copia.read())
+        finally:
+            if copia is not None:
+                copia.close()
+
+    async for bloco in iterate_in_threadpool(copiar()):
+        yield bloco
+    if completo:
+        try:
+            await executar_em("interativo", obter_cache().set, chave, completo[0], ttl=CONTRATO_CACHE_TTL)
+        except ServiceOverloadedError:
+            # O contrato já foi entregue; só fica sem cache desta vez
+            print(f"🚦 [CONTRATO] Executor cheio, contrato não guardado no cache ({chave[:20]}...)")
+
+async def _modelo_contrato(session_id: Optional[str]) -> str:
+    # Perto do orçamento de tokens, também o contrato sai do modelo rápido (ver consumo.py)
+    with sessao_da_requisicao(session_id):
+        await contabilidade.carregar_async()
+        if contabilidade.degradado("modelo_rapido", "contrato_modelo_rapido"):
+            return MODELO_RAPIDO
+    return os.getenv("GEMINI_MODEL", "gemini-2.5-pro")
+
+def _chave_contrato(template: str, draft: dict, extra_text: Optional[str], model_name: str) -> str:
+    return "contrato:" + hash_json([template, draft, extra_text or "", model_name])
 
 @app.post("/api/contract/generate")
-async def contract_generate(payload: ContractGeneratePayload):
+async def contract_generate(payload: ContractGeneratePayload, request: Request):
     gemini_key = os.getenv("AI_API_KEY")
     if not gemini_key:
         return Response("AI_API_KEY não definida no .env", status_code=500)
 
-    docx_bytes = gerar_contrato_docx_bytes(
-        draft=payload.draft,
-        template_key=payload.template,
-        api_key=gemini_key,
-        model_name=os.getenv("GEMINI_MODEL", "gemini-2.5-pro"),
-        extra_text=payload.extra_text or "",
+    model_name = await _modelo_contrato(payload.session_id)
+    payload.draft = _expandir_cronogramas(payload.draft)
+    filename = nome_arquivo_contrato(payload.template)
+    media_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+    disposition = {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+    # Mesmo draft + template + texto extra + modelo: devolve o contrato já gerado
+    chave = _chave_contrato(payload.template, payload.draft, payload.extra_text, model_name)
+    docx_bytes = await executar_em("interativo", obter_cache().get, chave)
+    if docx_bytes is not None:
+        etag = f'"{hashlib.sha256(docx_bytes).hexdigest()}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        print(f"♻️ [CONTRATO] {filename} servido do cache")
+        return Response(content=docx_bytes, media_type=media_type, headers={**disposition, "ETag": etag})
+
+    # A chamada ao modelo e a montagem rodam fora do event loop; só depois
+    # começamos a resposta, para que erros ainda virem status HTTP
+    with sessao_da_requisicao(payload.session_id), prazo_da_requisicao("contrato"):
+        modelo = await executar_em(
+            "contrato",
+            montar_contrato_docx,
+            draft=payload.draft,
+            template_key=payload.template,
+            api_key=gemini_key,
+            model_name=model_name,
+            extra_text=payload.extra_text or "",
+        )
+
+    return StreamingResponse(
+        _guardar_ao_final(iterar_docx(modelo), chave),
+        media_type=media_type,
+        headers=disposition,
     )
 
-    filename = f"contrato_{payload.template}.docx"
+def _ler_contratos(cache, chaves: Dict[str, str]) -> Dict[str, Optional[bytes]]:
+    return {template: cache.get(chave) for template, chave in chaves.items()}
+
+def _guardar_contratos(cache, por_chave: Dict[str, bytes]) -> None:
+    for chave, docx_bytes in por_chave.items():
+        cache.set(chave, docx_bytes, ttl=CONTRATO_CACHE_TTL)
+
+@app.post("/api/contract/generate-batch")
+async def contract_generate_batch(payload: ContractBatchPayload, request: Request):
+    """
+    Vários templates do mesmo negócio num zip. O draft é expandido e serializado
+    uma vez, o client é compartilhado e as gerações de cada template rodam em
+    paralelo na classe "contrato": o tempo total fica perto do de um template só.
+    """
+    gemini_key = os.getenv("AI_API_KEY")
+    if not gemini_key:
+        return Response("AI_API_KEY não definida no .env", status_code=500)
+    templates = list(dict.fromkeys(payload.templates))
+    if not templates:
+        raise HTTPException(status_code=422, detail="Informe ao menos um template")
+
+    model_name = await _modelo_contrato(payload.session_id)
+    payload.draft = _expandir_cronogramas(payload.draft)
+    extra_text = payload.extra_text or ""
+    cache = obter_cache()
+    chaves = {t: _chave_contrato(t, payload.draft, extra_text, model_name) for t in templates}
+
+    # Templates já gerados (por aqui ou pelo /api/contract/generate) vêm do cache
+    contratos: Dict[str, bytes] = {}
+    em_cache = await executar_em("interativo", _ler_contratos, cache, chaves)
+    for template, docx_bytes in em_cache.items():
+        if docx_bytes is not None:
+            contratos[template] = docx_bytes
+    faltantes = [t for t in templates if t not in contratos]
+    if contratos:
+        print(f"♻️ [CONTRATO] {len(contratos)} de {len(templates)} template(s) servidos do cache")
+
+    if faltantes:
+        sufixo = montar_sufixo_contrato(payload.draft, extra_text)
+        client = genai.Client(api_key=gemini_key)
+        inicio = time.perf_counter()
+        with sessao_da_requisicao(payload.session_id), prazo_da_requisicao("contrato"):
+            gerados = await asyncio.gather(*(
+                executar_em(
+                    "contrato",
+                    gerar_contrato_docx_bytes,
+                    draft=payload.draft,
+                    template_key=template,
+                    api_key=gemini_key,
+                    model_name=model_name,
+                    extra_text=extra_text,
+                    sufixo=sufixo,
+                    client=client,
+                )
+                for template in faltantes
+            ))
+        print(f"📦 [CONTRATO] {len(faltantes)} template(s) gerados em paralelo em {time.perf_counter() - inicio:.2f}s")
+        novos = dict(zip(faltantes, gerados))
+        contratos.update(novos)
+        await executar_em("interativo", _guardar_contratos, cache, {
+            chaves[t]: docx_bytes for t, docx_bytes in novos.items() if len(docx_bytes) <= CONTRATO_CACHE_MAX_BYTES
+        })
+
+    conteudo = empacotar_contratos({t: contratos[t] for t in templates})
+    etag = f'"{hashlib.sha256(conteudo).hexdigest()}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
     return Response(
-        content=docx_bytes,
-        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        content=conteudo,
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="contratos.zip"', "ETag": etag},
+    )
+
+@app.get("/api/metrics/cache")
+async def cache_metrics():
+    cache = obter_cache()
+    return {"backend": cache.nome, **cache.metricas.snapshot()}
+
+@app.get("/api/metrics/prompts")
+async def prompt_metrics():
+    return registro_prompts.metricas()
+
+@app.get("/api/metrics/roteamento")
+async def routing_metrics():
+    return roteador.metricas()
+
+@app.get("/api/metrics/hedge")
+async def hedge_metrics():
+    return roteador.metricas_hedge()
+
+@app.get("/api/metrics/executores")
+async def executor_metrics():
+    return metricas_executores()
+
+@app.get("/api/metrics/cancelamentos")
+async def cancellation_metrics():
+    return metricas_cancelamento.snapshot()
+
+@app.get("/api/consumo/{session_id}")
+async def session_usage(session_id: str):
+    return await executar_em("interativo", contabilidade.sessao, session_id)
+
+@app.get("/api/metrics/consumo")
+async def usage_report():
+    return contabilidade.relatorio()
+
+@app.get("/api/metrics/parse")
+async def parse_metrics():
+    return metricas_parse.snapshot()
+
+@app.get("/api/metrics/singleflight")
+async def singleflight_metrics():
+    return singleflight.metricas()
+
+@app.get("/api/metrics/especulacao")
+async def speculation_metrics():
+    return consolidacao_especulativa.metricas.snapshot()
+
+@app.get("/api/metrics/arquivos")
+async def file_registry_metrics():
+    return registro_arquivos.snapshot()
+
+@app.get("/api/metrics/partes")
+async def party_resolution_metrics():
+    return metricas_resolucao.snapshot()
+
+def _versao_conflitante(e: VersaoConflitante):
+    return HTTPException(
+        status_code=412,
+        detail={"message": "O draft foi alterado por outra edição. Recarregue antes de editar.", "version": e.atual.versao},
+        headers={"ETag": e.atual.etag},
+    )
+
+def _resposta_delta(versionado, patch: list, **extra) -> RespostaJSON:
+    return RespostaJSON(
+        {"version": versionado.versao, "hash": versionado.hash, "patch": patch, **extra},
+        headers={"ETag": versionado.etag},
     )
 
 @app.post("/api/edit")
-async def edit_draft(payload: dict):
-    draft = payload.get("draft")
+async def edit_draft(payload: dict, if_match: Optional[str] = Header(None)):
+    session_id = payload.get("session_id")
     message = payload.get("message")
 
+    # Modo versionado: o draft fica no servidor; o cliente manda só a mensagem
+    # (e If-Match com a versão que tem) e recebe de volta só o patch
+    if session_id:
+        if not message:
+            raise HTTPException(status_code=400, detail="message é obrigatório")
+        atual = await executar_em("interativo", carregar_draft, session_id)
+        if atual is None:
+            raise HTTPException(status_code=404, detail="Nenhum draft para esta sessão")
+        if not versao_confere(atual, if_match):
+            raise _versao_conflitante(VersaoConflitante(atual))
+
+        try:
+            with sessao_da_requisicao(session_id), prazo_da_requisicao("edit"):
+                instruction = await executar_em("interativo", edit_contract_draft, atual.draft, message, session_id)
+        except AppError:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+        novo = set_by_path_python(atual.draft, instruction.path, instruction.new_value)
+        try:
+            versionado, patch = await executar_em(
+                "interativo", aplicar_edicao, session_id, gerar_patch(atual.draft, novo), if_match=atual.etag
+            )
+        except VersaoConflitante as e:
+            raise _versao_conflitante(e)
+        return _resposta_delta(versionado, patch, instruction=instruction.model_dump())
+
+    draft = _expandir_cronogramas(payload.get("draft"))
+
     if not draft or not message:
         raise HTTPException(status_code=400, detail="draft e message são obrigatórios")
 
     try:
-        instruction = edit_contract_draft(draft, message)
-        return {"instruction": instruction.model_dump()}
+        with prazo_da_requisicao("edit"):
+            instruction = await executar_em("interativo", edit_contract_draft, draft, message)
+        novo = set_by_path_python(draft, instruction.path, instruction.new_value)
+        return {"instruction": instruction.model_dump(), "patch": gerar_patch(draft, novo)}
+    except AppError:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/draft/{session_id}")
+async def get_versioned_draft(session_id: str, request: Request, if_none_match: Optional[str] = Header(None)):
+    atual = await executar_em("interativo", carregar_draft, session_id)
+    if atual is None:
+        raise HTTPException(status_code=404, detail="Nenhum draft para esta sessão")
+    if if_none_match and versao_confere(atual, if_none_match):
+        return Response(status_code=304, headers={"ETag": atual.etag})
+    return RespostaJSON(
+        {"version": atual.versao, "hash": atual.hash, "draft": _formatar_cronograma(request, atual.draft)},
+        headers={"ETag": atual.etag, "Vary": "X-Cronograma"},
+    )
+
+@app.patch("/api/draft/{session_id}")
+async def patch_versioned_draft(session_id: str, patch: List[Dict[str, Any]], if_match: Optional[str] = Header(None)):
+    try:
+        versionado, aplicado = await executar_em("interativo", aplicar_edicao, session_id, patch, if_match=if_match)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Nenhum draft para esta sessão")
+    except VersaoConflitante as e:
+        raise _versao_conflitante(e)
+    except PatchInvalido as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return _resposta_delta(versionado, aplicado)
+
+@app.post("/api/draft/{session_id}/undo")
+async def undo_versioned_draft(session_id: str, if_match: Optional[str] = Header(None)):
+    try:
+        versionado, patch = await executar_em("interativo", desfazer, session_id, if_match=if_match)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Nenhum draft para esta sessão")
+    except VersaoConflitante as e:
+        raise _versao_conflitante(e)
+    return _resposta_delta(versionado, patch)
+
+# =========================
+# CANAL DE SESSÃO (WEBSOCKET)
+# =========================
+
+async def _iterar_em_thread(gerador, operacao: str):
+    """
+    Consome um gerador bloqueante numa thread, repassando cada item ao event loop.
+    Se quem consome parar (cliente desconectou), a thread para no próximo item e
+    fecha o gerador, o que encerra o stream do modelo em vez de lê-lo até o fim.
+    """
+    loop = asyncio.get_running_loop()
+    fila: asyncio.Queue = asyncio.Queue()
+    fim = object()
+    cancelado = threading.Event()
+
+    def produzir():
+        try:
+            for item in gerador:
+                if cancelado.is_set():
+                    break
+                loop.call_soon_threadsafe(fila.put_nowait, item)
+        except Exception as e:
+            loop.call_soon_threadsafe(fila.put_nowait, e)
+        finally:
+            gerador.close()
+            loop.call_soon_threadsafe(fila.put_nowait, fim)
+
+    metricas_cancelamento.registrar("iniciadas", operacao)
+    metricas_cancelamento.registrar("em_andamento", operacao)
+    tarefa = asyncio.ensure_future(executar_em("interativo", produzir))
+
+    def ao_terminar(t: asyncio.Future):
+        # produzir() sempre entrega `fim`; se nem chegou a rodar (fila cheia -> 503), avisa aqui
+        if not t.cancelled() and t.exception() is not None:
+            fila.put_nowait(t.exception())
+            fila.put_nowait(fim)
+
+    tarefa.add_done_callback(ao_terminar)
+    concluido = False
+    try:
+        while True:
+            item = await fila.get()
+            if item is fim:
+                concluido = True
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        metricas_cancelamento.registrar("em_andamento", operacao, -1)
+        if concluido:
+            metricas_cancelamento.registrar("concluidas", operacao)
+        else:
+            cancelado.set()
+            # Ainda esperando vaga no executor: não chega a abrir o stream do modelo
+            tarefa.cancel()
+            metricas_cancelamento.registrar("canceladas", operacao)
+
+async def _aplicar_instrucao_ws(websocket: WebSocket, session_id: str, instruction: dict):
+    # Com draft versionado, a edição é aplicada na hora e o cliente recebe só o patch;
+    # antes do draft existir, a instrução fica pendente para o /api/draft
+    atual = await executar_em("interativo", carregar_draft, session_id)
+    if atual is None:
+        pendentes = await executar_em("interativo", adicionar_pendente, session_id, instruction)
+        await websocket.send_json({"type": "pending_instruction", "instruction": instruction, "pending": len(pendentes)})
+        return
+
+    try:
+        novo = set_by_path_python(atual.draft, instruction["path"], instruction["new_value"])
+        versionado, patch = await executar_em(
+            "interativo", aplicar_edicao, session_id, gerar_patch(atual.draft, novo), if_match=atual.etag
+        )
+    except VersaoConflitante as e:
+        await websocket.send_json({"type": "error", "status": 412, "detail": "O draft foi alterado por outra edição.", "version": e.atual.versao})
+        return
+    except Exception as e:
+        await websocket.send_json({"type": "error", "status": 422, "detail": f"Não foi possível aplicar a edição: {e}"})
+        return
+    await websocket.send_json({"type": "draft_patch", "version": versionado.versao, "hash": versionado.hash, "patch": patch})
+
+async def _turno_ws(websocket: WebSocket, session_id: str, documentos: dict, mensagem: str):
+    start_time = time.time()
+    atual = await executar_em("interativo", carregar_draft, session_id)
+    resultado = None
+    try:
+        with sessao_da_requisicao(session_id), prazo_da_requisicao("turno-ws"):
+            eventos = _iterar_em_thread(executar_turno(documentos, atual.draft if atual else None, mensagem), "turno-ws")
+            try:
+                async with asyncio.timeout(prazo_restante()):
+                    async for evento in eventos:
+                        if evento["type"] == "chunk":
+                            await websocket.send_json(evento)
+                        else:
+                            resultado = evento["result"]
+            finally:
+                await eventos.aclose()
+    except WebSocketDisconnect:
+        raise
+    except AppError as e:
+        print(f"⏳ [WS] Turno interrompido após {time.time() - start_time:.2f}s: {e.detail}")
+        await websocket.send_json({"type": "error", "status": e.status_code, "detail": e.user_message, "headers": e.headers or {}})
+        return
+    except TimeoutError:
+        print(f"⏳ [WS] Turno interrompido após {time.time() - start_time:.2f}s: prazo esgotado")
+        await websocket.send_json({"type": "error", "status": 504, "detail": "A IA demorou mais do que o esperado para responder. Tente novamente."})
+        return
+    except Exception as e:
+        print(f"❌ [WS] Erro no turno após {time.time() - start_time:.2f}s: {e}")
+        if "quota" in str(e).lower() or "resourceexhausted" in str(e).lower():
+            await websocket.send_json({"type": "error", "status": 429, "detail": "Nossa cota de uso da IA atingiu o limite momentâneo. Aguarde um minuto e tente de novo."})
+        else:
+            await websocket.send_json({"type": "error", "status": 500, "detail": "Tive um pequeno tropeço ao processar sua mensagem. Pode tentar de novo?"})
+        return
+
+    instruction = resultado.instruction.model_dump() if resultado.is_edit_instruction and resultado.instruction else None
+    if instruction:
+        await _aplicar_instrucao_ws(websocket, session_id, instruction)
+    await websocket.send_json({"type": "response", "text": resultado.response, "instruction": instruction})
+    print(f"✅ [WS] Turno concluído em {time.time() - start_time:.2f}s")
+
+@app.websocket("/ws/session/{session_id}")
+async def session_channel(websocket: WebSocket, session_id: str):
+    """
+    Mensagens do cliente:
+      {"type": "documents", "documents": {...}}  -> substitui os documentos da sessão
+      {"type": "message", "message": "..."}      -> um turno de chat + detecção de edição
+    Eventos do servidor: chunk, response, draft_patch, pending_instruction, error.
+    """
+    await websocket.accept()
+    try:
+        documentos = await executar_em("interativo", carregar_documentos, session_id)
+    except AppError as e:
+        await websocket.send_json({"type": "error", "status": e.status_code, "detail": e.user_message, "headers": e.headers or {}})
+        await websocket.close(code=1013)  # try again later
+        return
+    try:
+        while True:
+            mensagem = await websocket.receive_json()
+            tipo = mensagem.get("type")
+            if tipo == "documents":
+                try:
+                    recebidos = expandir_payload(mensagem.get("documents") or {})
+                except (ValueError, TypeError) as e:
+                    await websocket.send_json({"type": "error", "status": 422, "detail": f"cronograma_compacto inválido: {e}"})
+                    continue
+                try:
+                    await executar_em("interativo", salvar_documentos, session_id, recebidos)
+                except AppError as e:
+                    await websocket.send_json({"type": "error", "status": e.status_code, "detail": e.user_message, "headers": e.headers or {}})
+                    continue
+                documentos = recebidos
+                if documentos:
+                    consolidacao_especulativa.agendar(session_id, documentos)
+                await websocket.send_json({"type": "documents_ok", "count": len(documentos)})
+            elif tipo == "message" and mensagem.get("message"):
+                await _turno_ws(websocket, session_id, documentos, mensagem["message"])
+            else:
+                await websocket.send_json({"type": "error", "status": 400, "detail": f"Mensagem inválida: {tipo!r}"})
+    except WebSocketDisconnect:
+        print(f"🔌 [WS] Sessão {session_id} desconectada")
@@ -1,50 +1,146 @@
+import io
+import mimetypes
 import os
 import time
-import uuid
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import Optional
 from google import genai
-from docx import Document
 from dotenv import load_dotenv
 from schemas import DocumentoUnificado  # Certifique-se que o schema atualizado está aqui
+from prompts import registro_prompts, estimar_tokens
+from roteador import Decisao, MODELO_FORTE, classificar_documento, roteador
+from prazos import config_com_prazo, prazo_restante
+from executores import Vaga, executar_em, vaga_em
+from arquivos_remotos import arquivo_ausente, registro_arquivos
+from consumo import contabilidade
+from errors import AppError
 
 load_dotenv()
 
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_REL_OFFICE_DOCUMENT = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+_NAO_DESCER = {
+    _W + "p",
+    _W + "txbxContent",
+    _W + "drawing",
+    _W + "pict",
+    "{http://schemas.openxmlformats.org/markup-compatibility/2006}AlternateContent",
+}
+
+
+def _localizar_documento_principal(pacote: zipfile.ZipFile) -> str:
+    """Descobre o part principal via _rels/.rels (normalmente word/document.xml)."""
+    try:
+        with pacote.open("_rels/.rels") as rels:
+            for _, rel in ET.iterparse(rels):
+                if rel.get("Type") == _REL_OFFICE_DOCUMENT:
+                    return rel.get("Target", "").lstrip("/")
+    except KeyError:
+        pass
+    return "word/document.xml"
+
+
+def _texto_paragrafo(p) -> str:
+    # Mesmo critério do python-docx: w:t, tabulações e quebras; ignora texto
+    # deletado (w:delText) e caixas de texto/desenhos embutidos no parágrafo
+    partes = []
+    pendentes = list(reversed(p))
+    while pendentes:
+        el = pendentes.pop()
+        if el.tag == _W + "t":
+            partes.append(el.text or "")
+        elif el.tag == _W + "tab":
+            partes.append("\t")
+        elif el.tag in (_W + "br", _W + "cr"):
+            partes.append("\n")
+        elif el.tag not in _NAO_DESCER:
+            pendentes.extend(reversed(el))
+    return "".join(partes)
+
+
+def iterar_blocos_docx(file_obj):
+    """
+    Percorre o word/document.xml em streaming, na ordem real do documento.
+    Gera ("paragrafo", texto) e ("linha", [textos das células]).
+
+    Células mescladas aparecem uma única vez (gridSpan já é uma célula só e
+    continuações de vMerge são ignoradas). Tabelas aninhadas entram no texto
+    da célula que as contém. Linhas e células dentro de controles de conteúdo
+    (w:sdt/w:sdtContent) ou w:customXml também são lidas. A memória fica
+    limitada a uma linha de tabela.
+    """
+    with zipfile.ZipFile(file_obj) as pacote:
+        with pacote.open(_localizar_documento_principal(pacote)) as xml:
+            body = None
+            # Elementos abertos: o pai de uma w:tr nem sempre é a w:tbl
+            # (seções repetidas e controles de conteúdo a envolvem em w:sdt)
+            abertos = []
+            nivel_tabela = 0
+            nivel_paragrafo = 0
+            linha = []
+            paragrafos_celula = []
+
+            for evento, el in ET.iterparse(xml, events=("start", "end")):
+                tag = el.tag
+                if evento == "start":
+                    abertos.append(el)
+                    if tag == _W + "body":
+                        body = el
+                    elif tag == _W + "tbl":
+                        nivel_tabela += 1
+                    elif tag == _W + "p":
+                        nivel_paragrafo += 1
+                    continue
+
+                abertos.pop()
+
+                if tag == _W + "p":
+                    nivel_paragrafo -= 1
+                    if nivel_paragrafo > 0:
+                        # Parágrafo de caixa de texto: o python-docx também ignora
+                        continue
+                    if nivel_tabela == 0:
+                        yield "paragrafo", _texto_paragrafo(el)
+                    else:
+                        paragrafos_celula.append(_texto_paragrafo(el))
+                elif tag == _W + "tc" and nivel_tabela == 1:
+                    tc_pr = el.find(_W + "tcPr")
+                    v_merge = tc_pr.find(_W + "vMerge") if tc_pr is not None else None
+                    continuacao = v_merge is not None and v_merge.get(_W + "val", "continue") == "continue"
+                    if not continuacao:
+                        linha.append("\n".join(paragrafos_celula))
+                    paragrafos_celula = []
+                elif tag == _W + "tr" and nivel_tabela == 1:
+                    yield "linha", linha
+                    linha = []
+                    abertos[-1].remove(el)
+                elif tag == _W + "tbl":
+                    nivel_tabela -= 1
+
+                # Descarta blocos de primeiro nível já processados
+                if body is not None and nivel_tabela == 0 and tag in (_W + "p", _W + "tbl", _W + "sdt"):
+                    body.clear()
+
+
 def ler_docx(file_obj):
-    doc = Document(file_obj)
     texto = []
-    for para in doc.paragraphs:
-        if para.text.strip(): texto.append(para.text)
-    for table in doc.tables:
-        for row in table.rows:
-            linha = " | ".join(cell.text.strip() for cell in row.cells if cell.text.strip())
+    for tipo, conteudo in iterar_blocos_docx(file_obj):
+        if tipo == "paragrafo":
+            if conteudo.strip(): texto.append(conteudo)
+        else:
+            celulas = [c.strip() for c in conteudo]
+            linha = " | ".join(c for c in celulas if c)
             if linha: texto.append(f"[Tabela]: {linha}")
     return "\n".join(texto)
 
-def analisar_documento(uploaded_file, model_name="gemini-2.5-pro"):
-    start_total = time.time()
-    api_key = os.getenv("AI_API_KEY")
-    client = genai.Client(api_key=api_key)
 
-    filename = uploaded_file.filename
-    ext = os.path.splitext(filename)[1].lower()
-    conteudo_envio = []
+def ler_docx_bytes(dados: bytes) -> str:
+    # Ponto de entrada picklável para o pool de processos
+    return ler_docx(io.BytesIO(dados))
 
-    if ext == ".docx":
-        texto = ler_docx(uploaded_file.file)
-        conteudo_envio = [texto]
-    else:
-        temp_name = f"temp_{uuid.uuid4().hex}{ext}"
-        try:
-            t_start_upload = time.time()
-            with open(temp_name, "wb") as f:
-                f.write(uploaded_file.file.read())
-            file_ref = client.files.upload(file=temp_name, config={"display_name": filename})
-            print(f"⏱️ [OCR] Upload para Google concluído em {time.time() - t_start_upload:.2f}s")
-            conteudo_envio = [file_ref]
-        finally:
-            if os.path.exists(temp_name): os.remove(temp_name)
-
-    # PROMPT OTIMIZADO PARA PERFORMANCE
-    conteudo_envio.append("""
+# PROMPT OTIMIZADO PARA PERFORMANCE
+INSTRUCOES_OCR = """
     Siga este fluxo lógico para máxima velocidade e precisão:
     
     1. IDENTIFICAÇÃO RÁPIDA: Identifique o tipo de cada documento no arquivo.
@@ -59,46 +155,123 @@ def analisar_documento(uploaded_file, model_name="gemini-2.5-pro"):
     
     3. OUTPUT: Retorne uma LISTA de objetos JSON seguindo o schema DocumentoUnificado.
     Seja conciso no 'resumo_conteudo'.
-    """)
+    """
+
+registro_prompts.registrar("ocr", INSTRUCOES_OCR)
+
+
+CONFIG_OCR = {
+    "response_mime_type": "application/json",
+    "response_schema": list[DocumentoUnificado],
+}
+
+
+def _montar_resultado(response) -> dict:
+    lista_documentos = response.parsed
+
+    # 🔹 TRATAMENTO DO ERRO QUE VOCÊ ESTÁ TENDO
+    if lista_documentos is None:
+        # Tenta recuperar o texto bruto se o parse falhou
+        return {
+            "text": "Erro: O modelo não conseguiu estruturar os dados. O documento pode ser muito complexo ou longo.",
+            "data": []
+        }
+
+    resumo_geral = []
+    for i, doc in enumerate(lista_documentos, 1):
+        bloco = (
+            f"--- DOCUMENTO {i} ---\n"
+            f"Tipo: {doc.tipo_documento}\n"
+            f"Resumo: {doc.resumo_conteudo}\n"
+            f"Parcelas extraídas: {len(doc.cronograma_financeiro)}\n"
+        )
+        resumo_geral.append(bloco)
+
+    return {
+        "text": "\n".join(resumo_geral).strip(),
+        "data": lista_documentos
+    }
+
+
+async def analisar_documento_async(uploaded_file, model_name: Optional[str] = None, reenviar_se_ausente: bool = True):
+    """
+    Upload (só se o conteúdo ainda não tiver handle) e extração via client.aio.
+    Se a tarefa for cancelada (cliente desconectou), a requisição em curso é
+    abortada; o arquivo já enviado fica no registro para a próxima tentativa.
+    Sem model_name, o roteador escolhe entre flash e pro pelo tipo/tamanho do documento.
+    A extração inteira ocupa uma vaga da classe "ocr" (executores.py): a fila e o
+    503 de sobrecarga valem para o upload e a chamada ao modelo, não só para a leitura.
+    """
+    async with vaga_em("ocr") as vaga:
+        return await _extrair(vaga, uploaded_file, model_name, reenviar_se_ausente)
+
+
+async def _extrair(vaga: Vaga, uploaded_file, model_name: Optional[str], reenviar_se_ausente: bool):
+    api_key = os.getenv("AI_API_KEY")
+    client = genai.Client(api_key=api_key)
+
+    filename = uploaded_file.filename
+    ext = os.path.splitext(filename)[1].lower()
+    hash_arquivo = None
+
+    # Falhas da leitura e do upload sobem para o endpoint (cota -> 429), fora do "Erro técnico" abaixo
+    if ext == ".docx":
+        # Parse do .docx é CPU pura: vai para o pool de processos (só os bytes atravessam)
+        dados = await vaga.executar(uploaded_file.file.read)
+        texto = await executar_em("cpu", ler_docx_bytes, dados)
+        conteudo_envio = [texto]
+        sinais = {"tokens": estimar_tokens(texto), "complexidade": classificar_documento(filename)}
+    else:
+        t_start_upload = time.time()
+        dados = await vaga.executar(uploaded_file.file.read)
+        sinais = {"complexidade": classificar_documento(filename, dados)}
+        # Mesmo conteúdo já enviado (outra extração, retry após erro de cota): sem upload
+        file_ref, hash_arquivo = await registro_arquivos.obter_async(
+            client,
+            dados,
+            _tipo_mime(uploaded_file, ext),
+            filename,
+            config=config_com_prazo({}, prazo_restante()),
+        )
+        print(f"⏱️ [OCR] Arquivo disponível no Google em {time.time() - t_start_upload:.2f}s")
+        conteudo_envio = [file_ref]
 
     try:
         t_start_gen = time.time()
-        response = client.models.generate_content(
-            model=model_name,
-            contents=conteudo_envio,
-            config={
-                "response_mime_type": "application/json",
-                "response_schema": list[DocumentoUnificado],
-            }
+        # Modo da sessão (orçamento) lido fora do event loop antes do roteador consultar
+        await contabilidade.carregar_async()
+        if model_name:
+            decisao = Decisao(endpoint="ocr", modelo=model_name, motivo="modelo fixado pelo chamador")
+        else:
+            decisao = roteador.escolher("ocr", padrao=MODELO_FORTE, **sinais)
+        response = await roteador.executar_async(
+            decisao,
+            lambda modelo: registro_prompts.gerar_async(
+                client,
+                modelo=modelo,
+                nome="ocr",
+                conteudo=conteudo_envio,
+                config=CONFIG_OCR,
+            ),
+            # Saída que não validou contra DocumentoUnificado sobe para o pro
+            validar=lambda r: bool(r.parsed),
         )
         print(f"⏱️ [OCR] Geração do modelo concluída em {time.time() - t_start_gen:.2f}s")
-        
-
-        lista_documentos = response.parsed
-
-        # 🔹 TRATAMENTO DO ERRO QUE VOCÊ ESTÁ TENDO
-        if lista_documentos is None:
-            # Tenta recuperar o texto bruto se o parse falhou
-            return {
-                "text": "Erro: O modelo não conseguiu estruturar os dados. O documento pode ser muito complexo ou longo.",
-                "data": []
-            }
-
-        resumo_geral = []
-        for i, doc in enumerate(lista_documentos, 1):
-            bloco = (
-                f"--- DOCUMENTO {i} ---\n"
-                f"Tipo: {doc.tipo_documento}\n"
-                f"Resumo: {doc.resumo_conteudo}\n"
-                f"Parcelas extraídas: {len(doc.cronograma_financeiro)}\n"
-            )
-            resumo_geral.append(bloco)
-
-        return {
-            "text": "\n".join(resumo_geral).strip(),
-            "data": lista_documentos
-        }
+        return _montar_resultado(response)
 
+    except AppError:
+        # Prazo esgotado (504), orçamento da sessão (429): não é documento ilegível
+        raise
     except Exception as e:
         print(f"Erro na chamada da API: {e}")
+        if reenviar_se_ausente and hash_arquivo is not None and arquivo_ausente(e):
+            # Handle reaproveitado que o Gemini já não tem: esquece e tenta de novo com upload
+            await vaga.executar(registro_arquivos.invalidar, hash_arquivo)
+            uploaded_file.file.seek(0)
+            return await _extrair(vaga, uploaded_file, model_name, reenviar_se_ausente=False)
         return {"text": f"Erro técnico: {str(e)}", "data": []}
+
+
+def _tipo_mime(uploaded_file, ext: str) -> str:
+    return getattr(uploaded_file, "content_type", None) or mimetypes.guess_type(f"x{ext}")[0] or "application/octet-stream"
+
@@ -0,0 +1,70 @@
+# prazos.py
+#
+# Prazo por requisição: cada endpoint abre um prazo total (ex.: 10s para o
+# detect-edit) e toda chamada ao modelo feita dentro dele recebe só o tempo
+# que ainda resta. O prazo viaja num ContextVar, então atravessa await,
+# asyncio.to_thread e as tarefas criadas a partir da requisição.
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from errors import DeadlineExceededError
+
+PRAZOS_ENDPOINT = {
+    "ocr": 90.0,
+    "chat": 30.0,
+    "detect-edit": 10.0,
+    "edit": 15.0,
+    "draft": 120.0,
+    "contrato": 180.0,
+    "turno-ws": 30.0,
+}
+PRAZO_PADRAO = 60.0
+# Abaixo disso não vale a pena nem disparar a chamada
+PRAZO_MINIMO = 0.5
+
+_limite: ContextVar[Optional[float]] = ContextVar("prazo_limite", default=None)
+_endpoint: ContextVar[Optional[str]] = ContextVar("prazo_endpoint", default=None)
+
+
+@contextmanager
+def prazo_da_requisicao(endpoint: str, segundos: Optional[float] = None):
+    limite = time.monotonic() + (segundos or PRAZOS_ENDPOINT.get(endpoint, PRAZO_PADRAO))
+    # Prazo aninhado nunca estende o de fora
+    externo = _limite.get()
+    if externo is not None:
+        limite = min(limite, externo)
+    token_limite = _limite.set(limite)
+    token_endpoint = _endpoint.set(endpoint)
+    try:
+        yield
+    finally:
+        _limite.reset(token_limite)
+        _endpoint.reset(token_endpoint)
+
+
+def endpoint_atual() -> Optional[str]:
+    """Endpoint do prazo em curso (para atribuir consumo e métricas)."""
+    return _endpoint.get()
+
+
+def prazo_restante(teto: Optional[float] = None) -> float:
+    """
+    Segundos disponíveis para a próxima chamada: o menor entre `teto` (SLO da
+    chamada) e o que sobra do prazo da requisição. Levanta DeadlineExceededError
+    se o prazo já acabou.
+    """
+    limite = _limite.get()
+    if limite is None:
+        return teto if teto is not None else PRAZO_PADRAO
+    restante = limite - time.monotonic()
+    if restante < PRAZO_MINIMO:
+        raise DeadlineExceededError(_endpoint.get() or "requisição")
+    return min(restante, teto) if teto is not None else restante
+
+
+def config_com_prazo(config: Optional[dict], prazo: float) -> dict:
+    """Repassa o prazo ao SDK (http_options.timeout, em milissegundos)."""
+    return {**(config or {}), "http_options": {"timeout": int(prazo * 1000)}}
@@ -0,0 +1,319 @@
+# prompts.py
+#
+# Registro de prompts com prefixo estático + sufixo dinâmico.
+#
+# Os prompts grandes (regras de geração do contrato + layout do template,
+# detecção de edição, instruções de OCR) são quase todos texto fixo. Aqui o
+# prefixo fixo é registrado uma vez no context caching do Gemini e cada chamada
+# envia só o sufixo dinâmico (draft, mensagem, arquivo) apontando para o cache.
+# Se o cache não estiver disponível (prefixo abaixo do mínimo de tokens, erro
+# do provedor, cache expirado), a chamada cai de forma transparente no prompt
+# completo.
+
+import threading
+import time
+from typing import Any, Dict, List, Optional, Union
+
+from cache import obter_cache, hash_json
+from consumo import contabilidade
+from executores import executar_na_vaga_ou_em
+
+# Mínimo de tokens aceito pelo context caching, por família de modelo
+MIN_TOKENS_CACHE = {"flash": 1024, "pro": 2048}
+TTL_PADRAO = 3600
+MARGEM_RENOVACAO = 300
+ESPERA_APOS_FALHA = 1800
+
+Conteudo = Union[str, List[Any]]
+
+
+def estimar_tokens(texto: str) -> int:
+    # ~4 caracteres por token em português; só para decidir se vale tentar o cache
+    return len(texto) // 4
+
+
+def _minimo_tokens(modelo: str) -> int:
+    for familia, minimo in MIN_TOKENS_CACHE.items():
+        if familia in modelo:
+            return minimo
+    return max(MIN_TOKENS_CACHE.values())
+
+
+def _eh_erro_de_cota(erro: Exception) -> bool:
+    texto = str(erro).lower()
+    return "quota" in texto or "resourceexhausted" in texto or "429" in texto
+
+
+class MetricasPrompt:
+    def __init__(self):
+        # gerar() roda em threads dos executores e gerar_async() no event loop
+        self._lock = threading.Lock()
+        self.chamadas = 0
+        self.com_cache = 0
+        self.fallbacks = 0
+        self.tokens_entrada = 0
+        self.tokens_economizados = 0
+
+    def somar(self, **incrementos: int) -> None:
+        with self._lock:
+            for campo, valor in incrementos.items():
+                setattr(self, campo, getattr(self, campo) + valor)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "chamadas": self.chamadas,
+                "com_cache": self.com_cache,
+                "fallbacks": self.fallbacks,
+                "tokens_entrada": self.tokens_entrada,
+                "tokens_economizados": self.tokens_economizados,
+                "tokens_economizados_por_chamada": round(self.tokens_economizados / self.chamadas, 1) if self.chamadas else 0,
+            }
+
+
+class RegistroPrompts:
+    """
+    Guarda os prefixos por nome e os handles de cache por (prefixo, modelo).
+    Os handles ficam no cache compartilhado (cache.py), então todos os workers
+    reaproveitam o mesmo CachedContent.
+    """
+
+    def __init__(self, ttl: int = TTL_PADRAO, margem_renovacao: int = MARGEM_RENOVACAO):
+        self.ttl = ttl
+        self.margem_renovacao = margem_renovacao
+        self._prefixos: Dict[str, str] = {}
+        self._metricas: Dict[str, MetricasPrompt] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, nome: str, prefixo: str) -> None:
+        with self._lock:
+            self._prefixos[nome] = prefixo
+            self._metricas.setdefault(nome, MetricasPrompt())
+
+    def prefixo(self, nome: str) -> str:
+        return self._prefixos[nome]
+
+    def metricas(self) -> dict:
+        return {nome: m.snapshot() for nome, m in self._metricas.items()}
+
+    # =========================
+    # HANDLES DE CACHE
+    # =========================
+
+    def _chave(self, nome: str, modelo: str) -> str:
+        return f"prompt_cache:{nome}:{modelo}:{hash_json(self._prefixos[nome])[:16]}"
+
+    def _lock_da_chave(self, chave: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(chave, threading.Lock())
+
+    def _obter_handle(self, client, nome: str, modelo: str) -> Optional[str]:
+        prefixo = self._prefixos[nome]
+        if estimar_tokens(prefixo) < _minimo_tokens(modelo):
+            return None
+
+        store = obter_cache()
+        chave = self._chave(nome, modelo)
+        with self._lock_da_chave(chave):
+            handle = store.get_json(chave)
+            agora = time.time()
+
+            if handle and handle.get("indisponivel_ate", 0) > agora:
+                return None
+
+            if handle and handle.get("name") and handle["expira"] > agora:
+                if handle["expira"] - agora < self.margem_renovacao:
+                    # Renova o TTL antes de expirar, em vez de recriar o cache
+                    try:
+                        client.caches.update(name=handle["name"], config={"ttl": f"{self.ttl}s"})
+                        handle["expira"] = agora + self.ttl
+                        store.set_json(chave, handle, ttl=self.ttl)
+                    except Exception as e:
+                        print(f"⚠️ [PROMPT-CACHE] Falha ao renovar {nome}: {e}")
+                        store.delete(chave)
+                        return None
+                return handle["name"]
+
+            try:
+                criado = client.caches.create(
+                    model=modelo,
+                    config={
+                        "contents": [prefixo],
+                        "display_name": nome,
+                        "ttl": f"{self.ttl}s",
+                    },
+                )
+            except Exception as e:
+                print(f"⚠️ [PROMPT-CACHE] Cache indisponível para {nome} ({modelo}): {e}")
+                store.set_json(chave, {"indisponivel_ate": agora + ESPERA_APOS_FALHA}, ttl=ESPERA_APOS_FALHA)
+                return None
+
+            handle = {"name": criado.name, "expira": agora + self.ttl}
+            store.set_json(chave, handle, ttl=self.ttl)
+            print(f"🧊 [PROMPT-CACHE] Prefixo {nome} registrado para {modelo}: {criado.name}")
+            return criado.name
+
+    def invalidar(self, nome: str, modelo: str) -> None:
+        obter_cache().delete(self._chave(nome, modelo))
+
+    # =========================
+    # GERAÇÃO
+    # =========================
+
+    def gerar(self, client, *, modelo: str, nome: str, conteudo: Conteudo, config: Optional[dict] = None):
+        """
+        Equivalente a client.models.generate_content com contents = prefixo + conteudo.
+        Usa o prefixo em cache quando possível e registra os tokens economizados.
+        """
+        sufixo = conteudo if isinstance(conteudo, list) else [conteudo]
+        config = dict(config or {})
+        metricas = self._metricas[nome]
+        metricas.somar(chamadas=1)
+        contabilidade.verificar()
+        inicio = time.monotonic()
+
+        handle = self._obter_handle(client, nome, modelo)
+        if handle:
+            try:
+                resposta = client.models.generate_content(
+                    model=modelo,
+                    contents=sufixo,
+                    config={**config, "cached_content": handle},
+                )
+                metricas.somar(com_cache=1)
+                self._contabilizar(nome, modelo, metricas, resposta, inicio)
+                return resposta
+            except Exception as e:
+                if _eh_erro_de_cota(e):
+                    raise
+                print(f"⚠️ [PROMPT-CACHE] Chamada com cache falhou para {nome}, usando prompt completo: {e}")
+                self.invalidar(nome, modelo)
+                metricas.somar(fallbacks=1)
+
+        resposta = client.models.generate_content(
+            model=modelo,
+            contents=[self._prefixos[nome], *sufixo],
+            config=config or None,
+        )
+        self._contabilizar(nome, modelo, metricas, resposta, inicio)
+        return resposta
+
+    async def gerar_async(
+        self, client, *, modelo: str, nome: str, conteudo: Conteudo, config: Optional[dict] = None,
+        classe: str = "interativo",
+    ):
+        """
+        Versão assíncrona de gerar() (client.aio). Se a tarefa for cancelada, a
+        requisição HTTP ao Gemini é abortada junto, em vez de seguir numa thread.
+        A busca/criação do handle (cache compartilhado + caches.create) é bloqueante
+        e roda na classe de carga `classe` (executores.py), ou na vaga que a
+        tarefa já ocupa (extração de OCR).
+        """
+        sufixo = conteudo if isinstance(conteudo, list) else [conteudo]
+        config = dict(config or {})
+        metricas = self._metricas[nome]
+        metricas.somar(chamadas=1)
+        await contabilidade.verificar_async()
+        inicio = time.monotonic()
+
+        handle = await executar_na_vaga_ou_em(classe, self._obter_handle, client, nome, modelo)
+        if handle:
+            try:
+                resposta = await client.aio.models.generate_content(
+                    model=modelo,
+                    contents=sufixo,
+                    config={**config, "cached_content": handle},
+                )
+                metricas.somar(com_cache=1)
+                await self._contabilizar_async(nome, modelo, metricas, resposta, inicio)
+                return resposta
+            except Exception as e:
+                if _eh_erro_de_cota(e):
+                    raise
+                print(f"⚠️ [PROMPT-CACHE] Chamada com cache falhou para {nome}, usando prompt completo: {e}")
+                await executar_na_vaga_ou_em(classe, self.invalidar, nome, modelo)
+                metricas.somar(fallbacks=1)
+
+        resposta = await client.aio.models.generate_content(
+            model=modelo,
+            contents=[self._prefixos[nome], *sufixo],
+            config=config or None,
+        )
+        await self._contabilizar_async(nome, modelo, metricas, resposta, inicio)
+        return resposta
+
+    def gerar_stream(self, client, *, modelo: str, nome: str, conteudo: Conteudo, config: Optional[dict] = None):
+        """
+        Versão em streaming de gerar(). O fallback para o prompt completo só é
+        possível antes do primeiro chunk; depois disso o erro sobe para quem chamou.
+        """
+        sufixo = conteudo if isinstance(conteudo, list) else [conteudo]
+        config = dict(config or {})
+        metricas = self._metricas[nome]
+        metricas.somar(chamadas=1)
+        contabilidade.verificar()
+        inicio = time.monotonic()
+
+        handle = self._obter_handle(client, nome, modelo)
+        if handle:
+            try:
+                chunks = client.models.generate_content_stream(
+                    model=modelo,
+                    contents=sufixo,
+                    config={**config, "cached_content": handle},
+                )
+                primeiro = next(chunks, None)
+            except Exception as e:
+                if _eh_erro_de_cota(e):
+                    raise
+                print(f"⚠️ [PROMPT-CACHE] Stream com cache falhou para {nome}, usando prompt completo: {e}")
+                self.invalidar(nome, modelo)
+                metricas.somar(fallbacks=1)
+            else:
+                metricas.somar(com_cache=1)
+                yield from self._repassar_stream(nome, modelo, metricas, primeiro, chunks, inicio)
+                return
+
+        chunks = client.models.generate_content_stream(
+            model=modelo,
+            contents=[self._prefixos[nome], *sufixo],
+            config=config or None,
+        )
+        yield from self._repassar_stream(nome, modelo, metricas, next(chunks, None), chunks, inicio)
+
+    def _repassar_stream(self, nome: str, modelo: str, metricas: MetricasPrompt, primeiro, chunks, inicio: float):
+        ultimo = None
+        for chunk in ([primeiro] if primeiro is not None else []):
+            ultimo = chunk
+            yield chunk
+        for chunk in chunks:
+            ultimo = chunk
+            yield chunk
+        # O usage_metadata completo vem no último chunk
+        if ultimo is not None:
+            self._contabilizar(nome, modelo, metricas, ultimo, inicio)
+
+    @staticmethod
+    def _contabilizar(nome: str, modelo: str, metricas: MetricasPrompt, resposta, inicio: float) -> None:
+        # Sessão/endpoint/relatório por prompt (consumo.py); aqui só o efeito do context caching
+        contabilidade.registrar(nome, modelo, resposta, time.monotonic() - inicio)
+        RegistroPrompts._somar_cache(metricas, resposta)
+
+    @staticmethod
+    async def _contabilizar_async(nome: str, modelo: str, metricas: MetricasPrompt, resposta, inicio: float) -> None:
+        await contabilidade.registrar_async(nome, modelo, resposta, time.monotonic() - inicio)
+        RegistroPrompts._somar_cache(metricas, resposta)
+
+    @staticmethod
+    def _somar_cache(metricas: MetricasPrompt, resposta) -> None:
+        uso = getattr(resposta, "usage_metadata", None)
+        if uso is None:
+            return
+        metricas.somar(
+            tokens_entrada=getattr(uso, "prompt_token_count", 0) or 0,
+            tokens_economizados=getattr(uso, "cached_content_token_count", 0) or 0,
+        )
+
+
+registro_prompts = RegistroPrompts()
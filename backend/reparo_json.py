@@ -0,0 +1,163 @@
+# reparo_json.py
+#
+# Reparo local de JSON devolvido pelo modelo. Mesmo com response_schema, a
+# saída pode vir truncada (max_output_tokens, prazo) ou, no modelo rápido, com
+# cercas de Markdown, texto antes do objeto ou vírgula sobrando. Consertar isso
+# aqui custa microssegundos; perguntar de novo ao modelo custa uma chamada.
+#
+# - extrair_json: parse direto e, se falhar, o reparo.
+# - Reparo de formato: tira cercas ```json, começa no primeiro "{", ignora o que
+#   vier depois do objeto e remove vírgulas antes de "}"/"]". O conteúdo é o
+#   que o modelo mandou.
+# - Reparo de truncamento: fecha string e chaves/colchetes abertos e, se ainda
+#   não for válido, corta no último elemento completo. O último campo pode
+#   estar pela metade; quem chama decide o que aproveitar.
+
+import json
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+_CERCA = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.DOTALL | re.IGNORECASE)
+
+
+def _sem_cerca(texto: str) -> str:
+    m = _CERCA.search(texto)
+    return m.group(1) if m else texto
+
+
+def _remover_virgula_final(saida: List[str]) -> None:
+    i = len(saida) - 1
+    while i >= 0 and saida[i].isspace():
+        i -= 1
+    if i >= 0 and saida[i] == ",":
+        del saida[i:]
+
+
+def _fechar(saida: List[str], pilha: List[str], em_string: bool) -> str:
+    saida = list(saida)
+    if em_string:
+        if saida and saida[-1] == "\\":
+            saida.pop()
+        saida.append('"')
+    _remover_virgula_final(saida)
+    texto = "".join(saida).rstrip()
+    if texto.endswith(":"):
+        texto += "null"
+    return texto + "".join(reversed(pilha))
+
+
+def _candidatos(texto: str) -> Tuple[List[str], bool]:
+    """
+    Versões fechadas do primeiro objeto do texto, da mais completa à mais
+    curta, e se o objeto estava truncado.
+    """
+    inicio = texto.find("{")
+    if inicio < 0:
+        return [], False
+    saida: List[str] = []
+    pilha: List[str] = []
+    em_string = escape = False
+    ultimo_elemento: Optional[Tuple[int, List[str]]] = None
+
+    for c in texto[inicio:]:
+        if em_string:
+            saida.append(c)
+            if escape:
+                escape = False
+            elif c == "\\":
+                escape = True
+            elif c == '"':
+                em_string = False
+            continue
+        if c == '"':
+            em_string = True
+        elif c in "{[":
+            pilha.append("}" if c == "{" else "]")
+        elif c in "}]":
+            if not pilha or pilha[-1] != c:
+                break
+            _remover_virgula_final(saida)
+            pilha.pop()
+            saida.append(c)
+            if not pilha:
+                # Objeto completo; o que vier depois é texto solto do modelo
+                return ["".join(saida)], False
+            continue
+        elif c == ",":
+            ultimo_elemento = (len(saida), list(pilha))
+        saida.append(c)
+
+    candidatos = [_fechar(saida, pilha, em_string)]
+    if ultimo_elemento is not None:
+        posicao, pilha_antes = ultimo_elemento
+        candidatos.append(_fechar(saida[:posicao], pilha_antes, False))
+    return candidatos, True
+
+
+def reparar_json(texto: str) -> Tuple[Optional[dict], bool]:
+    """(objeto, truncado); (None, False) se nenhum candidato for um objeto JSON."""
+    candidatos, truncado = _candidatos(_sem_cerca(texto or ""))
+    for candidato in candidatos:
+        try:
+            valor = json.loads(candidato)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(valor, dict):
+            return valor, truncado
+    return None, False
+
+
+def extrair_json(texto: Optional[str]) -> Tuple[Optional[dict], Optional[str]]:
+    """
+    (objeto, reparo), com reparo None (JSON já válido), "formato" ou
+    "truncado". (None, None) quando nem o reparo resolve.
+    """
+    texto = (texto or "").strip()
+    try:
+        valor = json.loads(texto)
+        if isinstance(valor, dict):
+            return valor, None
+    except json.JSONDecodeError:
+        pass
+    valor, truncado = reparar_json(texto)
+    if valor is None:
+        return None, None
+    return valor, "truncado" if truncado else "formato"
+
+
+# =========================
+# MÉTRICAS
+# =========================
+
+class MetricasParse:
+    """Por endpoint: como cada resposta do modelo virou JSON (ou não) e quantas reperguntas custou."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._contagens: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def registrar(self, endpoint: str, resultado: str) -> None:
+        # resultado: "schema" | "direto" | "formato" | "truncado" | "falha" | "repergunta"
+        with self._lock:
+            self._contagens[endpoint][resultado] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            saida = {}
+            for endpoint, c in self._contagens.items():
+                reparadas = c["formato"] + c["truncado"]
+                respostas = c["schema"] + c["direto"] + reparadas + c["falha"]
+                turnos = respostas - c["repergunta"]
+                saida[endpoint] = {
+                    **dict(c),
+                    "respostas_do_modelo": respostas,
+                    "taxa_falha_parse": round((reparadas + c["falha"]) / respostas, 4) if respostas else None,
+                    "taxa_reparo_local": round(reparadas / respostas, 4) if respostas else None,
+                    "taxa_repergunta": round(c["repergunta"] / turnos, 4) if turnos else None,
+                }
+            return saida
+
+
+metricas_parse = MetricasParse()
@@ -0,0 +1,481 @@
+# roteador.py
+#
+# Roteamento adaptativo entre gemini-2.5-flash e gemini-2.5-pro.
+#
+# Em vez de um modelo fixo por função, cada chamada escolhe o modelo a partir
+# do tamanho do prompt, do tipo de documento (RG x extrato de 360 parcelas) e
+# da latência observada por rota. Cada endpoint tem um SLO de latência: se o
+# modelo forte estoura o prazo, a chamada cai para o rápido; se o rápido
+# devolve uma saída estruturada inválida, ela sobe para o forte.
+
+import asyncio
+import contextvars
+import os
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeout
+from concurrent.futures import wait as futures_wait
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+from pydantic import BaseModel
+
+from consumo import contabilidade
+from entidades import normalizar_texto
+from errors import DeadlineExceededError
+from prazos import prazo_restante
+
+MODELO_RAPIDO = "gemini-2.5-flash"
+MODELO_FORTE = "gemini-2.5-pro"
+# Sessão no modo degradado por orçamento de tokens: rápido, sem escalar para o forte
+MOTIVO_ORCAMENTO = "orçamento da sessão"
+
+# Prazo (segundos) de cada chamada ao modelo, por endpoint; limitado ainda pelo
+# prazo total da requisição (prazos.py)
+SLO_SEGUNDOS = {
+    "ocr": 45.0,
+    "chat": 20.0,
+    "detect-edit": 8.0,
+    "edit": 12.0,
+    "draft": 40.0,
+}
+
+# Até quantos tokens de prompt o modelo rápido dá conta com folga
+LIMITE_TOKENS_RAPIDO = {
+    "ocr": 8000,
+    "chat": 12000,
+    "detect-edit": 4000,
+    "edit": 30000,
+    "draft": 60000,
+}
+
+JANELA_LATENCIAS = 200
+MIN_AMOSTRAS = 10
+
+TIPOS_SIMPLES = ("rg", "cnh", "identidade", "cpf", "certidao", "nascimento", "casamento", "comprovante", "residencia", "conta de luz")
+TIPOS_COMPLEXOS = ("extrato", "contrato", "matricula", "escritura", "financiamento", "parcelas", "planilha")
+EXTENSOES_IMAGEM = (".jpg", ".jpeg", ".png", ".webp", ".heic")
+PAGINAS_COMPLEXO = 4
+
+# Fração máxima de chamadas que podem virar duas requisições
+ORCAMENTO_HEDGE = 0.1
+
+T = TypeVar("T")
+
+# Tentativas síncronas com hedge rodam aqui, para poder esperar a primeira com timeout
+_executor_hedge = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+
+
+# =========================
+# SINAIS
+# =========================
+
+def contar_paginas_pdf(dados: bytes) -> Optional[int]:
+    """Contagem aproximada de páginas sem abrir o PDF (objetos /Type /Page)."""
+    if not dados.startswith(b"%PDF"):
+        return None
+    return len(re.findall(rb"/Type\s*/Page(?!s)", dados)) or None
+
+
+def classificar_documento(nome_arquivo: str, dados: Optional[bytes] = None) -> str:
+    """'simples' (RG, CNH, comprovante), 'complexo' (extrato, matrícula...) ou 'desconhecido'."""
+    nome = normalizar_texto(os.path.splitext(nome_arquivo or "")[0].replace("_", " ").replace("-", " "))
+    if any(re.search(rf"\b{t}\b", nome) for t in TIPOS_COMPLEXOS):
+        return "complexo"
+    if any(re.search(rf"\b{t}\b", nome) for t in TIPOS_SIMPLES):
+        return "simples"
+
+    ext = os.path.splitext(nome_arquivo or "")[1].lower()
+    if ext in EXTENSOES_IMAGEM:
+        # Foto de documento de identidade ou comprovante, quase sempre
+        return "simples"
+    if dados is not None:
+        paginas = contar_paginas_pdf(dados)
+        if paginas is not None:
+            return "complexo" if paginas >= PAGINAS_COMPLEXO else "simples"
+    return "desconhecido"
+
+
+# =========================
+# MÉTRICAS
+# =========================
+
+def percentil(valores, p: float) -> Optional[float]:
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+class EstatisticasRota:
+    def __init__(self):
+        self.latencias: Deque[float] = deque(maxlen=JANELA_LATENCIAS)
+        self.chamadas = 0
+        self.timeouts = 0
+        self.invalidas = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "chamadas": self.chamadas,
+            "timeouts": self.timeouts,
+            "saidas_invalidas": self.invalidas,
+            "p50_s": _arredondar(percentil(self.latencias, 50)),
+            "p90_s": _arredondar(percentil(self.latencias, 90)),
+            "p99_s": _arredondar(percentil(self.latencias, 99)),
+        }
+
+
+def _arredondar(valor: Optional[float]) -> Optional[float]:
+    return round(valor, 3) if valor is not None else None
+
+
+class EstatisticasHedge:
+    def __init__(self):
+        self.chamadas = 0
+        self.hedges = 0
+        self.vitorias = 0
+        self.latencias: Deque[float] = deque(maxlen=JANELA_LATENCIAS)
+        self.latencias_sem_hedge: Deque[float] = deque(maxlen=JANELA_LATENCIAS)
+
+    def snapshot(self) -> dict:
+        p99 = percentil(self.latencias, 99)
+        p99_sem_hedge = percentil(self.latencias_sem_hedge, 99)
+        return {
+            "chamadas": self.chamadas,
+            "hedges": self.hedges,
+            "taxa_hedge": round(self.hedges / self.chamadas, 3) if self.chamadas else 0,
+            "vitorias_do_hedge": self.vitorias,
+            "p99_s": _arredondar(p99),
+            "p99_sem_hedge_s": _arredondar(p99_sem_hedge),
+            "ganho_p99_s": _arredondar(p99_sem_hedge - p99) if p99 is not None and p99_sem_hedge is not None else None,
+        }
+
+
+class Decisao(BaseModel):
+    endpoint: str
+    modelo: str
+    motivo: str
+
+
+# =========================
+# ROTEADOR
+# =========================
+
+class Roteador:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rotas: Dict[Tuple[str, str], EstatisticasRota] = defaultdict(EstatisticasRota)
+        self._decisoes: Dict[Tuple[str, str, str], int] = defaultdict(int)
+        self.fallbacks: Dict[str, int] = defaultdict(int)
+        self.escalonamentos: Dict[str, int] = defaultdict(int)
+        self._hedges: Dict[str, EstatisticasHedge] = defaultdict(EstatisticasHedge)
+
+    @property
+    def ativo(self) -> bool:
+        return os.getenv("ROTEADOR_DESATIVADO", "").lower() not in ("1", "true", "sim")
+
+    def slo(self, endpoint: str) -> float:
+        return SLO_SEGUNDOS.get(endpoint, 30.0)
+
+    def p90(self, endpoint: str, modelo: str) -> Optional[float]:
+        with self._lock:
+            rota = self._rotas.get((endpoint, modelo))
+            if rota is None or len(rota.latencias) < MIN_AMOSTRAS:
+                return None
+            return percentil(rota.latencias, 90)
+
+    def escolher(
+        self,
+        endpoint: str,
+        *,
+        padrao: str,
+        tokens: Optional[int] = None,
+        complexidade: Optional[str] = None,
+    ) -> Decisao:
+        if contabilidade.degradado("modelo_rapido", "modelo_rapido"):
+            # Sessão perto do orçamento de tokens (ver consumo.py)
+            return self._registrar(Decisao(endpoint=endpoint, modelo=MODELO_RAPIDO, motivo=MOTIVO_ORCAMENTO))
+        if not self.ativo:
+            return self._registrar(Decisao(endpoint=endpoint, modelo=padrao, motivo="roteador desativado"))
+
+        limite = LIMITE_TOKENS_RAPIDO.get(endpoint)
+        if complexidade == "complexo":
+            decisao = Decisao(endpoint=endpoint, modelo=MODELO_FORTE, motivo="documento complexo")
+        elif tokens is not None and limite is not None and tokens > limite:
+            decisao = Decisao(endpoint=endpoint, modelo=MODELO_FORTE, motivo=f"prompt grande ({tokens} tokens)")
+        elif complexidade == "simples":
+            decisao = Decisao(endpoint=endpoint, modelo=MODELO_RAPIDO, motivo="documento simples")
+        elif tokens is not None and limite is not None:
+            decisao = Decisao(endpoint=endpoint, modelo=MODELO_RAPIDO, motivo=f"prompt curto ({tokens} tokens)")
+        else:
+            decisao = Decisao(endpoint=endpoint, modelo=padrao, motivo="padrão do endpoint")
+
+        # Latência observada: se o forte vem estourando o SLO e o rápido não, troca
+        if decisao.modelo == MODELO_FORTE and complexidade != "complexo":
+            p90_forte = self.p90(endpoint, MODELO_FORTE)
+            p90_rapido = self.p90(endpoint, MODELO_RAPIDO)
+            if p90_forte is not None and p90_forte > self.slo(endpoint) and (p90_rapido is None or p90_rapido <= self.slo(endpoint)):
+                decisao = Decisao(endpoint=endpoint, modelo=MODELO_RAPIDO, motivo=f"p90 do pro acima do SLO ({p90_forte:.1f}s)")
+
+        return self._registrar(decisao)
+
+    def _registrar(self, decisao: Decisao) -> Decisao:
+        with self._lock:
+            self._decisoes[(decisao.endpoint, decisao.modelo, decisao.motivo.split(" (")[0])] += 1
+        print(f"🧭 [ROTEADOR] {decisao.endpoint}: {decisao.modelo} ({decisao.motivo})")
+        return decisao
+
+    def _contar(self, contador: Dict[str, int], endpoint: str) -> None:
+        # executar() roda em threads dos executores; executar_async() no event loop
+        with self._lock:
+            contador[endpoint] += 1
+
+    def observar(self, endpoint: str, modelo: str, duracao: Optional[float], *, timeout: bool = False, invalida: bool = False) -> None:
+        with self._lock:
+            rota = self._rotas[(endpoint, modelo)]
+            rota.chamadas += 1
+            if duracao is not None:
+                rota.latencias.append(duracao)
+            rota.timeouts += int(timeout)
+            rota.invalidas += int(invalida)
+
+    def metricas(self) -> dict:
+        with self._lock:
+            return {
+                "decisoes": [
+                    {"endpoint": e, "modelo": m, "motivo": motivo, "total": n}
+                    for (e, m, motivo), n in sorted(self._decisoes.items())
+                ],
+                "rotas": {f"{e}:{m}": rota.snapshot() for (e, m), rota in sorted(self._rotas.items())},
+                "fallbacks_por_timeout": dict(self.fallbacks),
+                "escalonamentos_por_validacao": dict(self.escalonamentos),
+                "slo_s": SLO_SEGUNDOS,
+            }
+
+    # =========================
+    # EXECUÇÃO
+    # =========================
+
+    async def executar_async(
+        self,
+        decisao: Decisao,
+        chamada: Callable[[str], Awaitable[T]],
+        validar: Optional[Callable[[T], bool]] = None,
+        hedge: bool = False,
+    ) -> T:
+        """
+        chamada(modelo) -> corrotina. Cada tentativa recebe como prazo o menor
+        entre o SLO do endpoint e o que resta do prazo da requisição
+        (asyncio.wait_for cancela a requisição em curso). Cai para o modelo
+        rápido em timeout do forte e sobe para o forte se a saída do rápido não
+        validar. Com hedge=True (só chamadas idempotentes), dispara uma segunda
+        requisição se a primeira passar do p90 observado.
+        """
+        endpoint, modelo = decisao.endpoint, decisao.modelo
+        inicio = time.time()
+        try:
+            resultado = await self._tentar_async(endpoint, modelo, chamada, prazo_restante(self.slo(endpoint)), hedge)
+        except asyncio.TimeoutError:
+            self.observar(endpoint, modelo, None, timeout=True)
+            if modelo != MODELO_FORTE:
+                raise DeadlineExceededError(endpoint)
+            print(f"⏳ [ROTEADOR] {endpoint}: {modelo} estourou o prazo, caindo para {MODELO_RAPIDO}")
+            self._contar(self.fallbacks, endpoint)
+            return await self._medir_async(endpoint, MODELO_RAPIDO, chamada, hedge)
+
+        valido = validar is None or validar(resultado)
+        self.observar(endpoint, modelo, time.time() - inicio, invalida=not valido)
+        if valido or modelo == MODELO_FORTE or decisao.motivo == MOTIVO_ORCAMENTO:
+            return resultado
+
+        print(f"⬆️ [ROTEADOR] {endpoint}: saída inválida do {modelo}, escalando para {MODELO_FORTE}")
+        self._contar(self.escalonamentos, endpoint)
+        return await self._medir_async(endpoint, MODELO_FORTE, chamada, hedge)
+
+    async def _medir_async(self, endpoint: str, modelo: str, chamada, hedge: bool):
+        inicio = time.time()
+        try:
+            resultado = await self._tentar_async(endpoint, modelo, chamada, prazo_restante(self.slo(endpoint)), hedge)
+        except asyncio.TimeoutError:
+            self.observar(endpoint, modelo, None, timeout=True)
+            raise DeadlineExceededError(endpoint)
+        self.observar(endpoint, modelo, time.time() - inicio)
+        return resultado
+
+    async def _tentar_async(self, endpoint: str, modelo: str, chamada, prazo: float, hedge: bool):
+        atraso = self._atraso_hedge(endpoint, modelo, prazo) if hedge else None
+        inicio = time.monotonic()
+        if atraso is None:
+            resultado = await asyncio.wait_for(chamada(modelo), timeout=prazo)
+            if hedge:
+                self._observar_hedge(endpoint, time.monotonic() - inicio)
+            return resultado
+
+        primeira = asyncio.ensure_future(chamada(modelo))
+        pendentes = {primeira}
+        try:
+            feitas, _ = await asyncio.wait(pendentes, timeout=atraso)
+            if feitas:
+                self._observar_hedge(endpoint, time.monotonic() - inicio)
+                return primeira.result()
+
+            print(f"🪞 [HEDGE] {endpoint}: sem resposta em {atraso:.2f}s (p90), disparando segunda requisição")
+            segunda = asyncio.ensure_future(chamada(modelo))
+            pendentes = {primeira, segunda}
+            erro = None
+            while pendentes:
+                restante = prazo - (time.monotonic() - inicio)
+                feitas, pendentes = await asyncio.wait(pendentes, timeout=max(restante, 0), return_when=asyncio.FIRST_COMPLETED)
+                if not feitas:
+                    raise asyncio.TimeoutError()
+                for tarefa in feitas:
+                    if tarefa.exception() is None:
+                        # A outra tentativa é cancelada no finally (aborta a requisição HTTP)
+                        self._observar_vencedora(endpoint, inicio, venceu_hedge=tarefa is segunda, primeira_pendente=primeira in pendentes)
+                        return tarefa.result()
+                    erro = erro or tarefa.exception()
+            raise erro
+        finally:
+            for tarefa in pendentes:
+                tarefa.cancel()
+
+    def executar(
+        self,
+        decisao: Decisao,
+        chamada: Callable[[str, float], T],
+        validar: Optional[Callable[[T], bool]] = None,
+        hedge: bool = False,
+    ) -> T:
+        """
+        Versão síncrona (chamadas feitas em thread). chamada(modelo, prazo) deve
+        repassar o prazo ao cliente HTTP — ver prazos.config_com_prazo().
+        """
+        endpoint, modelo = decisao.endpoint, decisao.modelo
+        inicio = time.time()
+        try:
+            resultado = self._tentar(endpoint, modelo, chamada, prazo_restante(self.slo(endpoint)), hedge)
+        except Exception as e:
+            if not eh_timeout(e):
+                raise
+            self.observar(endpoint, modelo, None, timeout=True)
+            if modelo != MODELO_FORTE:
+                raise DeadlineExceededError(endpoint) from e
+            print(f"⏳ [ROTEADOR] {endpoint}: {modelo} estourou o prazo, caindo para {MODELO_RAPIDO}")
+            self._contar(self.fallbacks, endpoint)
+            return self._medir(endpoint, MODELO_RAPIDO, chamada, hedge)
+
+        valido = validar is None or validar(resultado)
+        self.observar(endpoint, modelo, time.time() - inicio, invalida=not valido)
+        if valido or modelo == MODELO_FORTE or decisao.motivo == MOTIVO_ORCAMENTO:
+            return resultado
+
+        print(f"⬆️ [ROTEADOR] {endpoint}: saída inválida do {modelo}, escalando para {MODELO_FORTE}")
+        self._contar(self.escalonamentos, endpoint)
+        return self._medir(endpoint, MODELO_FORTE, chamada, hedge)
+
+    def _medir(self, endpoint: str, modelo: str, chamada, hedge: bool):
+        inicio = time.time()
+        try:
+            resultado = self._tentar(endpoint, modelo, chamada, prazo_restante(self.slo(endpoint)), hedge)
+        except Exception as e:
+            if eh_timeout(e):
+                self.observar(endpoint, modelo, None, timeout=True)
+                raise DeadlineExceededError(endpoint) from e
+            raise
+        self.observar(endpoint, modelo, time.time() - inicio)
+        return resultado
+
+    def _tentar(self, endpoint: str, modelo: str, chamada, prazo: float, hedge: bool):
+        atraso = self._atraso_hedge(endpoint, modelo, prazo) if hedge else None
+        inicio = time.monotonic()
+        if atraso is None:
+            resultado = chamada(modelo, prazo)
+            if hedge:
+                self._observar_hedge(endpoint, time.monotonic() - inicio)
+            return resultado
+
+        # Cada tentativa leva uma cópia do contexto (prazo da requisição etc.).
+        # Uma tentativa já em curso não tem como ser interrompida (termina no
+        # próprio timeout HTTP); as que ainda estão na fila são canceladas no finally.
+        primeira = _executor_hedge.submit(contextvars.copy_context().run, chamada, modelo, prazo)
+        pendentes = {primeira}
+        try:
+            try:
+                resultado = primeira.result(timeout=atraso)
+                self._observar_hedge(endpoint, time.monotonic() - inicio)
+                return resultado
+            except FuturesTimeout:
+                pass
+
+            print(f"🪞 [HEDGE] {endpoint}: sem resposta em {atraso:.2f}s (p90), disparando segunda requisição")
+            restante = prazo - (time.monotonic() - inicio)
+            segunda = _executor_hedge.submit(contextvars.copy_context().run, chamada, modelo, restante)
+            pendentes = {primeira, segunda}
+            erro = None
+            while pendentes:
+                feitas, pendentes = futures_wait(
+                    pendentes, timeout=max(prazo - (time.monotonic() - inicio), 0), return_when=FIRST_COMPLETED
+                )
+                if not feitas:
+                    raise TimeoutError(f"timeout em {endpoint}")
+                for futuro in feitas:
+                    if futuro.exception() is None:
+                        self._observar_vencedora(endpoint, inicio, venceu_hedge=futuro is segunda, primeira_pendente=primeira in pendentes)
+                        return futuro.result()
+                    erro = erro or futuro.exception()
+            raise erro
+        finally:
+            for futuro in pendentes:
+                futuro.cancel()
+
+    # =========================
+    # HEDGING
+    # =========================
+
+    def _atraso_hedge(self, endpoint: str, modelo: str, prazo: float) -> Optional[float]:
+        """p90 observado da rota, se houver amostras e sobrar orçamento de hedge."""
+        p90 = self.p90(endpoint, modelo)
+        if p90 is None or p90 >= prazo:
+            return None
+        with self._lock:
+            estat = self._hedges[endpoint]
+            if estat.chamadas and estat.hedges / estat.chamadas >= ORCAMENTO_HEDGE:
+                return None
+        return p90
+
+    def _observar_hedge(self, endpoint: str, duracao: float, hedge: bool = False, venceu_hedge: bool = False) -> None:
+        with self._lock:
+            estat = self._hedges[endpoint]
+            estat.chamadas += 1
+            estat.latencias.append(duracao)
+            estat.hedges += int(hedge)
+            estat.vitorias += int(venceu_hedge)
+            if not venceu_hedge:
+                # A primeira requisição respondeu: é exatamente a latência sem hedge
+                estat.latencias_sem_hedge.append(duracao)
+
+    def _observar_vencedora(self, endpoint: str, inicio: float, venceu_hedge: bool, primeira_pendente: bool) -> None:
+        """
+        Mesma medição nos caminhos síncrono e assíncrono. Se o hedge venceu com a
+        primeira ainda pendente, ela é cancelada: sem hedge, a chamada teria levado
+        pelo menos o tempo até aqui (ganho_p99_s é um limite inferior).
+        """
+        duracao = time.monotonic() - inicio
+        self._observar_hedge(endpoint, duracao, hedge=True, venceu_hedge=venceu_hedge)
+        if venceu_hedge and primeira_pendente:
+            with self._lock:
+                self._hedges[endpoint].latencias_sem_hedge.append(duracao)
+
+    def metricas_hedge(self) -> dict:
+        with self._lock:
+            return {endpoint: estat.snapshot() for endpoint, estat in sorted(self._hedges.items())}
+
+
+def eh_timeout(erro: Exception) -> bool:
+    texto = f"{type(erro).__name__} {erro}".lower()
+    return isinstance(erro, TimeoutError) or "timeout" in texto or "timed out" in texto or "deadline" in texto
+
+
+roteador = Roteador()
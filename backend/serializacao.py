@@ -0,0 +1,183 @@
+# serializacao.py
+#
+# Camada única de JSON e compressão das respostas.
+#
+# - json_bytes/json_texto: orjson quando instalado (bem mais rápido e já sem
+#   espaços), json da stdlib como alternativa. Usado nas respostas, nos
+#   prompts e nos valores do cache.
+# - RespostaJSON: JSONResponse que serializa com json_bytes. Devolvida direto
+#   pelos endpoints grandes, evita também a passada do jsonable_encoder.
+# - CompressaoMiddleware: negocia br (se o pacote brotli estiver instalado)
+#   ou gzip pelo Accept-Encoding, para respostas acima de um tamanho mínimo.
+
+import json
+import zlib
+from typing import Any, Callable, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+TAMANHO_MINIMO_COMPRESSAO = 1024
+NIVEL_GZIP = 6
+QUALIDADE_BROTLI = 5
+
+# Já comprimidos (o .docx é um zip) ou que precisam chegar pedaço a pedaço
+TIPOS_SEM_COMPRESSAO = (
+    "application/zip",
+    "application/gzip",
+    "application/vnd.openxmlformats",
+    "image/",
+    "text/event-stream",
+)
+
+
+# =========================
+# JSON
+# =========================
+
+def para_json(obj):
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if isinstance(obj, (set, tuple)):
+        return list(obj)
+    raise TypeError(f"{type(obj).__name__} não é serializável em JSON")
+
+
+def _para_json_ou_texto(obj):
+    try:
+        return para_json(obj)
+    except TypeError:
+        return str(obj)
+
+
+def json_bytes(obj: Any, default: Callable[[Any], Any] = para_json) -> bytes:
+    """JSON compacto em UTF-8 (sem espaços, sem escapar acentos)."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            # Inteiros acima de 64 bits e afins: a stdlib resolve
+            pass
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=default).encode("utf-8")
+
+
+def json_texto(obj: Any, tolerante: bool = False) -> str:
+    """Para prompts; tolerante=True converte o que não for JSON com str()."""
+    return json_bytes(obj, default=_para_json_ou_texto if tolerante else para_json).decode("utf-8")
+
+
+def ler_json(dados) -> Any:
+    return orjson.loads(dados) if orjson is not None else json.loads(dados)
+
+
+class RespostaJSON(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return json_bytes(content)
+
+
+# =========================
+# COMPRESSÃO
+# =========================
+
+def escolher_codificacao(accept_encoding: str) -> Optional[str]:
+    """'gzip, deflate, br;q=0.9' -> 'br' (se disponível) ou 'gzip'; None se nenhuma serve."""
+    aceitas = {}
+    for item in accept_encoding.lower().split(","):
+        nome, _, parametros = item.strip().partition(";")
+        q = 1.0
+        if parametros.strip().startswith("q="):
+            try:
+                q = float(parametros.strip()[2:])
+            except ValueError:
+                q = 0.0
+        aceitas[nome.strip()] = q
+    candidatas = (["br"] if brotli is not None else []) + ["gzip"]
+    candidatas = [c for c in candidatas if aceitas.get(c, aceitas.get("*", 0)) > 0]
+    return max(candidatas, key=lambda c: aceitas.get(c, aceitas.get("*", 0)), default=None)
+
+
+class _Compressor:
+    def __init__(self, codificacao: str):
+        self.codificacao = codificacao
+        if codificacao == "br":
+            self._br = brotli.Compressor(quality=QUALIDADE_BROTLI)
+        else:
+            self._gz = zlib.compressobj(NIVEL_GZIP, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def comprimir(self, dados: bytes, fim: bool) -> bytes:
+        if self.codificacao == "br":
+            saida = self._br.process(dados)
+            return saida + (self._br.finish() if fim else self._br.flush())
+        saida = self._gz.compress(dados)
+        return saida + self._gz.flush(zlib.Z_FINISH if fim else zlib.Z_SYNC_FLUSH)
+
+
+class CompressaoMiddleware:
+    def __init__(self, app: ASGIApp, minimo: int = TAMANHO_MINIMO_COMPRESSAO):
+        self.app = app
+        self.minimo = minimo
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        codificacao = escolher_codificacao(Headers(scope=scope).get("accept-encoding", ""))
+        if codificacao is None:
+            await self.app(scope, receive, send)
+            return
+
+        inicio: Optional[Message] = None
+        compressor: Optional[_Compressor] = None
+        repassar = False
+
+        async def enviar(mensagem: Message) -> None:
+            nonlocal inicio, compressor, repassar
+            if mensagem["type"] == "http.response.start":
+                headers = Headers(raw=mensagem["headers"])
+                tipo = headers.get("content-type", "").lower()
+                repassar = "content-encoding" in headers or any(tipo.startswith(t) for t in TIPOS_SEM_COMPRESSAO)
+                if repassar:
+                    await send(mensagem)
+                else:
+                    # Segura o início até saber o tamanho do primeiro pedaço
+                    inicio = mensagem
+                return
+            if mensagem["type"] != "http.response.body" or repassar:
+                await send(mensagem)
+                return
+
+            corpo = mensagem.get("body", b"")
+            mais = mensagem.get("more_body", False)
+            if inicio is not None:
+                headers = MutableHeaders(raw=inicio["headers"])
+                headers.add_vary_header("Accept-Encoding")
+                if not mais and len(corpo) < self.minimo:
+                    repassar = True
+                    await send(inicio)
+                    await send(mensagem)
+                    return
+                compressor = _Compressor(codificacao)
+                headers["Content-Encoding"] = codificacao
+                if "content-length" in headers:
+                    del headers["Content-Length"]
+                corpo = compressor.comprimir(corpo, fim=not mais)
+                if not mais:
+                    headers["Content-Length"] = str(len(corpo))
+                await send(inicio)
+                inicio = None
+            else:
+                corpo = compressor.comprimir(corpo, fim=not mais)
+            await send({"type": "http.response.body", "body": corpo, "more_body": mais})
+
+        await self.app(scope, receive, enviar)
@@ -0,0 +1,256 @@
+# sessao.py
+#
+# Canal de sessão (WebSocket): cada mensagem do usuário vira UMA chamada ao
+# modelo que devolve a resposta do chat e, se houver, a instrução de edição —
+# em vez de /api/detect-edit + /api/chat, cada um com sua ida ao Gemini e o
+# payload inteiro de documentos. Os documentos ficam guardados por sessão no
+# cache compartilhado e só trafegam uma vez.
+
+import os
+from typing import Iterator, List, Optional
+
+from google import genai
+from pydantic import BaseModel, ValidationError
+
+from cache import obter_cache
+from chat import montar_contexto_documentos
+from cronograma import EXPLICACAO_CRONOGRAMA, json_compacto
+from edit_draft import PROMPT_DETECCAO_EDICAO, UniversalInstruction
+from prazos import config_com_prazo, prazo_restante
+from prompts import registro_prompts
+from reparo_json import extrair_json, metricas_parse
+from serializacao import json_bytes, ler_json
+from versoes_draft import TENTATIVAS_GRAVACAO
+
+SESSAO_TTL = 24 * 3600
+MODELO_TURNO = "gemini-2.5-flash"
+
+
+class RespostaTurno(BaseModel):
+    response: str = ""
+    is_edit_instruction: bool = False
+    instruction: Optional[UniversalInstruction] = None
+
+
+# =========================
+# PROMPT FUNDIDO (CHAT + DETECÇÃO DE EDIÇÃO)
+# =========================
+
+PROMPT_TURNO = f"""
+Você é um assistente jurídico sênior altamente preciso e amigável, conversando
+com o usuário sobre um contrato em elaboração. Em toda mensagem você faz DUAS
+coisas ao mesmo tempo: responde ao usuário e detecta se ele pediu uma edição.
+
+{PROMPT_DETECCAO_EDICAO}
+
+FORMATO DESTE CANAL (substitui os formatos acima):
+Responda sempre com um único objeto JSON, com "response" como PRIMEIRA chave:
+{{
+  "response": "texto em linguagem natural para o usuário (confirme a alteração, responda a dúvida ou peça esclarecimento)",
+  "is_edit_instruction": true | false,
+  "instruction": {{"path": "...", "new_value": ..., "description": "..."}} ou null
+}}
+
+REGRAS ADICIONAIS:
+- Se houver DRAFT ATUAL, monte o path com os índices reais do draft.
+- Se a mensagem for ambígua (ex.: mais de uma pessoa com o mesmo nome), NÃO gere
+  instrução: use "instruction": null e peça esclarecimento em "response".
+"""
+
+registro_prompts.registrar("turno_sessao", PROMPT_TURNO)
+
+
+# =========================
+# ESTADO DA SESSÃO
+# =========================
+
+def carregar_documentos(session_id: str) -> dict:
+    return obter_cache().get_json(f"sessao_docs:{session_id}") or {}
+
+
+def salvar_documentos(session_id: str, documentos: dict) -> None:
+    obter_cache().set_json(f"sessao_docs:{session_id}", documentos, ttl=SESSAO_TTL)
+
+
+def adicionar_documento(session_id: str, nome: str, dados) -> dict:
+    """
+    Inclui um documento no conjunto da sessão e devolve o conjunto atualizado.
+    Ler e gravar vão juntos (no servidor, pelo executor); o compare-and-set evita
+    que dois uploads simultâneos da mesma sessão apaguem um ao outro.
+    """
+    cache = obter_cache()
+    chave = f"sessao_docs:{session_id}"
+    for _ in range(TENTATIVAS_GRAVACAO):
+        bruto = cache.get(chave)
+        documentos = (ler_json(bruto) if bruto is not None else None) or {}
+        documentos[nome] = dados
+        if cache.trocar_se(chave, bruto, json_bytes(documentos), ttl=SESSAO_TTL):
+            return documentos
+    print(f"🔁 [SESSÃO] {session_id}: uploads concorrentes demais, gravando o conjunto mais recente")
+    salvar_documentos(session_id, documentos)
+    return documentos
+
+
+def carregar_pendentes(session_id: str) -> List[dict]:
+    return obter_cache().get_json(f"sessao_pendentes:{session_id}") or []
+
+
+def adicionar_pendente(session_id: str, instrucao: dict) -> List[dict]:
+    pendentes = carregar_pendentes(session_id) + [instrucao]
+    obter_cache().set_json(f"sessao_pendentes:{session_id}", pendentes, ttl=SESSAO_TTL)
+    return pendentes
+
+
+def limpar_pendentes(session_id: str) -> None:
+    obter_cache().delete(f"sessao_pendentes:{session_id}")
+
+
+# =========================
+# EXTRAÇÃO INCREMENTAL
+# =========================
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class ExtratorCampoJSON:
+    """
+    Lê um JSON que ainda está chegando em pedaços e devolve, a cada pedaço, o
+    texto novo de um campo string de primeiro nível (ex.: "response"). Assim
+    dá para repassar a resposta ao usuário enquanto o resto do objeto
+    (a instrução) ainda está sendo gerado.
+    """
+
+    def __init__(self, campo: str):
+        self._marcador = f'"{campo}"'
+        self._buffer = ""
+        self._pos: Optional[int] = None
+        self.terminou = False
+
+    def alimentar(self, pedaco: str) -> str:
+        self._buffer += pedaco
+        if self.terminou:
+            return ""
+
+        if self._pos is None:
+            inicio = self._buffer.find(self._marcador)
+            if inicio < 0:
+                return ""
+            i = inicio + len(self._marcador)
+            while i < len(self._buffer) and self._buffer[i] in " \t\r\n:":
+                i += 1
+            if i >= len(self._buffer):
+                return ""
+            if self._buffer[i] != '"':
+                # Campo não é string; nada para transmitir
+                self.terminou = True
+                return ""
+            self._pos = i + 1
+
+        saida = []
+        buffer, i = self._buffer, self._pos
+        while i < len(buffer):
+            c = buffer[i]
+            if c == '"':
+                self.terminou = True
+                i += 1
+                break
+            if c != "\\":
+                saida.append(c)
+                i += 1
+                continue
+            # Escape incompleto: espera o próximo pedaço
+            if i + 1 >= len(buffer):
+                break
+            seq = buffer[i + 1]
+            if seq == "u":
+                if i + 6 > len(buffer):
+                    break
+                codigo = int(buffer[i + 2:i + 6], 16)
+                # Par substituto (emoji etc.) precisa das duas metades
+                if 0xD800 <= codigo <= 0xDBFF:
+                    if i + 12 > len(buffer):
+                        break
+                    baixo = int(buffer[i + 8:i + 12], 16)
+                    saida.append(chr(0x10000 + ((codigo - 0xD800) << 10) + (baixo - 0xDC00)))
+                    i += 12
+                    continue
+                saida.append(chr(codigo))
+                i += 6
+                continue
+            saida.append(_ESCAPES.get(seq, seq))
+            i += 2
+        self._pos = i
+        return "".join(saida)
+
+
+# =========================
+# TURNO
+# =========================
+
+def _montar_sufixo(documentos: dict, draft: Optional[dict], mensagem: str) -> str:
+    if draft is not None:
+        contexto = f"DRAFT ATUAL (JSON; {EXPLICACAO_CRONOGRAMA}):\n{json_compacto(draft)}"
+    else:
+        contexto = f"Contexto dos documentos:\n{montar_contexto_documentos(documentos)}"
+    return f"""
+{contexto}
+
+Mensagem do usuário: "{mensagem}"
+"""
+
+
+def interpretar_turno(texto: str) -> RespostaTurno:
+    texto = texto.strip()
+    # Saída truncada ou com cerca de Markdown é reparada localmente (ver reparo_json.py)
+    dados, reparo = extrair_json(texto)
+    if dados is not None:
+        try:
+            resultado = RespostaTurno.model_validate(dados)
+        except ValidationError:
+            # Instrução fora do schema (ou cortada): fica só o texto da resposta
+            resposta = dados.get("response")
+            resultado = RespostaTurno(response=resposta) if isinstance(resposta, str) else None
+        if resultado is not None:
+            metricas_parse.registrar("turno", reparo or "direto")
+            if reparo == "truncado":
+                # O último campo pode ter vindo pela metade: não aplica edição com ele
+                resultado = RespostaTurno(response=resultado.response)
+            return resultado
+    # Mesma tolerância do /api/chat: sem JSON válido, o texto vira a resposta
+    metricas_parse.registrar("turno", "falha")
+    return RespostaTurno(response=texto)
+
+
+def executar_turno(documentos: dict, draft: Optional[dict], mensagem: str) -> Iterator[dict]:
+    """
+    Gera os eventos de um turno: {"type": "chunk", "text": ...} conforme a
+    resposta chega e, no fim, {"type": "turn", "result": RespostaTurno}.
+    """
+    api_key = os.getenv("AI_API_KEY")
+    if not api_key:
+        raise RuntimeError("AI_API_KEY não encontrada")
+
+    client = genai.Client(api_key=api_key)
+    extrator = ExtratorCampoJSON("response")
+    bruto = []
+    enviado = False
+
+    for chunk in registro_prompts.gerar_stream(
+        client,
+        modelo=MODELO_TURNO,
+        nome="turno_sessao",
+        conteudo=_montar_sufixo(documentos, draft, mensagem),
+        config=config_com_prazo({"response_mime_type": "application/json"}, prazo_restante()),
+    ):
+        texto = chunk.text or ""
+        bruto.append(texto)
+        novo = extrator.alimentar(texto)
+        if novo:
+            enviado = True
+            yield {"type": "chunk", "text": novo}
+
+    resultado = interpretar_turno("".join(bruto))
+    if not enviado and resultado.response:
+        # O modelo não seguiu o formato; o texto inteiro ainda não foi enviado
+        yield {"type": "chunk", "text": resultado.response}
+    yield {"type": "turn", "result": resultado}
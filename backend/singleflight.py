@@ -0,0 +1,149 @@
+# singleflight.py
+#
+# Coalescência de chamadas idênticas e simultâneas ao modelo. Duplo clique,
+# retry do front e várias abas mandam o mesmo /api/draft, /api/detect-edit ou
+# /api/contract/generate ao mesmo tempo; com o singleflight só a primeira
+# chamada vai ao Gemini e as outras esperam e recebem o mesmo resultado.
+#
+# A chave é o hash canônico de (operação, modelo, entradas do prompt, config).
+# Só coalesce o que está em voo: terminada a chamada, a chave é liberada (o
+# reaproveitamento de resultados prontos é papel do cache).
+
+import asyncio
+import copy
+import hashlib
+import json
+import threading
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Tuple, TypeVar
+
+from errors import DeadlineExceededError
+from prazos import prazo_restante
+
+T = TypeVar("T")
+
+
+def _canonico(obj):
+    if isinstance(obj, type):
+        # response_schema=ContractDraft e afins (antes do model_dump: a classe também o tem)
+        return f"{obj.__module__}.{obj.__qualname__}"
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if isinstance(obj, (set, tuple)):
+        return list(obj)
+    return repr(obj)
+
+
+def chave_chamada(operacao: str, modelo: Any, *entradas, config: Any = None) -> str:
+    """Hash canônico (ordem das chaves não importa) da chamada ao modelo."""
+    canonico = json.dumps(
+        [operacao, modelo, list(entradas), config],
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+        default=_canonico,
+    )
+    return f"{operacao}:{hashlib.sha256(canonico.encode('utf-8')).hexdigest()}"
+
+
+class _Voo:
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.erro: BaseException = None
+
+
+class _VooAsync:
+    def __init__(self, tarefa: "asyncio.Task"):
+        self.tarefa = tarefa
+        self.esperando = 0
+
+
+class Singleflight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._voos: Dict[str, _Voo] = {}
+        self._voos_async: Dict[Tuple[int, str], _VooAsync] = {}
+        self._chamadas: Dict[str, int] = defaultdict(int)
+        self._coalescidas: Dict[str, int] = defaultdict(int)
+
+    def _contar(self, operacao: str, coalescida: bool):
+        with self._lock:
+            self._chamadas[operacao] += 1
+            if coalescida:
+                self._coalescidas[operacao] += 1
+
+    # ---------- síncrono (threads dos executores) ----------
+
+    def executar(self, chave: str, func: Callable[[], T]) -> T:
+        operacao = chave.split(":", 1)[0]
+        with self._lock:
+            voo = self._voos.get(chave)
+            lider = voo is None
+            if lider:
+                voo = self._voos[chave] = _Voo()
+        self._contar(operacao, coalescida=not lider)
+
+        if lider:
+            try:
+                voo.resultado = func()
+                return voo.resultado
+            except BaseException as e:
+                voo.erro = e
+                raise
+            finally:
+                with self._lock:
+                    self._voos.pop(chave, None)
+                voo.evento.set()
+
+        print(f"🪢 [SINGLEFLIGHT] {operacao}: aguardando chamada idêntica em andamento")
+        if not voo.evento.wait(prazo_restante()):
+            raise DeadlineExceededError(operacao)
+        if voo.erro is not None:
+            raise voo.erro
+        # Cópia: quem chamou pode mutar o resultado (ex.: pendências do draft)
+        return copy.deepcopy(voo.resultado)
+
+    # ---------- assíncrono (event loop) ----------
+
+    async def executar_async(self, chave: str, fabrica: Callable[[], Awaitable[T]]) -> T:
+        operacao = chave.split(":", 1)[0]
+        indice = (id(asyncio.get_running_loop()), chave)
+        voo = self._voos_async.get(indice)
+        lider = voo is None
+        if lider:
+            voo = self._voos_async[indice] = _VooAsync(asyncio.ensure_future(fabrica()))
+            voo.tarefa.add_done_callback(lambda _: self._voos_async.pop(indice, None))
+        else:
+            print(f"🪢 [SINGLEFLIGHT] {operacao}: aguardando chamada idêntica em andamento")
+        self._contar(operacao, coalescida=not lider)
+
+        voo.esperando += 1
+        try:
+            # shield: um cliente que desiste não derruba a chamada dos outros
+            resultado = await asyncio.wait_for(asyncio.shield(voo.tarefa), prazo_restante())
+        except (asyncio.CancelledError, asyncio.TimeoutError) as e:
+            voo.esperando -= 1
+            if voo.esperando == 0 and not voo.tarefa.done():
+                # Ninguém mais espera: cancela a chamada ao modelo (ver cancelamento.py)
+                voo.tarefa.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                raise DeadlineExceededError(operacao) from None
+            raise
+        voo.esperando -= 1
+        return resultado if lider else copy.deepcopy(resultado)
+
+    def metricas(self) -> dict:
+        with self._lock:
+            return {
+                operacao: {
+                    "chamadas": chamadas,
+                    "coalescidas": self._coalescidas[operacao],
+                    "chamadas_ao_modelo": chamadas - self._coalescidas[operacao],
+                    "taxa_coalescencia": round(self._coalescidas[operacao] / chamadas, 4),
+                }
+                for operacao, chamadas in self._chamadas.items()
+            }
+
+
+singleflight = Singleflight()
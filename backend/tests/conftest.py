@@ -0,0 +1,125 @@
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+import pytest
+
+# Os módulos do backend são planos (import main, import ocr...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache import RedisCache  # noqa: E402
+
+
+# =========================
+# SERVIDOR RESP FALSO
+# =========================
+
+class _ServidorResp(socketserver.ThreadingTCPServer):
+    """Stand-in mínimo do Redis: só os comandos que o RedisCache usa."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _ConexaoResp)
+        self.dados = {}
+        self.expira = {}
+        self.comandos = []
+        self.conexoes = []
+        self.lock = threading.Lock()
+
+    def derrubar_conexoes(self):
+        with self.lock:
+            for conexao in self.conexoes:
+                conexao.shutdown(socket.SHUT_RDWR)
+            self.conexoes.clear()
+
+    def vivo(self, chave):
+        expira = self.expira.get(chave)
+        if expira is not None and expira < time.time():
+            self.dados.pop(chave, None)
+            self.expira.pop(chave, None)
+        return chave in self.dados
+
+
+class _ConexaoResp(socketserver.StreamRequestHandler):
+    def _ler(self):
+        linha = self.rfile.readline()
+        if not linha:
+            return None
+        assert linha[:1] == b"*", linha
+        args = []
+        for _ in range(int(linha[1:-2])):
+            tamanho = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(tamanho + 2)[:-2])
+        return args
+
+    def _bulk(self, valor):
+        return b"$-1\r\n" if valor is None else b"$%d\r\n%s\r\n" % (len(valor), valor)
+
+    def handle(self):
+        servidor = self.server
+        with servidor.lock:
+            servidor.conexoes.append(self.connection)
+        while True:
+            args = self._ler()
+            if args is None:
+                return
+            comando, chaves = args[0].upper().decode(), args[1:]
+            with servidor.lock:
+                servidor.comandos.append(comando)
+                if comando in ("AUTH", "SELECT"):
+                    resposta = b"+OK\r\n"
+                elif comando == "GET":
+                    resposta = self._bulk(servidor.dados[chaves[0]] if servidor.vivo(chaves[0]) else None)
+                elif comando == "SET":
+                    servidor.dados[chaves[0]] = chaves[1]
+                    servidor.expira.pop(chaves[0], None)
+                    if len(chaves) > 3 and chaves[2].upper() == b"PX":
+                        servidor.expira[chaves[0]] = time.time() + int(chaves[3]) / 1000
+                    resposta = b"+OK\r\n"
+                elif comando == "EVAL" and args[1].decode() == RedisCache.SCRIPT_TROCAR_SE:
+                    # Emula o script do compare-and-set (o stand-in não roda Lua)
+                    chave, existe, esperado, valor, ttl_ms = args[3:8]
+                    atual = servidor.dados[chave] if servidor.vivo(chave) else None
+                    if (atual == esperado) if existe == b"1" else atual is None:
+                        servidor.dados[chave] = valor
+                        servidor.expira.pop(chave, None)
+                        if ttl_ms != b"0":
+                            servidor.expira[chave] = time.time() + int(ttl_ms) / 1000
+                        resposta = b":1\r\n"
+                    else:
+                        resposta = b":0\r\n"
+                elif comando == "EVAL" and args[1].decode() == RedisCache.SCRIPT_INCREMENTAR:
+                    # Emula HINCRBYFLOAT por campo + PEXPIRE
+                    chave, ttl_ms, pares = args[3], args[4], args[5:]
+                    hash_ = servidor.dados[chave] if servidor.vivo(chave) else {}
+                    for campo, valor in zip(pares[::2], pares[1::2]):
+                        hash_[campo] = float(hash_.get(campo, 0)) + float(valor)
+                    servidor.dados[chave] = hash_
+                    if ttl_ms != b"0":
+                        servidor.expira[chave] = time.time() + int(ttl_ms) / 1000
+                    resposta = b":1\r\n"
+                elif comando == "HGETALL":
+                    hash_ = servidor.dados[chaves[0]] if servidor.vivo(chaves[0]) else {}
+                    itens = [item for campo, valor in hash_.items() for item in (campo, repr(valor).encode())]
+                    resposta = b"*%d\r\n" % len(itens) + b"".join(self._bulk(item) for item in itens)
+                elif comando == "DEL":
+                    removidas = sum(1 for c in chaves if servidor.vivo(c) and servidor.dados.pop(c, None) is not None)
+                    resposta = b":%d\r\n" % removidas
+                else:
+                    resposta = b"-ERR comando desconhecido\r\n"
+            self.wfile.write(resposta)
+
+
+@pytest.fixture
+def servidor_resp():
+    servidor = _ServidorResp()
+    thread = threading.Thread(target=servidor.serve_forever, daemon=True)
+    thread.start()
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
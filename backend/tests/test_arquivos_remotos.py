@@ -0,0 +1,91 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from google.genai import errors
+
+import arquivos_remotos
+from arquivos_remotos import JANELA_RENOVACAO, RegistroArquivos, arquivo_ausente, hash_conteudo
+from cache import MemoriaLRU
+from executores import executores
+
+
+def _erro(codigo: int, mensagem: str) -> errors.APIError:
+    classe = errors.ClientError if codigo < 500 else errors.ServerError
+    return classe(codigo, {"error": {"code": codigo, "message": mensagem, "status": ""}})
+
+
+def test_arquivo_ausente_pelo_status_code():
+    assert arquivo_ausente(_erro(404, "Requested entity was not found."))
+    assert arquivo_ausente(_erro(403, "You do not have permission to access the File abc or it may not exist."))
+    assert not arquivo_ausente(_erro(429, "Resource exhausted for file uploads"))
+    assert not arquivo_ausente(_erro(403, "Method doesn't allow unregistered callers. Please use an API key."))
+    assert not arquivo_ausente(_erro(500, "Internal error reading file"))
+    # Sem status code não há como saber: não reenvia
+    assert not arquivo_ausente(RuntimeError("403 permission denied on file"))
+
+
+class _Arquivos:
+    def __init__(self, falhar_em: str):
+        self.falhar_em = falhar_em
+        self.enviados = []
+        self.removidos = []
+
+    async def upload(self, *, file, config):
+        if config["display_name"] == self.falhar_em:
+            raise _erro(429, "quota")
+        self.enviados.append(config["display_name"])
+        return SimpleNamespace(
+            name=f"files/{config['display_name']}-novo", uri="gs://novo", mime_type=config["mime_type"],
+            display_name=config["display_name"], expiration_time=None,
+        )
+
+    async def delete(self, *, name):
+        self.removidos.append(name)
+
+
+@pytest.fixture
+def registro(monkeypatch):
+    cache = MemoriaLRU()
+    monkeypatch.setattr(arquivos_remotos, "obter_cache", lambda: cache)
+    return RegistroArquivos()
+
+
+def _enviado(registro: RegistroArquivos, nome: str) -> str:
+    dados = nome.encode()
+    hash_ = hash_conteudo(dados, "application/pdf")
+    arquivo = SimpleNamespace(
+        name=f"files/{nome}", uri=f"gs://{nome}", mime_type="application/pdf", display_name=nome,
+        expiration_time=None,
+    )
+    antigo = registro._registrar_envio(hash_, arquivo)
+    antigo.expira_em = time.time() + JANELA_RENOVACAO / 2
+    registro._gravar(antigo)
+    registro._guardar_conteudo(hash_, dados, "application/pdf", nome)
+    return hash_
+
+
+def test_falha_ao_renovar_um_handle_nao_interrompe_os_demais(registro):
+    _enviado(registro, "a.pdf")
+    segundo = _enviado(registro, "b.pdf")
+    client = SimpleNamespace(aio=SimpleNamespace(files=_Arquivos(falhar_em="a.pdf")))
+
+    asyncio.run(registro.manter(client))
+
+    assert client.aio.files.enviados == ["b.pdf"]
+    assert client.aio.files.removidos == ["files/b.pdf"]
+    assert registro._ler(segundo).name == "files/b.pdf-novo"
+
+
+def test_reaproveitamento_consulta_o_cache_no_executor(registro):
+    hash_ = _enviado(registro, "c.pdf")
+    client = SimpleNamespace(aio=SimpleNamespace(files=_Arquivos(falhar_em="")))
+    interativo = executores["interativo"]
+    antes = interativo.concluidas
+
+    handle, obtido = asyncio.run(registro.obter_async(client, b"c.pdf", "application/pdf", "c.pdf"))
+
+    assert (handle.name, obtido) == ("files/c.pdf", hash_)
+    assert client.aio.files.enviados == []
+    assert interativo.concluidas == antes + 1
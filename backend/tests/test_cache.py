@@ -0,0 +1,172 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import main
+from cache import MemoriaLRU, RedisCache, SQLiteCache
+
+
+# =========================
+# SQLITE
+# =========================
+
+def test_sqlite_em_wal_e_compartilhado_entre_instancias(tmp_path):
+    caminho = str(tmp_path / "cache.sqlite3")
+    worker_a, worker_b = SQLiteCache(caminho), SQLiteCache(caminho)
+
+    worker_a.set_json("draft:1", {"valor": 10})
+    assert worker_b.get_json("draft:1") == {"valor": 10}
+    worker_b.delete("draft:1")
+    assert worker_a.get("draft:1") is None
+
+    modo = sqlite3.connect(caminho).execute("PRAGMA journal_mode").fetchone()[0]
+    assert modo == "wal"
+
+
+def test_sqlite_ttl_expira(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"))
+    cache.set("curta", b"x", ttl=0.05)
+    cache.set("sem_ttl", b"y")
+    assert cache.get("curta") == b"x"
+    time.sleep(0.1)
+    assert cache.get("curta") is None
+    assert cache.get("sem_ttl") == b"y"
+    assert cache.metricas.snapshot()["misses"] == 1
+
+
+# =========================
+# REDIS (RESP)
+# =========================
+
+def test_redis_get_set_del_com_ttl(servidor_resp):
+    porta = servidor_resp.server_address[1]
+    cache = RedisCache(f"redis://:segredo@127.0.0.1:{porta}/2")
+
+    cache.set("contrato:1", b"\x00docx\r\n", ttl=60)
+    assert cache.get("contrato:1") == b"\x00docx\r\n"
+    assert servidor_resp.expira["contrato:1".encode()] > time.time()
+    assert servidor_resp.comandos[:2] == ["AUTH", "SELECT"]
+
+    cache.set("curta", b"x", ttl=0.05)
+    time.sleep(0.1)
+    assert cache.get("curta") is None
+
+    cache.delete("contrato:1")
+    assert cache.get("contrato:1") is None
+    assert cache.metricas.snapshot()["erros"] == 0
+
+
+def test_redis_reconecta_depois_de_queda(servidor_resp):
+    cache = RedisCache(f"redis://127.0.0.1:{servidor_resp.server_address[1]}/0")
+    cache.set("a", b"1")
+    servidor_resp.derrubar_conexoes()
+
+    assert cache.get("a") is None  # falha vira miss, nunca exceção
+    assert cache.get("a") == b"1"  # a chamada seguinte reconecta
+    assert cache.metricas.snapshot()["erros"] == 1
+
+
+def test_redis_fora_do_ar_vira_miss():
+    cache = RedisCache("redis://127.0.0.1:1/0", timeout=0.2)
+    assert cache.get("a") is None
+    cache.set("a", b"1")
+    assert cache.metricas.snapshot()["erros"] == 2
+
+
+# =========================
+# CONTRATO EM STREAM
+# =========================
+
+def test_stream_guarda_no_cache_sem_acumular_em_memoria(monkeypatch):
+    cache = MemoriaLRU()
+    monkeypatch.setattr(main, "obter_cache", lambda: cache)
+    blocos = [bytes([i]) * 100_000 for i in range(5)]
+
+    async def consumir():
+        stream = main._guardar_ao_final(iter(blocos), "contrato:x")
+        primeiro = await stream.__anext__()
+        assert cache.get("contrato:x") is None  # só grava depois do último bloco
+        return [primeiro] + [bloco async for bloco in stream]
+
+    assert asyncio.run(consumir()) == blocos
+    assert cache.get("contrato:x") == b"".join(blocos)
+
+
+def test_stream_acima_do_limite_nao_vai_para_o_cache(monkeypatch):
+    cache = MemoriaLRU()
+    monkeypatch.setattr(main, "obter_cache", lambda: cache)
+    monkeypatch.setattr(main, "CONTRATO_CACHE_MAX_BYTES", 250_000)
+    blocos = [b"x" * 100_000] * 3
+
+    async def consumir():
+        return [bloco async for bloco in main._guardar_ao_final(iter(blocos), "contrato:y")]
+
+    assert asyncio.run(consumir()) == blocos
+    assert cache.get("contrato:y") is None
+
+
+# =========================
+# COMPARE-AND-SET
+# =========================
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoriaLRU()
+    if request.param == "sqlite":
+        return SQLiteCache(str(tmp_path / "cache.sqlite3"))
+    servidor = request.getfixturevalue("servidor_resp")
+    return RedisCache(f"redis://127.0.0.1:{servidor.server_address[1]}/0")
+
+
+def test_trocar_se_so_grava_sobre_o_valor_esperado(backend):
+    assert backend.trocar_se("k", None, b"v1", ttl=60)
+    assert not backend.trocar_se("k", None, b"outro")  # já existe
+    assert not backend.trocar_se("k", b"v0", b"outro")  # valor mudou no meio
+    assert backend.trocar_se("k", b"v1", b"v2", ttl=60)
+    assert backend.get("k") == b"v2"
+    assert backend.metricas.snapshot()["conflitos"] == 2
+
+
+def test_trocar_se_trata_expirado_como_ausente(backend):
+    backend.set("k", b"velho", ttl=0.05)
+    time.sleep(0.1)
+    assert not backend.trocar_se("k", b"velho", b"novo")
+    assert backend.trocar_se("k", None, b"novo")
+    assert backend.get("k") == b"novo"
+
+
+# =========================
+# CONTADORES
+# =========================
+
+def test_incrementar_soma_por_campo_com_ttl(backend):
+    backend.incrementar("c", {"tokens": 10, "latencia_s": 0.25}, ttl=60)
+    backend.incrementar("c", {"tokens": 5, "chamadas": 1}, ttl=0.2)
+    assert backend.ler_contadores("c") == {"tokens": 15, "latencia_s": 0.25, "chamadas": 1}
+    time.sleep(0.3)
+    assert backend.ler_contadores("c") == {}
+
+
+def test_incrementar_nao_perde_somas_concorrentes(backend):
+    def somar():
+        for _ in range(50):
+            backend.incrementar("c", {"tokens": 1}, ttl=60)
+
+    threads = [threading.Thread(target=somar) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert backend.ler_contadores("c") == {"tokens": 200}
+
+
+def test_sqlite_incrementar_entre_instancias(tmp_path):
+    caminho = str(tmp_path / "cache.sqlite3")
+    a, b = SQLiteCache(caminho), SQLiteCache(caminho)
+    a.incrementar("c", {"tokens": 3})
+    b.incrementar("c", {"tokens": 4})
+    assert a.ler_contadores("c") == {"tokens": 7}
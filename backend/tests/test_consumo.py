@@ -0,0 +1,69 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import consumo
+from cache import MemoriaLRU
+from consumo import ContabilidadeConsumo, sessao_da_requisicao
+from executores import executores
+from prazos import prazo_da_requisicao
+
+
+class _CacheContado(MemoriaLRU):
+    def __init__(self):
+        super().__init__()
+        self.leituras = 0
+
+    def ler_contadores(self, chave):
+        self.leituras += 1
+        return super().ler_contadores(chave)
+
+
+def _resposta(tokens: int):
+    return SimpleNamespace(usage_metadata=SimpleNamespace(
+        prompt_token_count=tokens, candidates_token_count=0, thoughts_token_count=0,
+        cached_content_token_count=0, total_token_count=tokens,
+    ))
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = _CacheContado()
+    monkeypatch.setattr(consumo, "obter_cache", lambda: cache)
+    return cache
+
+
+def test_modo_lido_uma_vez_por_requisicao(cache):
+    contabilidade = ContabilidadeConsumo(orcamento=100)
+    cache.incrementar("consumo_sessao:s1", {"total.tokens_total": 70})
+
+    with sessao_da_requisicao("s1"):
+        assert contabilidade.modo() == "modelo_rapido"
+        assert contabilidade.degradado("modelo_rapido", "teste")
+        contabilidade.verificar()
+        # O que a própria requisição registra entra sem reler o cache
+        contabilidade.registrar("teste", "m", _resposta(20), 0.1)
+        assert contabilidade.modo() == "contexto_enxuto"
+
+    assert cache.leituras == 1
+    assert contabilidade.tokens_da_sessao("s1") == 90
+
+
+def test_registrar_async_soma_no_executor(cache):
+    contabilidade = ContabilidadeConsumo(orcamento=1000)
+    interativo = executores["interativo"]
+
+    async def rodar():
+        with sessao_da_requisicao("s2"), prazo_da_requisicao("chat"):
+            await contabilidade.verificar_async()
+            antes = interativo.concluidas
+            await contabilidade.registrar_async("chat", "m", _resposta(30), 0.5)
+            await contabilidade.registrar_async("chat", "m", _resposta(12), 0.25)
+            return interativo.concluidas - antes
+
+    assert asyncio.run(rodar()) == 2
+    relatorio = contabilidade.sessao("s2")
+    assert relatorio["tokens_usados"] == 42
+    assert relatorio["endpoints"]["chat"]["chamadas"] == 2
+    assert relatorio["endpoints"]["chat"]["latencia_total_s"] == 0.75
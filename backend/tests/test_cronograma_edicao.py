@@ -0,0 +1,44 @@
+from cronograma import CHAVE_COMPACTA, compactar_payload
+from draft import set_by_path_python
+from edit_draft import PROMPT_DETECCAO_EDICAO
+from sessao import PROMPT_TURNO
+
+
+def _draft() -> dict:
+    parcelas = [
+        {"tipo": "P", "indice": f"{i}/12", "vencimento": f"10/{i:02d}/2025", "valor": 1500.0, "status": "Aberto"}
+        for i in range(1, 13)
+    ]
+    return {"valor_monetario": 18000.0, "cronograma_financeiro": parcelas}
+
+
+def test_prompts_dizem_como_enderecar_parcelas():
+    for prompt in (PROMPT_DETECCAO_EDICAO, PROMPT_TURNO):
+        assert "cronograma_financeiro[i]" in prompt
+        assert f"{CHAVE_COMPACTA}[k].campo" in prompt
+
+
+def test_edicao_de_uma_parcela_pelo_indice_da_lista():
+    draft = _draft()
+    # A parcela 3 é a terceira da única série do prompt
+    assert compactar_payload(draft)[CHAVE_COMPACTA][0]["quantidade"] == 12
+
+    novo = set_by_path_python(draft, "cronograma_financeiro[2].vencimento", "15/03/2025")
+
+    assert novo["cronograma_financeiro"][2]["vencimento"] == "15/03/2025"
+    assert len(novo["cronograma_financeiro"]) == 12
+    assert draft["cronograma_financeiro"][2]["vencimento"] == "10/03/2025"
+
+
+def test_edicao_da_serie_volta_expandida_para_a_lista():
+    novo = set_by_path_python(_draft(), f"{CHAVE_COMPACTA}[0].valor", 1600.0)
+
+    assert CHAVE_COMPACTA not in novo
+    assert [p["valor"] for p in novo["cronograma_financeiro"]] == [1600.0] * 12
+    assert novo["cronograma_financeiro"][11]["indice"] == "12/12"
+
+
+def test_serie_invalida_nao_altera_o_draft():
+    draft = _draft()
+    assert set_by_path_python(draft, f"{CHAVE_COMPACTA}[0].valor", "mil e seiscentos") == draft
+    assert set_by_path_python(draft, f"{CHAVE_COMPACTA}[3].valor", 10.0) == draft
@@ -0,0 +1,40 @@
+from entidades import nomes_compativeis, resolver_partes, tokens_nome
+
+
+def _doc(*partes: dict) -> dict:
+    return {"tipo_documento": "RG", "partes": list(partes)}
+
+
+def _parte(nome: str, **campos) -> dict:
+    return {"nome": nome, "papel": "vendedor", "estado_civil": "", "profissao": "", "endereco": "", **campos}
+
+
+def test_sufixo_geracional_diferente_nao_e_compativel():
+    assert not nomes_compativeis(tokens_nome("João Silva"), tokens_nome("João Silva Filho"))
+    assert not nomes_compativeis(tokens_nome("João Silva Filho"), tokens_nome("João Silva Neto"))
+    assert nomes_compativeis(tokens_nome("João Silva Filho"), tokens_nome("JOAO DA SILVA FO."))
+    assert nomes_compativeis(tokens_nome("Maria S. Souza"), tokens_nome("Maria Silva Souza"))
+
+
+def test_pai_e_filho_ficam_separados_com_pendencia():
+    resolucao = resolver_partes({
+        "rg_pai.pdf": _doc(_parte("João Silva")),
+        "rg_filho.pdf": _doc(_parte("João Silva Filho")),
+    })
+    assert sorted(p.nome for p in resolucao["partes"]) == ["João Silva", "João Silva Filho"]
+    assert any("sufixo" in pendencia for pendencia in resolucao["pendencias"])
+
+
+def test_mesmo_cpf_junta_mesmo_com_sufixo_omitido_e_cpfs_diferentes_nao_geram_pendencia():
+    juntos = resolver_partes({
+        "rg.pdf": _doc(_parte("João Silva Filho", cpf_cnpj="123.456.789-00")),
+        "matricula.pdf": _doc(_parte("João Silva", cpf_cnpj="12345678900")),
+    })
+    assert [p.nome for p in juntos["partes"]] == ["João Silva Filho"]
+
+    separados = resolver_partes({
+        "rg_pai.pdf": _doc(_parte("João Silva", cpf_cnpj="111")),
+        "rg_filho.pdf": _doc(_parte("João Silva Filho", cpf_cnpj="222")),
+    })
+    assert len(separados["partes"]) == 2
+    assert separados["pendencias"] == []
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from errors import ServiceOverloadedError
+from executores import ClasseDeCarga, executar_na_vaga_ou_em, executores
+
+
+def test_vaga_ocupa_o_slot_durante_o_trabalho_assincrono_inteiro():
+    classe = ClasseDeCarga("teste", workers=1, max_fila=1)
+
+    async def rodar():
+        async with classe.vaga() as vaga:
+            # Leitura bloqueante dentro da vaga não disputa um segundo slot
+            assert await vaga.executar(sum, [1, 2]) == 3
+            esperando = asyncio.ensure_future(classe.executar(sum, [3]))
+            await asyncio.sleep(0.05)
+            assert (classe.ativos, classe.na_fila) == (1, 1)
+            with pytest.raises(ServiceOverloadedError):
+                await classe.executar(sum, [4])
+        return await esperando
+
+    assert asyncio.run(rodar()) == 3
+    assert (classe.ativos, classe.na_fila, classe.rejeitadas) == (0, 0, 1)
+
+
+def test_vaga_devolve_o_slot_quando_o_trabalho_falha():
+    classe = ClasseDeCarga("teste", workers=1, max_fila=1)
+
+    async def rodar():
+        with pytest.raises(RuntimeError):
+            async with classe.vaga():
+                raise RuntimeError("upload falhou")
+        return await classe.executar(sum, [5])
+
+    assert asyncio.run(rodar()) == 5
+    assert classe.ativos == 0
+
+
+def test_io_auxiliar_dentro_da_vaga_nao_disputa_outra_classe(monkeypatch):
+    ocr = ClasseDeCarga("ocr", workers=1, max_fila=1)
+    interativo = ClasseDeCarga("interativo", workers=1, max_fila=0)
+    monkeypatch.setitem(executores, "interativo", interativo)
+
+    async def rodar():
+        # Fora de uma vaga, o I/O auxiliar seria recusado pelo interativo lotado
+        with pytest.raises(ServiceOverloadedError):
+            await executar_na_vaga_ou_em("interativo", sum, [1])
+        async with ocr.vaga():
+            return await executar_na_vaga_ou_em("interativo", sum, [1, 2])
+
+    assert asyncio.run(rodar()) == 3
+    assert interativo.rejeitadas == 1
+
+
+def test_turno_em_thread_recusa_na_hora_com_a_fila_cheia(monkeypatch):
+    import main
+
+    cheia = ClasseDeCarga("interativo", workers=1, max_fila=0)
+    monkeypatch.setitem(executores, "interativo", cheia)
+    iniciado = []
+
+    def gerador():
+        iniciado.append(True)
+        yield {"type": "chunk", "text": "oi"}
+
+    async def rodar():
+        async with asyncio.timeout(1):
+            return [item async for item in main._iterar_em_thread(gerador(), "teste")]
+
+    with pytest.raises(ServiceOverloadedError):
+        asyncio.run(rodar())
+    assert iniciado == []
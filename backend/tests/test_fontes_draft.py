@@ -0,0 +1,54 @@
+import draft
+from draft import DraftComFontes, FonteCampo, consolidar_documentos
+from schemas import ContractDraft, Imovel, Parte
+
+
+def _parte(nome: str, cpf: str) -> Parte:
+    return Parte(nome=nome, cpf_cnpj=cpf, papel="vendedor", estado_civil="casado", profissao="médico", endereco="Rua B, 5")
+
+
+def _imovel(cidade: str) -> Imovel:
+    return Imovel(endereco_completo="Rua A, 10", cidade=cidade, imobiliaria="Imob")
+
+
+def test_fontes_vem_do_registro_da_consolidacao(monkeypatch):
+    # "Curitiba" aparece nos dois documentos: a busca por texto atribuiria aos dois
+    documentos = {
+        "rg.pdf": {"nome": "Ana Souza", "naturalidade": "Curitiba"},
+        "matricula.pdf": {"cidade": "Curitiba", "proprietaria": "Ana Souza"},
+    }
+    resposta = DraftComFontes(
+        draft=ContractDraft(partes=[_parte("Ana Souza", "123")], imovel=_imovel("Curitiba")),
+        fontes=[
+            FonteCampo(path="partes[0]", documentos=["rg.pdf"]),
+            FonteCampo(path="imovel", documentos=["matricula.pdf", "inventado.pdf"]),
+        ],
+    )
+    monkeypatch.setattr(draft, "prepare_contract_draft", lambda docs: resposta)
+
+    estado = consolidar_documentos(documentos)
+
+    assert estado.fontes["partes[0].nome"] == ["rg.pdf"]
+    assert estado.fontes["imovel.cidade"] == ["matricula.pdf"]
+    assert estado.fontes["partes[0].papel"] == ["rg.pdf"]
+
+
+def test_merge_mantem_origem_dos_inalterados_e_registra_a_dos_alterados(monkeypatch):
+    documentos = {"rg.pdf": {"nome": "Ana Souza"}}
+    monkeypatch.setattr(draft, "prepare_contract_draft", lambda docs: DraftComFontes(
+        draft=ContractDraft(partes=[_parte("Ana Souza", "123")]),
+        fontes=[FonteCampo(path="partes", documentos=["rg.pdf"])],
+    ))
+    estado = consolidar_documentos(documentos)
+
+    documentos = {**documentos, "matricula.pdf": {"cidade": "Curitiba"}, "certidao.pdf": {"cpf": "123"}}
+    monkeypatch.setattr(draft, "merge_documents_into_draft", lambda atual, delta: DraftComFontes(
+        draft=ContractDraft(partes=[_parte("Ana Souza", "123")], imovel=_imovel("Curitiba")),
+        fontes=[FonteCampo(path="imovel.cidade", documentos=["matricula.pdf"])],
+    ))
+    estado = consolidar_documentos(documentos, estado)
+
+    assert estado.fontes["partes[0].cpf_cnpj"] == ["rg.pdf"]
+    assert estado.fontes["imovel.cidade"] == ["matricula.pdf"]
+    # Alterado sem registro: documentos do delta
+    assert sorted(estado.fontes["imovel.endereco_completo"]) == ["certidao.pdf", "matricula.pdf"]
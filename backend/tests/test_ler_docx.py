@@ -0,0 +1,49 @@
+import io
+import zipfile
+
+from ocr import ler_docx
+
+W = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+
+
+def _docx(corpo: str) -> io.BytesIO:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as z:
+        z.writestr("word/document.xml", f"<w:document {W}><w:body>{corpo}</w:body></w:document>")
+    buf.seek(0)
+    return buf
+
+
+def _p(texto: str) -> str:
+    return f"<w:p><w:r><w:t>{texto}</w:t></w:r></w:p>"
+
+
+def _tr(*celulas: str) -> str:
+    return "<w:tr>" + "".join(f"<w:tc>{_p(c)}</w:tc>" for c in celulas) + "</w:tr>"
+
+
+def test_linhas_dentro_de_sdt_e_custom_xml():
+    corpo = (
+        _p("Antes")
+        + "<w:tbl>"
+        + _tr("A", "B")
+        + f"<w:sdt><w:sdtPr/><w:sdtContent>{_tr('C', 'D')}{_tr('E', 'F')}</w:sdtContent></w:sdt>"
+        + f'<w:customXml w:element="linha">{_tr("G", "H")}</w:customXml>'
+        + "<w:tr><w:sdt><w:sdtContent><w:tc>" + _p("I") + "</w:tc></w:sdtContent></w:sdt><w:tc>" + _p("J") + "</w:tc></w:tr>"
+        + "</w:tbl>"
+        + _p("Depois")
+    )
+    assert ler_docx(_docx(corpo)).splitlines() == [
+        "Antes",
+        "[Tabela]: A | B",
+        "[Tabela]: C | D",
+        "[Tabela]: E | F",
+        "[Tabela]: G | H",
+        "[Tabela]: I | J",
+        "Depois",
+    ]
+
+
+def test_paragrafos_em_sdt_no_corpo():
+    corpo = f"<w:sdt><w:sdtContent>{_p('Cláusula')}<w:tbl>{_tr('X', 'Y')}</w:tbl></w:sdtContent></w:sdt>" + _p("Fim")
+    assert ler_docx(_docx(corpo)).splitlines() == ["Cláusula", "[Tabela]: X | Y", "Fim"]
@@ -0,0 +1,59 @@
+import asyncio
+import io
+from types import SimpleNamespace
+
+import pytest
+
+import consumo
+import ocr
+from cache import MemoriaLRU
+from errors import DeadlineExceededError, SessionBudgetExceededError
+
+
+@pytest.fixture
+def upload(monkeypatch):
+    monkeypatch.setenv("AI_API_KEY", "chave-de-teste")
+    return SimpleNamespace(filename="rg.pdf", file=io.BytesIO(b"%PDF-1.4 rg"), content_type="application/pdf")
+
+
+def test_erro_de_cota_no_upload_sobe_para_o_endpoint(monkeypatch, upload):
+    async def obter_async(*args, **kwargs):
+        raise RuntimeError("429 RESOURCE_EXHAUSTED: quota exceeded for file uploads")
+
+    monkeypatch.setattr(ocr.registro_arquivos, "obter_async", obter_async)
+
+    with pytest.raises(RuntimeError, match="quota"):
+        asyncio.run(ocr.analisar_documento_async(upload))
+
+
+@pytest.fixture
+def handle_reaproveitado(monkeypatch):
+    async def obter_async(*args, **kwargs):
+        return SimpleNamespace(name="files/rg"), "hash-rg"
+
+    monkeypatch.setattr(ocr.registro_arquivos, "obter_async", obter_async)
+
+
+def test_prazo_esgotado_na_extracao_vira_504(monkeypatch, upload, handle_reaproveitado):
+    async def executar_async(decisao, chamada, validar=None, hedge=False):
+        raise DeadlineExceededError("ocr")
+
+    monkeypatch.setattr(ocr.roteador, "executar_async", executar_async)
+
+    with pytest.raises(DeadlineExceededError) as erro:
+        asyncio.run(ocr.analisar_documento_async(upload))
+    assert erro.value.status_code == 504
+
+
+def test_orcamento_estourado_na_extracao_vira_429(monkeypatch, upload, handle_reaproveitado):
+    cache = MemoriaLRU()
+    monkeypatch.setattr(consumo, "obter_cache", lambda: cache)
+    cache.incrementar("consumo_sessao:s1", {"total.tokens_total": consumo.contabilidade.orcamento})
+
+    async def rodar():
+        with consumo.sessao_da_requisicao("s1"):
+            return await ocr.analisar_documento_async(upload)
+
+    with pytest.raises(SessionBudgetExceededError) as erro:
+        asyncio.run(rodar())
+    assert erro.value.status_code == 429
@@ -0,0 +1,133 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import prompts
+from cache import MemoriaLRU
+from executores import executores
+from prompts import ESPERA_APOS_FALHA, RegistroPrompts
+
+PREFIXO = "regra fixa do prompt. " * 1000  # ~5.5k tokens estimados: acima do mínimo do pro
+
+
+class _Caches:
+    def __init__(self):
+        self.criados = 0
+        self.renovados = 0
+        self.falhar = False
+
+    def create(self, *, model, config):
+        if self.falhar:
+            raise RuntimeError("400 cached content too small")
+        self.criados += 1
+        return SimpleNamespace(name=f"cachedContents/{self.criados}")
+
+    def update(self, *, name, config):
+        self.renovados += 1
+
+
+class _Models:
+    def __init__(self):
+        self.chamadas = []
+
+    def generate_content(self, *, model, contents, config=None):
+        self.chamadas.append((contents, config))
+        cache = (config or {}).get("cached_content")
+        uso = SimpleNamespace(prompt_token_count=6000, cached_content_token_count=5500 if cache else 0,
+                              candidates_token_count=10, thoughts_token_count=0, total_token_count=6010)
+        return SimpleNamespace(text="{}", usage_metadata=uso)
+
+
+class _ModelsAsync:
+    def __init__(self, models: _Models):
+        self._models = models
+
+    async def generate_content(self, **kwargs):
+        return self._models.generate_content(**kwargs)
+
+
+class _Client:
+    def __init__(self):
+        self.caches = _Caches()
+        self.models = _Models()
+        self.aio = SimpleNamespace(models=_ModelsAsync(self.models))
+
+
+@pytest.fixture
+def registro(monkeypatch):
+    cache = MemoriaLRU()
+    monkeypatch.setattr(prompts, "obter_cache", lambda: cache)
+    registro = RegistroPrompts(ttl=3600, margem_renovacao=300)
+    registro.registrar("teste", PREFIXO)
+    return registro
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    agora = [1_000_000.0]
+    monkeypatch.setattr(prompts.time, "time", lambda: agora[0])
+    return agora
+
+
+def test_cria_uma_vez_e_reaproveita_o_handle(registro, relogio):
+    client = _Client()
+    registro.gerar(client, modelo="gemini-2.5-pro", nome="teste", conteudo="sufixo 1")
+    registro.gerar(client, modelo="gemini-2.5-pro", nome="teste", conteudo="sufixo 2")
+
+    assert client.caches.criados == 1
+    assert [config["cached_content"] for _, config in client.models.chamadas] == ["cachedContents/1"] * 2
+    assert client.models.chamadas[0][0] == ["sufixo 1"]  # só o sufixo vai na chamada
+    metricas = registro.metricas()["teste"]
+    assert (metricas["chamadas"], metricas["com_cache"], metricas["tokens_economizados"]) == (2, 2, 11000)
+
+
+def test_renova_o_ttl_perto_de_expirar(registro, relogio):
+    client = _Client()
+    registro.gerar(client, modelo="gemini-2.5-pro", nome="teste", conteudo="a")
+    relogio[0] += 3600 - 299  # dentro da margem de renovação
+    registro.gerar(client, modelo="gemini-2.5-pro", nome="teste", conteudo="b")
+
+    assert (client.caches.criados, client.caches.renovados) == (1, 1)
+    relogio[0] += 3000  # o TTL renovado ainda vale
+    registro.gerar(client, modelo="gemini-2.5-pro", nome="teste", conteudo="c")
+    assert (client.caches.criados, client.caches.renovados) == (1, 1)
+
+
+def test_falha_na_criacao_espera_30_minutos(registro, relogio):
+    client = _Client()
+    client.caches.falhar = True
+    registro.gerar(client, modelo="gemini-2.5-pro", nome="teste", conteudo="a")
+    assert client.models.chamadas[-1] == ([PREFIXO, "a"], None)  # prompt completo
+
+    client.caches.falhar = False
+    relogio[0] += ESPERA_APOS_FALHA - 1
+    registro.gerar(client, modelo="gemini-2.5-pro", nome="teste", conteudo="b")
+    assert client.caches.criados == 0
+
+    relogio[0] += 2
+    registro.gerar(client, modelo="gemini-2.5-pro", nome="teste", conteudo="c")
+    assert client.caches.criados == 1
+    assert client.models.chamadas[-1][1] == {"cached_content": "cachedContents/1"}
+
+
+def test_prefixo_pequeno_nao_tenta_cache(registro):
+    client = _Client()
+    registro.registrar("curto", "regra curta")
+    registro.gerar(client, modelo="gemini-2.5-flash", nome="curto", conteudo="a")
+    assert client.caches.criados == 0
+    assert client.models.chamadas[-1][0] == ["regra curta", "a"]
+
+
+def test_gerar_async_busca_o_handle_no_executor(registro, relogio):
+    client = _Client()
+    interativo = executores["interativo"]
+    antes = interativo.concluidas
+
+    async def rodar():
+        return await registro.gerar_async(client, modelo="gemini-2.5-pro", nome="teste", conteudo="a")
+
+    asyncio.run(rodar())
+    assert client.caches.criados == 1
+    assert interativo.concluidas == antes + 1
+    assert client.models.chamadas[-1][1] == {"cached_content": "cachedContents/1"}
@@ -0,0 +1,106 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import roteador as roteador_mod
+from roteador import MIN_AMOSTRAS, MODELO_RAPIDO, Decisao, Roteador
+
+DECISAO = Decisao(endpoint="chat", modelo=MODELO_RAPIDO, motivo="teste")
+
+
+def _roteador_com_p90(latencia: float) -> Roteador:
+    roteador = Roteador()
+    for _ in range(MIN_AMOSTRAS):
+        roteador.observar("chat", MODELO_RAPIDO, latencia)
+    return roteador
+
+
+def _chamada_lenta_depois_rapida(tempos):
+    canceladas = []
+    ordem = iter(tempos)
+
+    async def chamada(modelo):
+        indice, espera = next(ordem)
+        try:
+            await asyncio.sleep(espera)
+        except asyncio.CancelledError:
+            canceladas.append(indice)
+            raise
+        return f"resposta {indice}"
+
+    return chamada, canceladas
+
+
+def test_hedge_devolve_o_primeiro_sucesso_e_cancela_a_perdedora():
+    roteador = _roteador_com_p90(0.05)
+    chamada, canceladas = _chamada_lenta_depois_rapida([(1, 5.0), (2, 0.01)])
+
+    async def rodar():
+        inicio = time.monotonic()
+        resultado = await roteador.executar_async(DECISAO, chamada, hedge=True)
+        await asyncio.sleep(0)  # deixa o cancelamento chegar na perdedora
+        return resultado, time.monotonic() - inicio
+
+    resultado, duracao = asyncio.run(rodar())
+
+    assert resultado == "resposta 2"
+    assert duracao < 1.0
+    assert canceladas == [1]
+    metricas = roteador.metricas_hedge()["chat"]
+    assert (metricas["hedges"], metricas["vitorias_do_hedge"]) == (1, 1)
+
+
+def test_hedge_cancela_a_segunda_quando_a_primeira_responde_antes():
+    roteador = _roteador_com_p90(0.05)
+    chamada, canceladas = _chamada_lenta_depois_rapida([(1, 0.15), (2, 5.0)])
+
+    async def rodar():
+        resultado = await roteador.executar_async(DECISAO, chamada, hedge=True)
+        await asyncio.sleep(0)
+        return resultado
+
+    assert asyncio.run(rodar()) == "resposta 1"
+    assert canceladas == [2]
+    assert roteador.metricas_hedge()["chat"]["vitorias_do_hedge"] == 0
+
+
+
+def test_hedge_sincrono_cancela_a_tentativa_que_ainda_esta_na_fila(monkeypatch):
+    roteador = _roteador_com_p90(0.05)
+    monkeypatch.setattr(roteador_mod, "_executor_hedge", ThreadPoolExecutor(max_workers=1))
+    liberar = threading.Event()
+    chamadas = []
+
+    def chamada(modelo, prazo):
+        chamadas.append(prazo)
+        liberar.wait(5)
+        return "tarde demais"
+
+    with pytest.raises(TimeoutError):
+        roteador._tentar("chat", MODELO_RAPIDO, chamada, 0.3, hedge=True)
+    liberar.set()
+    time.sleep(0.1)
+
+    # A segunda ficou na fila atrás da primeira e foi cancelada: não chama o modelo
+    assert len(chamadas) == 1
+
+
+def test_hedge_mede_igual_nos_caminhos_sincrono_e_assincrono():
+    sincrono, assincrono = _roteador_com_p90(0.05), _roteador_com_p90(0.05)
+    tempos = iter([0.5, 0.01])
+
+    def chamada(modelo, prazo):
+        time.sleep(next(tempos))
+        return "ok"
+
+    assert sincrono._tentar("chat", MODELO_RAPIDO, chamada, 2.0, hedge=True) == "ok"
+    chamada_async, _ = _chamada_lenta_depois_rapida([(1, 0.5), (2, 0.01)])
+    asyncio.run(assincrono.executar_async(DECISAO, chamada_async, hedge=True))
+
+    for roteador in (sincrono, assincrono):
+        metricas = roteador.metricas_hedge()["chat"]
+        assert metricas["vitorias_do_hedge"] == 1
+        assert metricas["p99_sem_hedge_s"] == pytest.approx(metricas["p99_s"], abs=0.005)
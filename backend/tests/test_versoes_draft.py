@@ -0,0 +1,118 @@
+import threading
+
+import pytest
+
+import versoes_draft
+from cache import SQLiteCache
+from json_patch import PatchInvalido, aplicar_patch, gerar_patch
+from versoes_draft import VersaoConflitante, aplicar_edicao, carregar_draft, desfazer, salvar_draft
+
+
+@pytest.fixture
+def workers(monkeypatch, tmp_path):
+    """Cada thread com a sua conexão ao mesmo arquivo, como workers do uvicorn."""
+    caminho = str(tmp_path / "cache.sqlite3")
+    local = threading.local()
+
+    def obter_cache():
+        if not hasattr(local, "cache"):
+            local.cache = SQLiteCache(caminho)
+        return local.cache
+
+    monkeypatch.setattr(versoes_draft, "obter_cache", obter_cache)
+    return obter_cache
+
+
+def test_edicoes_concorrentes_nao_se_perdem(workers):
+    salvar_draft("s1", {"campos": {}})
+    conflitos = []
+
+    def editar(i):
+        try:
+            aplicar_edicao("s1", [{"op": "add", "path": f"/campos/c{i}", "value": i}])
+        except VersaoConflitante:
+            conflitos.append(i)
+
+    threads = [threading.Thread(target=editar, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    final = carregar_draft("s1")
+    aplicadas = sorted(set(range(8)) - set(conflitos))
+    assert final.versao == 1 + len(aplicadas)
+    assert final.draft["campos"] == {f"c{i}": i for i in aplicadas}
+
+
+def test_corrida_perdida_refaz_sobre_a_versao_nova(workers, monkeypatch):
+    salvar_draft("s1", {"a": 1})
+    cache = workers()
+    original = cache.trocar_se
+    intrusa = []
+
+    def trocar_se(chave, esperado, valor, ttl=None):
+        if not intrusa:
+            # Outro worker grava entre a leitura e a escrita desta edição
+            intrusa.append(chave)
+            outra = versoes_draft.DraftVersionado(versao=2, hash="h", draft={"a": 1, "b": 2})
+            cache.set(chave, versoes_draft.json_bytes(outra.model_dump()))
+        return original(chave, esperado, valor, ttl)
+
+    monkeypatch.setattr(cache, "trocar_se", trocar_se)
+    estado, patch = aplicar_edicao("s1", [{"op": "add", "path": "/c", "value": 3}])
+    assert (estado.versao, estado.draft) == (3, {"a": 1, "b": 2, "c": 3})
+
+    # Com If-Match da versão lida antes, a corrida perdida vira conflito
+    with pytest.raises(VersaoConflitante):
+        aplicar_edicao("s1", [{"op": "add", "path": "/d", "value": 4}], if_match='"2"')
+
+
+def test_desfazer_volta_a_versao_anterior(workers):
+    salvar_draft("s1", {"a": 1})
+    aplicar_edicao("s1", [{"op": "replace", "path": "/a", "value": 2}])
+    estado, _ = desfazer("s1", if_match='"2"')
+    assert (estado.versao, estado.draft) == (3, {"a": 1})
+    with pytest.raises(KeyError):
+        desfazer("outra")
+
+
+# =========================
+# JSON PATCH: test
+# =========================
+
+@pytest.mark.parametrize("atual, esperado", [
+    (1, True), (True, 1), (0, False), (None, False), ({"a": 1}, {"a": True}), ([1], [True]), ("1", 1),
+])
+def test_op_test_distingue_tipos(atual, esperado):
+    with pytest.raises(PatchInvalido):
+        aplicar_patch({"v": atual}, [{"op": "test", "path": "/v", "value": esperado}])
+
+
+@pytest.mark.parametrize("atual, esperado", [
+    (1, 1.0), (True, True), (None, None), ({"a": [1, {"b": "x"}]}, {"a": [1.0, {"b": "x"}]}),
+])
+def test_op_test_aceita_valores_iguais(atual, esperado):
+    assert aplicar_patch({"v": atual}, [{"op": "test", "path": "/v", "value": esperado}]) == {"v": atual}
+
+
+def test_diff_nao_ignora_troca_de_numero_por_booleano():
+    assert gerar_patch({"a": {"pago": 1}}, {"a": {"pago": True}}) == [
+        {"op": "replace", "path": "/a/pago", "value": True}
+    ]
+
+
+def test_uploads_concorrentes_da_mesma_sessao_nao_se_perdem(workers, monkeypatch):
+    import sessao
+
+    monkeypatch.setattr(sessao, "obter_cache", workers)
+    threads = [
+        threading.Thread(target=sessao.adicionar_documento, args=("s1", f"doc{i}.pdf", {"i": i}))
+        for i in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sessao.carregar_documentos("s1") == {f"doc{i}.pdf": {"i": i} for i in range(8)}
@@ -0,0 +1,159 @@
+# versoes_draft.py
+#
+# Draft versionado por sessão: número de versão + hash do conteúdo, edições
+# como JSON Patch e um histórico limitado de patches reversos para desfazer.
+# O estado fica no cache compartilhado (cache.py) e cada mudança é gravada com
+# compare-and-set (trocar_se): se outro worker gravou antes, relê e refaz em
+# cima da versão nova. As funções fazem I/O bloqueante; no servidor, chame pelo
+# executor (executar_em).
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+from cache import obter_cache, hash_json
+from json_patch import aplicar_patch, gerar_patch
+from serializacao import json_bytes, ler_json
+
+HISTORICO_MAX = 20
+DRAFT_TTL = 24 * 3600
+# Corridas seguidas perdidas no compare-and-set antes de desistir com conflito
+TENTATIVAS_GRAVACAO = 5
+
+
+class VersaoConflitante(Exception):
+    """If-Match não confere com a versão atual do draft."""
+
+    def __init__(self, atual: "DraftVersionado"):
+        super().__init__(f"Draft está na versão {atual.versao}")
+        self.atual = atual
+
+
+class DraftVersionado(BaseModel):
+    versao: int
+    hash: str
+    draft: Dict[str, Any]
+    # Patches que levam de volta à versão anterior (o último é o mais recente)
+    desfazer: List[List[dict]] = Field(default_factory=list)
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.versao}"'
+
+
+def _chave(session_id: str) -> str:
+    return f"draft_versionado:{session_id}"
+
+
+def _ler(bruto: Optional[bytes]) -> Optional[DraftVersionado]:
+    return DraftVersionado.model_validate(ler_json(bruto)) if bruto else None
+
+
+def carregar_draft(session_id: str) -> Optional[DraftVersionado]:
+    return _ler(obter_cache().get(_chave(session_id)))
+
+
+Mudanca = Callable[[Optional[DraftVersionado]], Tuple[Optional[DraftVersionado], List[dict]]]
+
+
+def _atualizar(session_id: str, mudanca: Mudanca) -> Tuple[DraftVersionado, List[dict]]:
+    """
+    Lê o estado, calcula a mudança e grava só se ninguém gravou no meio.
+    `mudanca(atual)` devolve (novo estado ou None se nada muda, patch) e pode
+    levantar VersaoConflitante/PatchInvalido/KeyError; ela roda de novo a cada
+    corrida perdida, já sobre a versão que ganhou.
+    """
+    cache = obter_cache()
+    chave = _chave(session_id)
+    for _ in range(TENTATIVAS_GRAVACAO):
+        bruto = cache.get(chave)
+        atual = _ler(bruto)
+        novo, patch = mudanca(atual)
+        if novo is None:
+            return atual, patch
+        if cache.trocar_se(chave, bruto, json_bytes(novo.model_dump()), ttl=DRAFT_TTL):
+            return novo, patch
+        print(f"🔁 [DRAFT] Sessão {session_id}: outra edição gravou antes, refazendo sobre a versão nova")
+    atual = carregar_draft(session_id)
+    if atual is None:
+        raise KeyError(session_id)
+    raise VersaoConflitante(atual)
+
+
+def versao_confere(estado: Optional[DraftVersionado], if_match: Optional[str]) -> bool:
+    """Aceita If-Match com a versão ('"3"', '3', W/"3'), o hash ou '*'."""
+    if not if_match:
+        return True
+    if estado is None:
+        return False
+    for candidato in if_match.split(","):
+        candidato = candidato.strip().removeprefix("W/").strip('"')
+        if candidato in ("*", str(estado.versao), estado.hash):
+            return True
+    return False
+
+
+def _nova_versao(atual: Optional[DraftVersionado], novo: dict) -> Tuple[DraftVersionado, List[dict]]:
+    antes = atual.draft if atual else {}
+    patch = gerar_patch(antes, novo)
+    desfazer = list(atual.desfazer) if atual else []
+    if atual is not None:
+        desfazer.append(gerar_patch(novo, antes))
+    estado = DraftVersionado(
+        versao=(atual.versao + 1) if atual else 1,
+        hash=hash_json(novo),
+        draft=novo,
+        desfazer=desfazer[-HISTORICO_MAX:],
+    )
+    return estado, patch
+
+
+def salvar_draft(session_id: str, draft: dict) -> Tuple[DraftVersionado, List[dict]]:
+    """Grava o draft inteiro (ex: vindo do /api/draft) como nova versão, se mudou."""
+    def mudanca(atual):
+        if atual and atual.hash == hash_json(draft):
+            return None, []
+        return _nova_versao(atual, draft)
+
+    return _atualizar(session_id, mudanca)
+
+
+def _conferir(session_id: str, atual: Optional[DraftVersionado], if_match: Optional[str]) -> DraftVersionado:
+    if atual is None:
+        raise KeyError(session_id)
+    if not versao_confere(atual, if_match):
+        raise VersaoConflitante(atual)
+    return atual
+
+
+def aplicar_edicao(session_id: str, patch: List[dict], if_match: Optional[str] = None) -> Tuple[DraftVersionado, List[dict]]:
+    """
+    Aplica um JSON Patch ao draft atual. Levanta VersaoConflitante ou PatchInvalido.
+    Sem If-Match, uma corrida perdida reaplica o patch sobre a versão nova.
+    """
+    def mudanca(atual):
+        atual = _conferir(session_id, atual, if_match)
+        if not patch:
+            return None, []
+        return _nova_versao(atual, aplicar_patch(atual.draft, patch))
+
+    return _atualizar(session_id, mudanca)
+
+
+def desfazer(session_id: str, if_match: Optional[str] = None) -> Tuple[DraftVersionado, List[dict]]:
+    """Volta à versão anterior. O desfazer também gera uma versão nova (a numeração só cresce)."""
+    def mudanca(atual):
+        atual = _conferir(session_id, atual, if_match)
+        if not atual.desfazer:
+            return None, []
+        patch = atual.desfazer[-1]
+        novo = aplicar_patch(atual.draft, patch)
+        estado = DraftVersionado(
+            versao=atual.versao + 1,
+            hash=hash_json(novo),
+            draft=novo,
+            desfazer=atual.desfazer[:-1],
+        )
+        return estado, patch
+
+    return _atualizar(session_id, mudanca)
@@ -1,6 +1,6 @@
 "use client";
 
-import { useEffect, useState, DragEvent } from "react";
+import { useEffect, useRef, useState, DragEvent } from "react";
 import { useRouter } from "next/navigation";
 import toast from "react-hot-toast";
 import { ChevronDown, ChevronUp, Hourglass } from "lucide-react";
@@ -25,6 +25,15 @@ type PendingInstruction = {
   description: string;
 };
 
+type TurnResult = {
+  text: string;
+  instruction: PendingInstruction | null;
+};
+
+// Falha de transporte do canal de sessão (não abriu ou caiu no meio do turno):
+// o turno é refeito pelo HTTP. Erros devolvidos pelo servidor não caem aqui.
+class ChannelUnavailableError extends Error {}
+
 /* =========================
    UTILS
    ========================= */
@@ -103,9 +112,18 @@ export default function ChatPage() {
     process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
 
 
+  // Sessão no backend: os OCRs dela disparam a consolidação do draft em segundo plano
+  const [sessionId] = useState(() => crypto.randomUUID());
+
   // ✅ Armazena instruções de edição ANTES do draft ser criado
   const [pendingInstructions, setPendingInstructions] = useState<PendingInstruction[]>([]);
 
+  // Canal de sessão (WebSocket): chat + detecção de edição num turno só, com streaming
+  const socketRef = useRef<WebSocket | null>(null);
+  const sentDocumentsRef = useRef<Record<string, any> | null>(null);
+
+  useEffect(() => () => socketRef.current?.close(), []);
+
   /* =========================
      AUTH GUARD & TIMER
      ========================= */
@@ -173,6 +191,7 @@ export default function ChatPage() {
   const handleUpload = async (file: File) => {
     const formData = new FormData();
     formData.append("file", file);
+    formData.append("session_id", sessionId);
 
     try {
       const res = await fetch(`${API_BASE_URL}/api/ocr`, {
@@ -220,6 +239,134 @@ export default function ChatPage() {
     }
   };
 
+  /* =========================
+     SESSION CHANNEL
+     ========================= */
+  const openChannel = () =>
+    new Promise<WebSocket>((resolve, reject) => {
+      const current = socketRef.current;
+      if (current && current.readyState === WebSocket.OPEN) return resolve(current);
+
+      const ws = new WebSocket(`${API_BASE_URL.replace(/^http/, "ws")}/ws/session/${sessionId}`);
+      const timer = setTimeout(() => {
+        ws.close();
+        reject(new ChannelUnavailableError("Tempo esgotado ao abrir o canal"));
+      }, 5000);
+      ws.onopen = () => {
+        clearTimeout(timer);
+        socketRef.current = ws;
+        sentDocumentsRef.current = null;
+        resolve(ws);
+      };
+      ws.onerror = () => {
+        clearTimeout(timer);
+        reject(new ChannelUnavailableError("Falha ao abrir o canal"));
+      };
+      ws.onclose = () => {
+        if (socketRef.current === ws) socketRef.current = null;
+      };
+    });
+
+  const channelTurn = async (text: string, onPartial: (partial: string) => void) => {
+    const ws = await openChannel();
+
+    return new Promise<TurnResult>((resolve, reject) => {
+      if (ws.readyState !== WebSocket.OPEN) {
+        return reject(new ChannelUnavailableError("Canal encerrado antes do turno"));
+      }
+      let partial = "";
+
+      const cleanup = () => {
+        ws.removeEventListener("message", onMessage);
+        ws.removeEventListener("close", onClose);
+      };
+      const onClose = () => {
+        cleanup();
+        reject(new ChannelUnavailableError("Canal encerrado durante o turno"));
+      };
+      const onMessage = (event: MessageEvent) => {
+        const data = JSON.parse(event.data);
+        if (data.type === "chunk") {
+          partial += data.text;
+          onPartial(partial);
+        } else if (data.type === "response") {
+          cleanup();
+          resolve({ text: data.text ?? "", instruction: data.instruction ?? null });
+        } else if (data.type === "error") {
+          cleanup();
+          reject(new Error(data.detail || "Erro no chat"));
+        }
+      };
+
+      ws.addEventListener("message", onMessage);
+      ws.addEventListener("close", onClose);
+      // O servidor guarda os documentos da sessão; só reenvia quando mudaram
+      if (sentDocumentsRef.current !== documents) {
+        ws.send(JSON.stringify({ type: "documents", documents }));
+        sentDocumentsRef.current = documents;
+      }
+      ws.send(JSON.stringify({ type: "message", message: text }));
+    });
+  };
+
+  const httpTurn = async (text: string): Promise<TurnResult> => {
+    console.log("📤 Chamando /api/detect-edit com:", { message: text });
+
+    const editRes = await fetch(`${API_BASE_URL}/api/detect-edit`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({
+        message: text,
+        documents,
+        session_id: sessionId,
+      }),
+    });
+
+    if (!editRes.ok) {
+      const errorData = await editRes.json().catch(() => ({ detail: "Erro" }));
+      throw new Error(errorData.detail || "Erro");
+    }
+
+    const editData = await editRes.json();
+
+    console.log("📥 Resposta do detect-edit:", editData);
+
+    if (editData.is_edit_instruction && editData.instruction) {
+      return { text: "", instruction: editData.instruction };
+    }
+
+    // Chat normal
+    const chatRes = await fetch(`${API_BASE_URL}/api/chat`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({
+        history: messages.map((m) => ({
+          role: m.role,
+          content: m.content,
+        })),
+        documents,
+        message: text,
+        session_id: sessionId,
+      }),
+    });
+
+    if (!chatRes.ok) {
+      const errorData = await chatRes.json().catch(() => ({ detail: "Erro no chat" }));
+      throw new Error(errorData.detail || "Erro no chat");
+    }
+
+    const chatData = await chatRes.json();
+    return { text: unwrapResponseText(chatData), instruction: null };
+  };
+
+  const upsertBotMessage = (id: number, content: string) => {
+    setMessages((prev) =>
+      prev.some((m) => m.id === id)
+        ? prev.map((m) => (m.id === id ? { ...m, content } : m))
+        : [...prev, { id, role: "bot", content }]
+    );
+  };
+
   /* =========================
      SEND MESSAGE
      ========================= */
@@ -287,74 +434,33 @@ export default function ChatPage() {
     }
     // ✅ SE NÃO TEM DRAFT → Verifica se é instrução de edição
     else if (userText) {
+      const botId = Date.now() + 1;
       try {
-        console.log("📤 Chamando /api/detect-edit com:", { message: userText });
-
-        const editRes = await fetch(`${API_BASE_URL}/api/detect-edit`, {
-          method: "POST",
-          headers: { "Content-Type": "application/json" },
-          body: JSON.stringify({
-            message: userText,
-            documents,
-          }),
-        });
-
-        if (!editRes.ok) {
-          const errorData = await editRes.json().catch(() => ({ detail: "Erro" }));
-          throw new Error(errorData.detail || "Erro");
+        let result: TurnResult;
+        try {
+          result = await channelTurn(userText, (partial) => upsertBotMessage(botId, partial));
+        } catch (err) {
+          if (!(err instanceof ChannelUnavailableError)) throw err;
+          console.warn("⚠️ Canal de sessão indisponível, usando HTTP:", err.message);
+          setMessages((prev) => prev.filter((m) => m.id !== botId));
+          result = await httpTurn(userText);
         }
 
-        const editData = await editRes.json();
-
-        console.log("📥 Resposta do detect-edit:", editData);
-
-        if (editData.is_edit_instruction && editData.instruction) {
+        if (result.instruction) {
+          const instruction = result.instruction;
           // Armazena a instrução para aplicar depois
           setPendingInstructions((prev) => {
-            const updated = [...prev, editData.instruction];
+            const updated = [...prev, instruction];
             console.log("💾 Instruções pendentes:", updated);
             return updated;
           });
 
-          setMessages((prev) => [
-            ...prev,
-            {
-              id: Date.now() + 1,
-              role: "bot",
-              content: `✅ **Entendido!** Quando gerar o contrato, vou aplicar:\n\n**${editData.instruction.description}**\n\`${editData.instruction.path}\` = \`${JSON.stringify(editData.instruction.new_value)}\``,
-            },
-          ]);
+          upsertBotMessage(
+            botId,
+            `✅ **Entendido!** Quando gerar o contrato, vou aplicar:\n\n**${instruction.description}**\n\`${instruction.path}\` = \`${JSON.stringify(instruction.new_value)}\``
+          );
         } else {
-          // Chat normal
-          const chatRes = await fetch(`${API_BASE_URL}/api/chat`, {
-            method: "POST",
-            headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({
-              history: messages.map((m) => ({
-                role: m.role,
-                content: m.content,
-              })),
-              documents,
-              message: userText,
-            }),
-          });
-
-          if (!chatRes.ok) {
-            const errorData = await chatRes.json().catch(() => ({ detail: "Erro no chat" }));
-            throw new Error(errorData.detail || "Erro no chat");
-          }
-
-          const chatData = await chatRes.json();
-          const botText = unwrapResponseText(chatData);
-
-          setMessages((prev) => [
-            ...prev,
-            {
-              id: Date.now() + 1,
-              role: "bot",
-              content: botText,
-            },
-          ]);
+          upsertBotMessage(botId, result.text);
         }
       } catch (err: any) {
         console.error("Chat Error:", err);
@@ -363,7 +469,7 @@ export default function ChatPage() {
           : err.message;
 
         setMessages((prev) => [
-          ...prev,
+          ...prev.filter((m) => m.id !== botId),
           {
             id: Date.now() + 1,
             role: "bot",
@@ -395,6 +501,7 @@ export default function ChatPage() {
         body: JSON.stringify({
           documents,
           pending_instructions: pendingInstructions,
+          session_id: sessionId,
         }),
       });
 
@@ -439,6 +546,7 @@ export default function ChatPage() {
         template: templateKey,
         draft: contractDraft,
         extra_text: "",
+        session_id: sessionId,
       }),
     });
 